@@ -1,19 +1,34 @@
-from flask import Flask, request, jsonify, render_template, redirect, url_for
+from flask import (Flask, Response, request, jsonify, render_template, redirect, url_for, send_file,
+                   stream_with_context)
 import pandas as pd
+import io
 import json
 import os
-import requests
+import threading
+import time
+import uuid
 from werkzeug.utils import secure_filename
-from backend.models import CityAnalyzer, RecommendationEngine, CityData, SustainabilityMetrics
+from backend.models import (CityAnalyzer, RecommendationEngine, CityData, SustainabilityMetrics, city_fields,
+                            cities_to_frame)
 from backend.database import Database
-from backend.ml_predictor import MLPredictor
+from backend.invalidation import create_bus, CITY_CHANGED, MODEL_PROMOTED
+from backend.ml_predictor import MLPredictor, build_feature_matrix
+from backend.model_registry import ModelRegistry
+from backend.jobs import FINISHED, JobStore, JobRunner, ProcessJobRunner
+from backend.training import TrainingSetCache, incremental_update, train_and_register
 from backend.ai_recommendations import AIRecommendationEngine
-from utils.data_processor import DataProcessor
-from utils.api_integration import DataEnricher
+from utils.data_processor import CITY_FIELDS, UPLOAD_EXTENSIONS, DataProcessor
+from utils.api_integration import (DataEnricher, Deadline, EnrichmentBackfill, http_client,
+                                   geoapify_guard, openweather_guard)
+from utils.autocomplete import build_city_index
+from utils.cache import LRUCache
+from utils.gazetteer import normalize_name
+from utils.uploads import ingest_upload, remove_upload, run_upload_job
 
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = 'data/uploads'
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+# Uploads are streamed to disk and ingested in chunks, so size is not capped by default
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ['MAX_UPLOAD_MB']) * 1024 * 1024 if os.environ.get('MAX_UPLOAD_MB') else None
 
 # Add built-in functions to Jinja2 templates
 app.jinja_env.globals.update(min=min, max=max)
@@ -26,10 +41,48 @@ analyzer = CityAnalyzer()
 recommendation_engine = RecommendationEngine()
 ai_recommender = AIRecommendationEngine()
 data_processor = DataProcessor()
-data_enricher = DataEnricher()
 db = Database()
-ml_predictor = MLPredictor()
-ml_predictor.load_model()  # Load if exists
+data_enricher = DataEnricher(db=db)
+model_registry = ModelRegistry()
+job_store = JobStore()
+job_runner = JobRunner(job_store)
+training_cache = TrainingSetCache()
+ml_predictor = MLPredictor(registry=model_registry)  # artifact is loaded lazily on first use
+
+# Cross-worker invalidation: every gunicorn worker runs its own listener
+invalidation_bus = create_bus(db.get_connection)
+db.bus = invalidation_bus
+
+def reload_model(event):
+    """Swap in a newly promoted model off the listener thread; requests keep the old one meanwhile"""
+    threading.Thread(target=ml_predictor.refresh, name='model-reload', daemon=True).start()
+
+# Workers also poll the registry pointer (ML_RELOAD_INTERVAL), so a missed notification only delays the swap
+invalidation_bus.subscribe(MODEL_PROMOTED, reload_model, include_own=False)
+
+# Local autocomplete; the remote API is only asked about prefixes we cannot answer
+city_index = build_city_index(db)
+remote_suggestions = LRUCache(maxsize=4096, ttl=86400)
+
+def index_changed_cities(event):
+    """Keep the autocomplete index in step with cities added in any worker"""
+    if event.get('deleted'):
+        return
+    if event.get('all'):
+        names = None
+    else:
+        names = [name for name in event.get('names') or [] if not city_index.contains(name)]
+        if not names:
+            return
+    # One query for every city the index is missing; names already indexed are no-ops
+    city_index.add_frame(db.get_cities_frame(columns=['name', 'latitude', 'longitude'], names=names))
+
+invalidation_bus.subscribe(CITY_CHANGED, index_changed_cities)
+invalidation_bus.start()
+
+# Enrichment for saved cities happens here, never on the write path
+enrichment_backfill = EnrichmentBackfill(data_enricher, db)
+enrichment_backfill.start()
 
 @app.route('/')
 def index():
@@ -41,51 +94,134 @@ def index():
     }
     return render_template('index.html', data_status=data_status)
 
+# Each progress stream ends after this many seconds; EventSource reconnects on its own
+UPLOAD_EVENTS_SECONDS = int(os.getenv('UPLOAD_EVENTS_SECONDS', '60'))
+
+def finish_upload_job(job):
+    """Delete the job's upload and queue enrichment for the cities it stored without any"""
+    # The job deletes the file itself, except when it was given up on
+    remove_upload(job['params']['filepath'])
+    if job['params'].get('enrich'):
+        enrichment_backfill.sweep()
+
+upload_jobs = ProcessJobRunner(job_store)
+upload_jobs.register('upload', run_upload_job, on_finish=finish_upload_job)
+# Uploads interrupted by a crash or restart continue from their last finished chunk
+upload_jobs.resume()
+
 @app.route('/upload', methods=['GET', 'POST'])
 def upload_data():
+    """Load cities from an uploaded file.
+    
+    The file is a multipart 'file' field, or the raw request body with
+    ?filename=... . background=1 returns a job id at once and ingests in a
+    separate process; follow it at /api/upload_jobs/<job_id>(/events).
+    """
     if request.method == 'GET':
         return render_template('upload.html')
     
-    if 'file' not in request.files:
+    file = request.files.get('file')
+    if file is not None:
+        filename, stream = file.filename, file.stream
+    elif request.args.get('filename'):
+        filename, stream = request.args['filename'], request.stream
+    else:
         return jsonify({'error': 'No file uploaded'}), 400
-    
-    file = request.files['file']
-    if file.filename == '':
+    if filename == '':
         return jsonify({'error': 'No file selected'}), 400
+    if not filename.endswith(UPLOAD_EXTENSIONS):
+        return jsonify({'error': 'Invalid file format'}), 400
     
-    if file and file.filename.endswith(('.csv', '.xlsx', '.xls')):
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-        
-        try:
-            # Load and validate data
-            df = data_processor.load_from_file(filepath)
-            errors = data_processor.validate_data(df)
-            
-            if errors:
-                return jsonify({'error': 'Data validation failed', 'details': errors}), 400
-            
-            # Clean data
-            df_clean = data_processor.clean_data(df)
-            
-            # Convert to city objects and save to database
-            new_cities = data_processor.df_to_city_data(df_clean)
-            
-            for city in new_cities:
-                db.add_city(city.__dict__)
-            
-            return jsonify({
-                'message': f'File uploaded successfully. Added {len(new_cities)} cities.',
-                'cities_count': len(new_cities),
-                'total_cities': len(db.get_all_cities()),
-                'cities': [city.name for city in new_cities]
-            })
-            
-        except Exception as e:
-            return jsonify({'error': str(e)}), 500
+    filename = secure_filename(filename)
+    upload_id = uuid.uuid4().hex
+    partial_path = os.path.join(app.config['UPLOAD_FOLDER'], f'.{upload_id}.part')
+    try:
+        # Streamed to disk block by block and hashed in the same pass
+        file_hash = data_processor.save_upload(stream, partial_path)
+    except Exception as e:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        return jsonify({'error': f'Upload failed: {e}'}), 400
+    
+    enrich = request.values.get('enrich', '1') != '0'
+    # valid_only=1 loads the rows that pass validation instead of rejecting their chunk
+    valid_only = request.values.get('valid_only', '0') == '1'
+    
+    previous = db.get_upload_fingerprint(file_hash)
+    if previous:
+        os.remove(partial_path)
+        return jsonify({
+            'message': 'File is unchanged since its last upload; nothing to update.',
+            'unchanged': True,
+            'file_hash': file_hash,
+            'cities_count': 0,
+            'rows': previous['rows'],
+            'unchanged_rows': previous['rows'],
+            'total_cities': len(db.get_cities_frame(columns=['id'])),
+            'cities': []
+        })
+    
+    # One file per upload, deleted when it has been ingested; concurrent uploads never share one
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], f'{file_hash[:16]}-{upload_id[:8]}-{filename}')
+    os.replace(partial_path, filepath)
     
-    return jsonify({'error': 'Invalid file format'}), 400
+    if request.values.get('background', '0') == '1':
+        job = upload_jobs.submit('upload', filepath=filepath, filename=filename, file_hash=file_hash,
+                                 enrich=enrich, valid_only=valid_only)
+        return jsonify({
+            'job_id': job['id'],
+            'file_hash': file_hash,
+            'status_url': url_for('upload_job_status', job_id=job['id']),
+            'events_url': url_for('upload_job_events', job_id=job['id'])
+        }), 202
+    
+    try:
+        body, status = ingest_upload(db, data_processor, data_enricher, filepath, filename, file_hash,
+                                     enrich, valid_only, enqueue=enrichment_backfill.submit)
+    finally:
+        remove_upload(filepath)
+    return jsonify(body), status
+
+def public_job(job):
+    """Job record without its resume checkpoint"""
+    return {key: value for key, value in job.items() if key != 'checkpoint'}
+
+@app.route('/api/upload_jobs')
+def upload_job_list():
+    return jsonify([public_job(job) for job in job_store.list('upload')])
+
+@app.route('/api/upload_jobs/<job_id>')
+def upload_job_status(job_id):
+    """Upload job status: rows parsed and upserted, errors and, when finished, the upload result"""
+    job = job_store.get(job_id)
+    if not job or job['kind'] != 'upload':
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(public_job(job))
+
+@app.route('/api/upload_jobs/<job_id>/events')
+def upload_job_events(job_id):
+    """Server-sent events: a 'progress' event per job update, then 'done' with the final record"""
+    job = job_store.get(job_id)
+    if not job or job['kind'] != 'upload':
+        return jsonify({'error': 'Job not found'}), 404
+    
+    def events():
+        yield 'retry: 1000\n\n'
+        last_update, deadline = None, time.time() + UPLOAD_EVENTS_SECONDS
+        while time.time() < deadline:
+            job = job_store.get(job_id)
+            if job is None:
+                return
+            if job['status'] in FINISHED:
+                yield f"event: done\ndata: {json.dumps(public_job(job), default=str)}\n\n"
+                return
+            if job['updated_at'] != last_update:
+                last_update = job['updated_at']
+                yield f"event: progress\ndata: {json.dumps(public_job(job), default=str)}\n\n"
+            time.sleep(0.5)
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/manual_input', methods=['GET', 'POST'])
 def manual_input():
@@ -106,19 +242,13 @@ def manual_input():
         if 'population_density' not in data or not data['population_density']:
             data['population_density'] = data['population'] / data['area']
         
-        # Enrich with external API data
-        try:
-            enriched_data = data_enricher.enrich_city_data(data)
-        except Exception as e:
-            print(f"API enrichment failed: {e}")
-            enriched_data = data
-        
-        # Save to database
-        city_id = db.add_city(enriched_data)
+        # Save to database right away; coordinates/AQI are filled in by the backfill
+        city_id = db.add_city(data)
+        enrichment_backfill.submit(data)
         
         return jsonify({
-            'message': f'City "{enriched_data["name"]}" added successfully.',
-            'city_name': enriched_data['name'],
+            'message': f'City "{data["name"]}" added successfully.',
+            'city_name': data['name'],
             'total_cities': len(db.get_all_cities())
         })
         
@@ -132,21 +262,19 @@ def analyze():
     if not cities_data:
         return redirect(url_for('index'))
     
+    # Remove database-specific fields
+    city_rows = [
+        (city_dict, city_fields(city_dict))
+        for city_dict in cities_data
+    ]
+    
+    # Fetch missing coordinates/AQI for all cities at once, then write back in one UPDATE
+    enriched = data_enricher.enrich_many([city_data for _, city_data in city_rows])
+    if enriched:
+        db.update_city_enrichment_bulk(enriched)
+    
     results = []
-    for city_dict in cities_data:
-        # Remove database-specific fields
-        city_data = {k: v for k, v in city_dict.items() if k not in ['id', 'created_at', 'updated_at']}
-        
-        # Fetch coordinates if missing
-        if not city_data.get('latitude') or not city_data.get('longitude'):
-            try:
-                enriched = data_enricher.enrich_city_data(city_data)
-                city_data['latitude'] = enriched.get('latitude')
-                city_data['longitude'] = enriched.get('longitude')
-                db.update_city_coordinates(city_data['name'], city_data['latitude'], city_data['longitude'])
-            except:
-                pass
-        
+    for city_dict, city_data in city_rows:
         city = CityData(**city_data)
         metrics = analyzer.analyze_city(city)
         recommendations = recommendation_engine.generate_recommendations(city, metrics)
@@ -180,7 +308,7 @@ def dashboard():
     
     results = []
     for city_dict in cities_data:
-        city_data = {k: v for k, v in city_dict.items() if k not in ['id', 'created_at', 'updated_at']}
+        city_data = city_fields(city_dict)
         city = CityData(**city_data)
         analysis = db.get_latest_analysis(city_dict['id'])
         
@@ -230,7 +358,7 @@ def simulate():
             return redirect(url_for('index'))
         results = []
         for city_dict in cities_data:
-            city_data = {k: v for k, v in city_dict.items() if k not in ['id', 'created_at', 'updated_at']}
+            city_data = city_fields(city_dict)
             city = CityData(**city_data)
             analysis = db.get_latest_analysis(city_dict['id'])
             if analysis:
@@ -250,7 +378,7 @@ def simulate():
         if not city_data:
             return jsonify({'error': 'City not found'}), 404
         
-        city_dict = {k: v for k, v in city_data.items() if k not in ['id', 'created_at', 'updated_at']}
+        city_dict = city_fields(city_data)
         original_city = CityData(**city_dict)
         original_metrics = analyzer.analyze_city(original_city)
         modified_city = CityData(**city_dict)
@@ -286,14 +414,23 @@ def simulate():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Binary export formats: content type and file extension
+COLUMNAR_EXPORTS = {
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.file', 'arrow')
+}
+
 @app.route('/export/<format>')
 def export_data(format):
+    if format in COLUMNAR_EXPORTS:
+        return export_columnar(format)
+    
     cities_data = db.get_all_cities()
     if not cities_data:
         return jsonify({'error': 'No data to export'}), 404
     results = []
     for city_dict in cities_data:
-        city_data = {k: v for k, v in city_dict.items() if k not in ['id', 'created_at', 'updated_at']}
+        city_data = city_fields(city_dict)
         city = CityData(**city_data)
         analysis = db.get_latest_analysis(city_dict['id'])
         if analysis:
@@ -336,6 +473,31 @@ def export_data(format):
     
     return jsonify({'error': 'Invalid format'}), 400
 
+def export_columnar(format):
+    """Cities with rule-based and ML scores as Parquet / Arrow IPC, computed column-wise.
+    
+    ?columns=name,aqi,sustainability_score limits the export to those columns.
+    """
+    frame = db.get_cities_frame(columns=CITY_FIELDS)
+    if frame.empty:
+        return jsonify({'error': 'No data to export'}), 404
+    
+    frame = cities_to_frame(frame)
+    frame['sustainability_score'] = analyzer.score_frame(frame)
+    ml_scores = ml_predictor.predict_many(frame)
+    frame['ml_score'] = ml_scores if ml_scores is not None else float('nan')
+    
+    requested = [col.strip() for col in request.args.get('columns', '').split(',') if col.strip()]
+    if requested:
+        unknown = [col for col in requested if col not in frame.columns]
+        if unknown:
+            return jsonify({'error': f"Unknown columns: {', '.join(unknown)}"}), 400
+        frame = frame[requested]
+    
+    mimetype, extension = COLUMNAR_EXPORTS[format]
+    return send_file(io.BytesIO(data_processor.to_columnar(frame, format)), mimetype=mimetype,
+                     as_attachment=True, download_name=f'ecoplan_cities.{extension}')
+
 @app.route('/sample_data')
 def get_sample_data():
     sample_df = data_processor.create_sample_data()
@@ -357,9 +519,7 @@ def get_sample_data():
 
 @app.route('/clear_data', methods=['POST'])
 def clear_data():
-    cities = db.get_all_cities()
-    for city in cities:
-        db.delete_city(city['name'])
+    db.clear_all_cities()
     return jsonify({'message': 'All data cleared successfully'})
 
 @app.route('/data_sources')
@@ -373,66 +533,36 @@ def get_city_suggestions(query):
     if len(query) < 2:
         return jsonify({'suggestions': []})
     
-    try:
-        api_key = data_enricher.geo_api.api_key
-        if not api_key:
-            return jsonify({'suggestions': []})
-        
-        url = "https://api.geoapify.com/v1/geocode/autocomplete"
-        params = {
-            'text': query,
-            'apiKey': api_key,
-            'limit': 5,
-            'type': 'city',
-            'filter': 'countrycode:in',
-            'format': 'json'
-        }
-        
-        response = requests.get(url, params=params, timeout=5)
-        if response.status_code == 200:
-            data = response.json()
-            suggestions = []
-            
-            if data.get('results'):
-                for result in data['results']:
-                    city_name = result.get('city') or result.get('name', '')
-                    state = result.get('state', '')
-                    country = result.get('country', '')
-                    
-                    if city_name:
-                        display_name = city_name
-                        if state:
-                            display_name += f", {state}"
-                        # Only show India cities
-                        if country == 'India':
-                            suggestions.append({
-                                'city': city_name,
-                                'display': display_name,
-                                'lat': result.get('lat'),
-                                'lon': result.get('lon')
-                            })
-            
-            return jsonify({'suggestions': suggestions})
-        else:
-            return jsonify({'suggestions': []})
-            
-    except Exception as e:
-        print(f"City suggestions error: {e}")
-        return jsonify({'suggestions': []})
+    suggestions = city_index.search(query)
+    if suggestions:
+        return jsonify({'suggestions': suggestions})
+    
+    key = normalize_name(query)
+    suggestions = remote_suggestions.get(key)
+    if suggestions is None:
+        suggestions = data_enricher.geo_api.autocomplete(query)
+        # Empty answers may be a provider hiccup; retry those sooner. Remote places stay in this
+        # bounded cache only: adding them to city_index would grow it with every prefix typed
+        remote_suggestions.set(key, suggestions, ttl=None if suggestions else 600)
+    return jsonify({'suggestions': suggestions})
 
 @app.route('/api/fetch_city_data/<city_name>')
 def fetch_city_data(city_name):
-    """Fetch coordinates and weather data for a city"""
+    """Fetch coordinates and weather data for a city (?state=... narrows the gazetteer lookup)"""
     try:
-        # Get coordinates
-        coords = data_enricher.geo_api.geocode_city(city_name)
+        # Both lookups share one time budget
+        deadline = Deadline(DataEnricher.ENRICH_BUDGET)
+        
+        # Local gazetteer first; the geocoding API only for names it does not know
+        coords = (data_enricher.offline_geocoder.geocode(city_name, request.args.get('state'))
+                  or data_enricher.geo_api.geocode_city(city_name, deadline=deadline))
         if not coords:
             return jsonify({'error': f'Could not find coordinates for {city_name}'}), 404
         
         lat, lon = coords
         
         # Get weather/pollution data
-        pollution_data = data_enricher.weather_api.get_air_pollution(lat, lon)
+        pollution_data = data_enricher.weather_api.get_air_pollution(lat, lon, deadline=deadline)
         
         result = {
             'city_name': city_name,
@@ -456,6 +586,21 @@ def fetch_city_data(city_name):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/metrics')
+def metrics():
+    """Runtime metrics for external calls"""
+    return jsonify({
+        'http': http_client.metrics(),
+        'providers': {'geoapify': geoapify_guard.stats(), 'openweather': openweather_guard.stats()},
+        'enrichment_backfill': enrichment_backfill.stats(),
+        'caches': {
+            'geocode': data_enricher.geocode_cache.memory.stats(),
+            'air_pollution': data_enricher.pollution_cache.memory.stats(),
+            'ml_predictions': ml_predictor.prediction_cache.stats() if ml_predictor.prediction_cache else None
+        },
+        'autocomplete': {'indexed_places': len(city_index), 'remote_cache': remote_suggestions.stats()}
+    })
+
 @app.route('/api/ml_predict', methods=['POST'])
 def ml_predict():
     """Predict sustainability using ML model"""
@@ -475,47 +620,176 @@ def ml_predict():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/ml_predict_batch', methods=['POST'])
+def ml_predict_batch():
+    """Predict sustainability for many cities (JSON array or uploaded CSV/Excel/Parquet/Arrow file)"""
+    try:
+        if 'file' in request.files:
+            file = request.files['file']
+            if not file.filename.endswith(UPLOAD_EXTENSIONS):
+                return jsonify({'error': 'Invalid file format'}), 400
+            # Per-request name, so concurrent uploads of same-named files never read each other's data
+            filepath = os.path.join(app.config['UPLOAD_FOLDER'],
+                                    f'.{uuid.uuid4().hex}-{secure_filename(file.filename)}')
+            try:
+                file.save(filepath)
+                # Scoring needs only the CityData columns; columnar files skip the rest
+                df = data_processor.load_from_file(filepath, columns=CITY_FIELDS)
+            finally:
+                remove_upload(filepath)
+        else:
+            data = request.json
+            records = data.get('cities') if isinstance(data, dict) else data
+            if not isinstance(records, list):
+                return jsonify({'error': 'Expected a JSON array of cities or a file upload'}), 400
+            df = pd.DataFrame(records)
+        
+        frame = cities_to_frame(df)
+        rule_scores = analyzer.score_frame(frame)
+        ml_scores = ml_predictor.predict_many(frame)
+        
+        predictions = []
+        for i, name in enumerate(frame['name'].astype(str)):
+            ml_score = float(ml_scores[i]) if ml_scores is not None else None
+            predictions.append({
+                'name': name,
+                'ml_prediction': ml_score,
+                'rule_based_score': float(rule_scores[i]),
+                'difference': ml_score - float(rule_scores[i]) if ml_score is not None else None
+            })
+        
+        return jsonify({
+            'count': len(predictions),
+            'model_trained': ml_predictor.is_trained,
+            'predictions': predictions
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/ml_feature_importance')
 def ml_feature_importance():
     """Get ML model feature importance"""
     importance = ml_predictor.get_feature_importance()
     if importance:
+        permutation = ml_predictor.get_permutation_importance()
         return jsonify({
             'features': [{'name': f, 'importance': float(i)} for f, i in importance],
+            # MAE increase when the feature is shuffled, computed at training time
+            'permutation': [{'name': f, 'importance': mean, 'std': std} for f, mean, std in permutation]
+                           if permutation else None,
             'model_trained': True
         })
     return jsonify({'error': 'Model not trained', 'model_trained': False}), 404
 
+@app.route('/api/ml_explain/<city_name>')
+def ml_explain(city_name):
+    """Per-feature breakdown of a city's ML score"""
+    city = db.get_city(city_name)
+    if not city:
+        return jsonify({'error': 'City not found'}), 404
+    
+    explanation = ml_predictor.explain(city)
+    if explanation is None:
+        return jsonify({'error': 'Model not trained', 'model_trained': False}), 404
+    return jsonify(explanation)
+
+def latest_update(frame):
+    """Newest updated_at in a cities frame, as the next incremental sync point"""
+    if frame.empty or 'updated_at' not in frame:
+        return None
+    return str(frame['updated_at'].max())
+
+def train_incrementally(report):
+    """Fold cities changed since the last sync into the served model"""
+    cached = training_cache.load()
+    if cached is None:
+        return {'mode': 'full_required', 'reason': 'no cached training set'}
+    
+    delta = db.get_cities_frame(since=cached.get('synced_at'))
+    live_names = db.get_cities_frame(columns=['name'])['name']
+    return incremental_update(ml_predictor, training_cache, delta['name'], build_feature_matrix(delta),
+                              analyzer.score_frame(delta), live_names=live_names,
+                              synced_at=latest_update(delta), report=report)
+
+def run_training(report, mode='full'):
+    """Background job: rule-based scores are the target; registers the winner if it beats the current model"""
+    if mode == 'incremental':
+        result = train_incrementally(report)
+        if result['mode'] != 'full_required':
+            if result.get('registered'):
+                db.publish(MODEL_PROMOTED, version=result['version'])
+            return result
+        report(0.0, f"Full refit: {result['reason']}")
+    
+    report(0.0, 'Loading cities')
+    cities_frame = db.get_cities_frame()
+    X = build_feature_matrix(cities_frame)
+    y = analyzer.score_frame(cities_frame)
+    result = train_and_register(ml_predictor, X, y, report, names=cities_frame['name'])
+    if result['registered']:
+        db.publish(MODEL_PROMOTED, version=result['version'])
+        # The arrays now match the served model and reset the drift baseline
+        training_cache.save_full(cities_frame['name'], X, y, ml_predictor.version, latest_update(cities_frame))
+    result['mode'] = 'full'
+    return result
+
 @app.route('/api/train_ml', methods=['POST'])
 def train_ml():
-    """Train ML model on current database"""
+    """Start a training job; poll /api/train_ml/<job_id> for progress and results.
+    
+    mode=incremental refreshes the served model with changed cities in
+    seconds and falls back to a full search when the drift policy says so.
+    """
+    payload = request.get_json(silent=True) or {}
+    mode = payload.get('mode') or request.args.get('mode') or request.form.get('mode') or 'full'
+    if mode not in ('full', 'incremental'):
+        return jsonify({'error': "mode must be 'full' or 'incremental'"}), 400
+    
+    job = job_runner.submit('train_ml', run_training, mode=mode)
+    return jsonify({
+        'job_id': job['id'],
+        'mode': mode,
+        'status': job['status'],
+        'status_url': url_for('train_ml_status', job_id=job['id'])
+    }), 202
+
+@app.route('/api/train_ml/<job_id>')
+def train_ml_status(job_id):
+    """Training job status, progress and, when finished, holdout metrics"""
+    job = job_store.get(job_id)
+    if not job or job['kind'] != 'train_ml':
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+@app.route('/api/models')
+def list_models():
+    """Registered model versions with their metadata"""
+    return jsonify({
+        'current': model_registry.current(),
+        'serving': ml_predictor.version,
+        'versions': model_registry.versions()
+    })
+
+@app.route('/api/models/<version>/promote', methods=['POST'])
+def promote_model(version):
+    """Make a registered version current in every worker"""
     try:
-        cities_data = db.get_all_cities()
-        if len(cities_data) < 5:
-            return jsonify({'error': 'Need at least 5 cities to train'}), 400
-        
-        cities = []
-        scores = []
-        
-        for city_dict in cities_data:
-            city_data = {k: v for k, v in city_dict.items() if k not in ['id', 'created_at', 'updated_at']}
-            city = CityData(**city_data)
-            metrics = analyzer.analyze_city(city)
-            
-            cities.append(city)
-            scores.append(metrics.sustainability_score)
-        
-        ml_predictor.train(cities, scores)
-        ml_predictor.save_model()
-        
-        return jsonify({
-            'message': 'ML model trained successfully',
-            'cities_count': len(cities),
-            'feature_importance': [{'name': f, 'importance': float(i)} 
-                                  for f, i in ml_predictor.get_feature_importance()]
-        })
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        previous = model_registry.promote(version)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 404
+    ml_predictor.refresh()
+    db.publish(MODEL_PROMOTED, version=version)
+    return jsonify({'current': version, 'previous': previous})
+
+@app.route('/api/models/rollback', methods=['POST'])
+def rollback_model():
+    """Go back to the previously promoted version"""
+    version = model_registry.rollback()
+    if not version:
+        return jsonify({'error': 'No earlier version to roll back to'}), 400
+    ml_predictor.refresh()
+    db.publish(MODEL_PROMOTED, version=version)
+    return jsonify({'current': version})
 
 @app.route('/api/ai_plan/<city_name>')
 def get_ai_plan(city_name):
@@ -525,7 +799,7 @@ def get_ai_plan(city_name):
         if not city_data:
             return jsonify({'error': 'City not found'}), 404
         
-        city_dict = {k: v for k, v in city_data.items() if k not in ['id', 'created_at', 'updated_at']}
+        city_dict = city_fields(city_data)
         city = CityData(**city_dict)
         metrics = analyzer.analyze_city(city)
         
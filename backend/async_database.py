@@ -0,0 +1,305 @@
+import asyncio
+import json
+import os
+from typing import Dict, List, Optional
+
+import asyncpg
+
+from backend.database import CITY_COLUMNS, city_row, analysis_from_row, upsert_assignments
+
+# asyncpg encodes by declared type and rejects e.g. 1200000.0 for an INTEGER
+CITY_COLUMN_TYPES = {
+    'name': 'text', 'traffic_density': 'text', 'population': 'int',
+    'existing_parks': 'int', 'vehicle_count': 'int'
+}
+
+def _typed_city_row(city_data: Dict) -> tuple:
+    """city_row with values coerced to the column types asyncpg expects"""
+    row = []
+    for col, value in zip(CITY_COLUMNS, city_row(city_data)):
+        kind = CITY_COLUMN_TYPES.get(col, 'float8')
+        if value is None or kind == 'text':
+            row.append(value if value is None else str(value))
+        elif kind == 'int':
+            row.append(int(value))
+        else:
+            row.append(float(value))
+    return tuple(row)
+
+class AsyncDatabase:
+    """asyncpg counterpart of Database for use inside an event loop.
+
+    Schema creation stays with the synchronous Database; this class only
+    reads and writes the existing tables through its own connection pool.
+    """
+
+    def __init__(self, min_size: int = 1, max_size: int = 10):
+        self.database_url = os.getenv('DATABASE_URL')
+        if not self.database_url:
+            self.host = os.getenv('PGHOST', 'localhost')
+            self.database = os.getenv('PGDATABASE', 'ecoplan')
+            self.user = os.getenv('PGUSER', 'postgres')
+            self.password = os.getenv('PGPASSWORD', 'postgres')
+            self.port = int(os.getenv('PGPORT', '5432'))
+        self.min_size = min_size
+        self.max_size = max_size
+        self.pool: Optional[asyncpg.Pool] = None
+        # Concurrent first callers wait for one pool instead of each creating (and leaking) their own
+        self._connect_lock = asyncio.Lock()
+
+    async def connect(self):
+        """Create the connection pool (idempotent, safe to call concurrently)"""
+        if self.pool is not None:
+            return self.pool
+        async with self._connect_lock:
+            if self.pool is not None:
+                return self.pool
+            try:
+                if self.database_url:
+                    self.pool = await asyncpg.create_pool(
+                        self.database_url, min_size=self.min_size, max_size=self.max_size
+                    )
+                else:
+                    self.pool = await asyncpg.create_pool(
+                        host=self.host,
+                        database=self.database,
+                        user=self.user,
+                        password=self.password,
+                        port=self.port,
+                        min_size=self.min_size,
+                        max_size=self.max_size
+                    )
+            except Exception as e:
+                print(f"[X] Async database connection error: {e}")
+                self.pool = None
+            return self.pool
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def gather(self, *queries):
+        """Run independent queries concurrently, each on its own pooled connection"""
+        return await asyncio.gather(*queries)
+
+    async def add_city(self, city_data: Dict) -> int:
+        if not await self.connect():
+            return 0
+
+        update_cols = [col for col in CITY_COLUMNS if col != 'name']
+        placeholders = ', '.join(f'${i}' for i in range(1, len(CITY_COLUMNS) + 1))
+        try:
+            return await self.pool.fetchval(f'''
+                INSERT INTO cities ({', '.join(CITY_COLUMNS)})
+                VALUES ({placeholders})
+                ON CONFLICT (name) DO UPDATE SET
+                {', '.join(f'{col}=EXCLUDED.{col}' for col in update_cols)},
+                row_hash=NULL
+                RETURNING id
+            ''', *_typed_city_row(city_data))
+        except Exception as e:
+            print(f"Error adding city: {e}")
+            return 0
+
+    async def add_cities_bulk(self, cities: List[Dict]) -> int:
+        """Upsert many cities in a single statement"""
+        if not cities or not await self.connect():
+            return 0
+
+        unnest_args = ', '.join(
+            f'${i}::{CITY_COLUMN_TYPES.get(col, "float8")}[]'
+            for i, col in enumerate(CITY_COLUMNS, start=1)
+        )
+        try:
+            # Inside the try: a value that does not fit its column type fails the call like a DB error
+            rows = list({city.get('name'): _typed_city_row(city) for city in cities}.values())
+            # Columnar parameters + unnest: one round trip regardless of row count
+            columns = [list(values) for values in zip(*rows)]
+            await self.pool.execute(f'''
+                INSERT INTO cities ({', '.join(CITY_COLUMNS)})
+                SELECT * FROM unnest({unnest_args})
+                ON CONFLICT (name) DO UPDATE SET
+                {upsert_assignments(CITY_COLUMNS)},
+                row_hash=NULL, updated_at=CURRENT_TIMESTAMP
+            ''', *columns)
+            return len(rows)
+        except Exception as e:
+            print(f"Error bulk adding cities: {e}")
+            return 0
+
+    async def get_city(self, city_name: str) -> Optional[Dict]:
+        if not await self.connect():
+            return None
+        row = await self.pool.fetchrow('SELECT * FROM cities WHERE name = $1', city_name)
+        return dict(row) if row else None
+
+    async def get_all_cities(self) -> List[Dict]:
+        if not await self.connect():
+            return []
+        rows = await self.pool.fetch('SELECT * FROM cities ORDER BY created_at DESC')
+        return [dict(row) for row in rows]
+
+    async def delete_city(self, city_name: str):
+        if not await self.connect():
+            return
+        await self.pool.execute('DELETE FROM cities WHERE name = $1', city_name)
+
+    async def update_city_coordinates(self, city_name: str, latitude: float, longitude: float):
+        if not await self.connect():
+            return
+        await self.pool.execute(
+            'UPDATE cities SET latitude = $1, longitude = $2 WHERE name = $3',
+            latitude, longitude, city_name
+        )
+
+    async def save_analysis(self, city_id: int, analysis_data: Dict):
+        if not await self.connect():
+            return
+        try:
+            await self.pool.execute('''
+                INSERT INTO analysis_results
+                (city_id, sustainability_score, category, badge_level,
+                 green_space_per_capita, who_compliance, required_green_space,
+                 recommended_parks, recommended_trees, co2_reduction_potential,
+                 score_components, sustainability_debt)
+                VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12)
+            ''',
+                city_id,
+                analysis_data.get('sustainability_score'),
+                analysis_data.get('category'),
+                analysis_data.get('badge_level'),
+                analysis_data.get('green_space_per_capita'),
+                analysis_data.get('who_standard_compliance'),
+                analysis_data.get('required_green_space'),
+                analysis_data.get('recommended_parks'),
+                analysis_data.get('recommended_trees'),
+                analysis_data.get('co2_reduction_potential'),
+                json.dumps(analysis_data.get('score_explanation', {})),
+                json.dumps(analysis_data.get('sustainability_debt', {}))
+            )
+        except Exception as e:
+            print(f"Error saving analysis: {e}")
+
+    async def get_latest_analysis(self, city_id: int) -> Optional[Dict]:
+        if not await self.connect():
+            return None
+        row = await self.pool.fetchrow('''
+            SELECT * FROM analysis_results
+            WHERE city_id = $1
+            ORDER BY analyzed_at DESC
+            LIMIT 1
+        ''', city_id)
+        return analysis_from_row(dict(row)) if row else None
+
+    async def get_latest_analyses(self, city_ids: List[int]) -> Dict[int, Dict]:
+        """Latest analysis for each of the given cities, keyed by city id"""
+        if not city_ids or not await self.connect():
+            return {}
+        rows = await self.pool.fetch('''
+            SELECT DISTINCT ON (city_id) * FROM analysis_results
+            WHERE city_id = ANY($1::int[])
+            ORDER BY city_id, analyzed_at DESC
+        ''', list(city_ids))
+        return {row['city_id']: analysis_from_row(dict(row)) for row in rows}
+
+    async def save_simulation(self, city_id: int, sim_type: str, parameters: Dict, results: Dict):
+        if not await self.connect():
+            return
+        try:
+            await self.pool.execute('''
+                INSERT INTO simulations (city_id, simulation_type, parameters, results)
+                VALUES ($1, $2, $3, $4)
+            ''', city_id, sim_type, json.dumps(parameters), json.dumps(results))
+        except Exception as e:
+            print(f"Error saving simulation: {e}")
+
+    async def get_city_simulations(self, city_id: int) -> List[Dict]:
+        if not await self.connect():
+            return []
+        rows = await self.pool.fetch('''
+            SELECT * FROM simulations
+            WHERE city_id = $1
+            ORDER BY created_at DESC
+        ''', city_id)
+
+        result = []
+        for row in rows:
+            row = dict(row)
+            row['parameters'] = json.loads(row['parameters']) if row['parameters'] else {}
+            row['results'] = json.loads(row['results']) if row['results'] else {}
+            result.append(row)
+        return result
+
+    async def save_recommendations(self, city_id: int, recommendations: List):
+        if not await self.connect():
+            return
+
+        rows = []
+        for rec in recommendations:
+            if isinstance(rec, dict):
+                rows.append((
+                    city_id,
+                    rec.get('category', ''),
+                    rec.get('priority', ''),
+                    rec.get('title', ''),
+                    rec.get('description', ''),
+                    rec.get('impact_score', 0)
+                ))
+            else:
+                rows.append((city_id, 'General', 'Medium', 'Recommendation', str(rec), 5.0))
+
+        try:
+            async with self.pool.acquire() as conn:
+                async with conn.transaction():
+                    await conn.execute('DELETE FROM recommendations WHERE city_id = $1', city_id)
+                    await conn.executemany('''
+                        INSERT INTO recommendations
+                        (city_id, category, priority, title, description, impact_score)
+                        VALUES ($1, $2, $3, $4, $5, $6)
+                    ''', rows)
+        except Exception as e:
+            print(f"Error saving recommendations: {e}")
+
+    async def get_city_recommendations(self, city_id: int) -> List[Dict]:
+        if not await self.connect():
+            return []
+        rows = await self.pool.fetch('''
+            SELECT * FROM recommendations
+            WHERE city_id = $1
+            ORDER BY impact_score DESC
+        ''', city_id)
+        return [dict(row) for row in rows]
+
+    async def get_recommendations_for_cities(self, city_ids: List[int]) -> Dict[int, List[Dict]]:
+        """Recommendations for each of the given cities, keyed by city id"""
+        if not city_ids or not await self.connect():
+            return {}
+        rows = await self.pool.fetch('''
+            SELECT * FROM recommendations
+            WHERE city_id = ANY($1::int[])
+            ORDER BY city_id, impact_score DESC
+        ''', list(city_ids))
+
+        result = {city_id: [] for city_id in city_ids}
+        for row in rows:
+            result.setdefault(row['city_id'], []).append(dict(row))
+        return result
+
+    async def get_city_bundle(self, city_name: str) -> Optional[Dict]:
+        """City row plus its latest analysis and recommendations, fetched concurrently"""
+        city = await self.get_city(city_name)
+        if not city:
+            return None
+        analysis, recommendations = await self.gather(
+            self.get_latest_analysis(city['id']),
+            self.get_city_recommendations(city['id'])
+        )
+        return {'city': city, 'analysis': analysis, 'recommendations': recommendations}
@@ -1,12 +1,68 @@
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
 from datetime import datetime
 from typing import Dict, List, Optional
 import json
 import os
+import pandas as pd
+from backend.invalidation import CITY_CHANGED, DATA_CLEARED
+
+# Column order shared by the sync and async city upserts
+CITY_COLUMNS = [
+    'name', 'area', 'population', 'population_density', 'built_up_percentage',
+    'green_space_area', 'open_land_area', 'green_coverage_percentage',
+    'existing_parks', 'tree_coverage', 'aqi', 'pm25', 'pm10', 'co2_estimation',
+    'traffic_density', 'vehicle_count', 'public_transport_usage',
+    'latitude', 'longitude'
+]
+
+# Columns that fall back to 0 when missing from the input dict
+CITY_ZERO_DEFAULTS = {
+    'open_land_area', 'existing_parks', 'tree_coverage', 'aqi', 'pm25', 'pm10',
+    'co2_estimation', 'vehicle_count', 'public_transport_usage'
+}
+
+# Filled in by enrichment after an upload; an uploaded row's empty coordinates
+# or default 0 readings must not overwrite them
+KEEP_ENRICHED = {
+    'latitude': 'COALESCE(EXCLUDED.latitude, cities.latitude)',
+    'longitude': 'COALESCE(EXCLUDED.longitude, cities.longitude)',
+    'aqi': 'COALESCE(NULLIF(EXCLUDED.aqi, 0), cities.aqi)',
+    'pm25': 'COALESCE(NULLIF(EXCLUDED.pm25, 0), cities.pm25)',
+    'pm10': 'COALESCE(NULLIF(EXCLUDED.pm10, 0), cities.pm10)'
+}
+
+def upsert_assignments(columns: List[str]) -> str:
+    """SET list of an ON CONFLICT (name) upsert of uploaded rows"""
+    return ', '.join(f"{col}={KEEP_ENRICHED.get(col, f'EXCLUDED.{col}')}" for col in columns if col != 'name')
+
+def city_row(city_data: Dict) -> tuple:
+    """Build an insert tuple in CITY_COLUMNS order from a city dict"""
+    return tuple(
+        city_data.get(col, 0) if col in CITY_ZERO_DEFAULTS else city_data.get(col)
+        for col in CITY_COLUMNS
+    )
+
+def analysis_from_row(row: Dict) -> Dict:
+    """Convert an analysis_results row into SustainabilityMetrics kwargs"""
+    return {
+        'green_space_per_capita': row.get('green_space_per_capita', 0),
+        'who_standard_compliance': row.get('who_compliance', 0),
+        'sustainability_score': row.get('sustainability_score', 0),
+        'category': row.get('category', ''),
+        'badge_level': row.get('badge_level', ''),
+        'required_green_space': row.get('required_green_space', 0),
+        'recommended_parks': row.get('recommended_parks', 0),
+        'recommended_trees': row.get('recommended_trees', 0),
+        'co2_reduction_potential': row.get('co2_reduction_potential', 0),
+        'sustainability_debt': json.loads(row['sustainability_debt']) if row.get('sustainability_debt') else {},
+        'score_explanation': json.loads(row['score_components']) if row.get('score_components') else {}
+    }
 
 class Database:
-    def __init__(self):
+    def __init__(self, bus=None):
+        # Optional InvalidationBus; writes publish events on it
+        self.bus = bus
         # Use DATABASE_URL from Render or individual params
         self.database_url = os.getenv('DATABASE_URL')
         if not self.database_url:
@@ -35,6 +91,11 @@ class Database:
             print(f"[X] Database connection error: {e}")
             return None
     
+    def publish(self, event: str, cursor=None, **payload):
+        """Publish an invalidation event; with a cursor it is sent on commit"""
+        if self.bus is not None:
+            self.bus.publish(event, cursor=cursor, **payload)
+    
     def init_database(self):
         conn = self.get_connection()
         if not conn:
@@ -65,10 +126,33 @@ class Database:
                 public_transport_usage FLOAT,
                 latitude FLOAT,
                 longitude FLOAT,
+                row_hash VARCHAR(32),
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
+        # Databases created before upload fingerprinting
+        cursor.execute('ALTER TABLE cities ADD COLUMN IF NOT EXISTS row_hash VARCHAR(32)')
+        
+        # Files whose every row is already stored, keyed by content hash
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS upload_fingerprints (
+                file_hash VARCHAR(64) PRIMARY KEY,
+                filename VARCHAR(255),
+                rows INTEGER,
+                uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('ALTER TABLE upload_fingerprints DROP COLUMN IF EXISTS enriched')
+        # Each file's cities and row fingerprints; the file is unchanged while they all match cities.row_hash
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS upload_fingerprint_rows (
+                file_hash VARCHAR(64) NOT NULL,
+                name VARCHAR(255) NOT NULL,
+                row_hash VARCHAR(32),
+                PRIMARY KEY (file_hash, name)
+            )
+        ''')
         
         # Analysis results table
         cursor.execute('''
@@ -119,6 +203,32 @@ class Database:
             )
         ''')
         
+        # Geocoding results (found=false rows are negative-cache entries)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS geocode_cache (
+                query VARCHAR(255) PRIMARY KEY,
+                latitude FLOAT,
+                longitude FLOAT,
+                found BOOLEAN NOT NULL,
+                fetched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # Air pollution readings per grid cell and hour bucket
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS air_pollution_cache (
+                cell_lat INTEGER NOT NULL,
+                cell_lon INTEGER NOT NULL,
+                hour_bucket BIGINT NOT NULL,
+                aqi FLOAT,
+                pm25 FLOAT,
+                pm10 FLOAT,
+                co FLOAT,
+                fetched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (cell_lat, cell_lon, hour_bucket)
+            )
+        ''')
+        
         conn.commit()
         print("[OK] Database tables initialized successfully")
         cursor.close()
@@ -145,7 +255,8 @@ class Database:
                 green_space_area=%s, open_land_area=%s, green_coverage_percentage=%s,
                 existing_parks=%s, tree_coverage=%s, aqi=%s, pm25=%s, pm10=%s,
                 co2_estimation=%s, traffic_density=%s, vehicle_count=%s,
-                public_transport_usage=%s, latitude=%s, longitude=%s
+                public_transport_usage=%s, latitude=%s, longitude=%s,
+                row_hash=NULL, updated_at=CURRENT_TIMESTAMP
                 RETURNING id
             ''', (
                 city_data.get('name'),
@@ -189,6 +300,7 @@ class Database:
             ))
             
             city_id = cursor.fetchone()[0]
+            self.publish(CITY_CHANGED, cursor=cursor, names=[city_data.get('name')])
             conn.commit()
             return city_id
         except Exception as e:
@@ -222,6 +334,36 @@ class Database:
         conn.close()
         return [dict(row) for row in rows]
     
+    def get_cities_frame(self, since=None, columns: Optional[List[str]] = None,
+                         names: Optional[List[str]] = None):
+        """Cities as a pandas DataFrame, built from result tuples (no per-row dicts).
+        
+        since limits the result to rows updated at or after that timestamp;
+        columns limits the selected columns (names from CITY_COLUMNS plus
+        id/created_at/updated_at); names limits it to those cities.
+        """
+        conn = self.get_connection()
+        if not conn:
+            return pd.DataFrame(columns=columns or ['id'] + CITY_COLUMNS)
+        
+        allowed = {'id', 'created_at', 'updated_at', *CITY_COLUMNS}
+        selected = ', '.join(col for col in columns if col in allowed) if columns else '*'
+        conditions, params = [], []
+        if since is not None:
+            conditions.append('updated_at >= %s')
+            params.append(since)
+        if names is not None:
+            conditions.append('name = ANY(%s)')
+            params.append(list(names))
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        cursor = conn.cursor()
+        cursor.execute(f'SELECT {selected} FROM cities {where} ORDER BY created_at DESC', params)
+        columns = [desc[0] for desc in cursor.description]
+        rows = cursor.fetchall()
+        cursor.close()
+        conn.close()
+        return pd.DataFrame.from_records(rows, columns=columns)
+    
     def delete_city(self, city_name: str):
         conn = self.get_connection()
         if not conn:
@@ -229,6 +371,7 @@ class Database:
         
         cursor = conn.cursor()
         cursor.execute('DELETE FROM cities WHERE name = %s', (city_name,))
+        self.publish(CITY_CHANGED, cursor=cursor, names=[city_name], deleted=True)
         conn.commit()
         cursor.close()
         conn.close()
@@ -241,10 +384,163 @@ class Database:
         cursor = conn.cursor()
         cursor.execute('UPDATE cities SET latitude = %s, longitude = %s WHERE name = %s', 
                       (latitude, longitude, city_name))
+        self.publish(CITY_CHANGED, cursor=cursor, names=[city_name])
         conn.commit()
         cursor.close()
         conn.close()
     
+    def get_cities_missing_enrichment(self, limit: int = 500) -> List[Dict]:
+        """Cities still lacking coordinates or an AQI reading"""
+        conn = self.get_connection()
+        if not conn:
+            return []
+        
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        cursor.execute('''
+            SELECT name, latitude, longitude, aqi, pm25, pm10 FROM cities
+            WHERE latitude IS NULL OR longitude IS NULL OR aqi IS NULL OR aqi = 0
+            ORDER BY updated_at DESC
+            LIMIT %s
+        ''', (limit,))
+        rows = cursor.fetchall()
+        cursor.close()
+        conn.close()
+        return [dict(row) for row in rows]
+    
+    def update_city_enrichment_bulk(self, cities: List[Dict]) -> int:
+        """Write coordinates and pollution readings for many cities in one UPDATE"""
+        rows = [
+            (c.get('name'), c.get('latitude'), c.get('longitude'),
+             c.get('aqi') or None, c.get('pm25') or None, c.get('pm10') or None)
+            for c in cities if c.get('name')
+        ]
+        if not rows:
+            return 0
+        
+        conn = self.get_connection()
+        if not conn:
+            return 0
+        
+        cursor = conn.cursor()
+        
+        try:
+            # NULLs leave the stored value untouched
+            execute_values(cursor, '''
+                UPDATE cities AS c SET
+                latitude = COALESCE(v.latitude, c.latitude),
+                longitude = COALESCE(v.longitude, c.longitude),
+                aqi = COALESCE(v.aqi, c.aqi),
+                pm25 = COALESCE(v.pm25, c.pm25),
+                pm10 = COALESCE(v.pm10, c.pm10),
+                updated_at = CURRENT_TIMESTAMP
+                FROM (VALUES %s) AS v(name, latitude, longitude, aqi, pm25, pm10)
+                WHERE c.name = v.name
+            ''', rows, template='(%s, %s::float8, %s::float8, %s::float8, %s::float8, %s::float8)',
+               page_size=1000)
+            self.publish(CITY_CHANGED, cursor=cursor, names=[row[0] for row in rows])
+            conn.commit()
+            return len(rows)
+        except Exception as e:
+            conn.rollback()
+            print(f"Error updating city enrichment: {e}")
+            return 0
+        finally:
+            cursor.close()
+            conn.close()
+    
+    def clear_all_cities(self):
+        """Delete every city (dependent rows cascade)"""
+        conn = self.get_connection()
+        if not conn:
+            return
+        
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM cities')
+        self.publish(DATA_CLEARED, cursor=cursor)
+        conn.commit()
+        cursor.close()
+        conn.close()
+    
+    def get_geocode(self, query: str) -> Optional[Dict]:
+        """Cached geocode row with its age in seconds, or None"""
+        conn = self.get_connection()
+        if not conn:
+            return None
+        
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        cursor.execute('''
+            SELECT latitude, longitude, found,
+                   EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP - fetched_at)) AS age
+            FROM geocode_cache WHERE query = %s
+        ''', (query,))
+        row = cursor.fetchone()
+        cursor.close()
+        conn.close()
+        return dict(row) if row else None
+    
+    def save_geocode(self, query: str, coords: Optional[tuple]):
+        """Store a geocoding result; coords=None records a negative result"""
+        conn = self.get_connection()
+        if not conn:
+            return
+        
+        cursor = conn.cursor()
+        latitude, longitude = coords if coords else (None, None)
+        try:
+            cursor.execute('''
+                INSERT INTO geocode_cache (query, latitude, longitude, found, fetched_at)
+                VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP)
+                ON CONFLICT (query) DO UPDATE SET
+                latitude=EXCLUDED.latitude, longitude=EXCLUDED.longitude,
+                found=EXCLUDED.found, fetched_at=EXCLUDED.fetched_at
+            ''', (query, latitude, longitude, coords is not None))
+            conn.commit()
+        except Exception as e:
+            print(f"Error saving geocode: {e}")
+        finally:
+            cursor.close()
+            conn.close()
+    
+    def get_pollution(self, cell_lat: int, cell_lon: int, hour_bucket: int) -> Optional[Dict]:
+        conn = self.get_connection()
+        if not conn:
+            return None
+        
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        cursor.execute('''
+            SELECT aqi, pm25, pm10, co FROM air_pollution_cache
+            WHERE cell_lat = %s AND cell_lon = %s AND hour_bucket = %s
+        ''', (cell_lat, cell_lon, hour_bucket))
+        row = cursor.fetchone()
+        cursor.close()
+        conn.close()
+        return dict(row) if row else None
+    
+    def save_pollution(self, cell_lat: int, cell_lon: int, hour_bucket: int, data: Dict, keep_buckets: int = 24):
+        """Store one reading and drop this cell's readings older than keep_buckets"""
+        conn = self.get_connection()
+        if not conn:
+            return
+        
+        cursor = conn.cursor()
+        try:
+            cursor.execute('''
+                INSERT INTO air_pollution_cache (cell_lat, cell_lon, hour_bucket, aqi, pm25, pm10, co)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT (cell_lat, cell_lon, hour_bucket) DO NOTHING
+            ''', (cell_lat, cell_lon, hour_bucket, data.get('aqi'), data.get('pm25'),
+                  data.get('pm10'), data.get('co')))
+            cursor.execute('''
+                DELETE FROM air_pollution_cache
+                WHERE cell_lat = %s AND cell_lon = %s AND hour_bucket < %s
+            ''', (cell_lat, cell_lon, hour_bucket - keep_buckets))
+            conn.commit()
+        except Exception as e:
+            print(f"Error saving pollution reading: {e}")
+        finally:
+            cursor.close()
+            conn.close()
+    
     def save_analysis(self, city_id: int, analysis_data: Dict):
         conn = self.get_connection()
         if not conn:
@@ -298,20 +594,7 @@ class Database:
         conn.close()
         
         if row:
-            row = dict(row)
-            return {
-                'green_space_per_capita': row.get('green_space_per_capita', 0),
-                'who_standard_compliance': row.get('who_compliance', 0),
-                'sustainability_score': row.get('sustainability_score', 0),
-                'category': row.get('category', ''),
-                'badge_level': row.get('badge_level', ''),
-                'required_green_space': row.get('required_green_space', 0),
-                'recommended_parks': row.get('recommended_parks', 0),
-                'recommended_trees': row.get('recommended_trees', 0),
-                'co2_reduction_potential': row.get('co2_reduction_potential', 0),
-                'sustainability_debt': json.loads(row['sustainability_debt']) if row.get('sustainability_debt') else {},
-                'score_explanation': json.loads(row['score_components']) if row.get('score_components') else {}
-            }
+            return analysis_from_row(dict(row))
         return None
     
     def save_simulation(self, city_id: int, sim_type: str, parameters: Dict, results: Dict):
@@ -408,3 +691,177 @@ class Database:
         cursor.close()
         conn.close()
         return [dict(row) for row in rows]
+    
+    def add_cities_bulk(self, cities: List[Dict], row_hashes: Optional[List[str]] = None) -> int:
+        """Upsert many cities in a single statement"""
+        return self.add_city_rows([city_row(city) for city in cities], row_hashes)
+    
+    def add_city_rows(self, rows: List[tuple], row_hashes: Optional[List[str]] = None) -> int:
+        """Upsert insert tuples already in CITY_COLUMNS order (e.g. DataProcessor.df_to_city_rows).
+        
+        row_hashes are the source rows' fingerprints (DataProcessor.row_hashes),
+        stored so a later upload can skip unchanged rows; without them the
+        stored hash is cleared. Coordinates and readings the rows leave
+        empty keep their stored (enriched) values.
+        """
+        if not rows:
+            return 0
+        
+        conn = self.get_connection()
+        if not conn:
+            return 0
+        
+        cursor = conn.cursor()
+        columns = CITY_COLUMNS + ['row_hash']
+        hashes = row_hashes if row_hashes is not None else [None] * len(rows)
+        
+        try:
+            # Keep the last occurrence of a name; ON CONFLICT cannot touch a row twice
+            rows = list({row[0]: (*row, row_hash) for row, row_hash in zip(rows, hashes)}.values())
+            execute_values(cursor, f'''
+                INSERT INTO cities ({', '.join(columns)})
+                VALUES %s
+                ON CONFLICT (name) DO UPDATE SET
+                {upsert_assignments(columns)},
+                updated_at=CURRENT_TIMESTAMP
+            ''', rows, page_size=1000)
+            self.publish(CITY_CHANGED, cursor=cursor, names=[row[0] for row in rows])
+            conn.commit()
+            return len(rows)
+        except Exception as e:
+            conn.rollback()
+            print(f"Error bulk adding cities: {e}")
+            return 0
+        finally:
+            cursor.close()
+            conn.close()
+    
+    def get_row_hashes(self, names: List[str]) -> Dict[str, Optional[str]]:
+        """Stored source-row fingerprint of each existing city among names"""
+        if not names:
+            return {}
+        
+        conn = self.get_connection()
+        if not conn:
+            return {}
+        
+        cursor = conn.cursor()
+        cursor.execute('SELECT name, row_hash FROM cities WHERE name = ANY(%s)', (list(names),))
+        hashes = dict(cursor.fetchall())
+        cursor.close()
+        conn.close()
+        return hashes
+    
+    def get_upload_fingerprint(self, file_hash: str) -> Optional[Dict]:
+        """The recorded upload of a file with this content hash, if its rows are still current.
+        
+        A row is current while its city still carries the fingerprint the
+        file stored; any later write of other data to it (or its deletion)
+        makes the file count as changed again.
+        """
+        conn = self.get_connection()
+        if not conn:
+            return None
+        
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        cursor.execute('''
+            SELECT * FROM upload_fingerprints f
+            WHERE f.file_hash = %s AND NOT EXISTS (
+                SELECT 1 FROM upload_fingerprint_rows r
+                LEFT JOIN cities c ON c.name = r.name
+                WHERE r.file_hash = f.file_hash AND c.row_hash IS DISTINCT FROM r.row_hash
+            )
+        ''', (file_hash,))
+        row = cursor.fetchone()
+        cursor.close()
+        conn.close()
+        return dict(row) if row else None
+    
+    def save_upload_rows(self, file_hash: str, names: List[str], row_hashes: List[str]) -> int:
+        """Record which cities (and row fingerprints) a file contains; returns the number recorded"""
+        if not names:
+            return 0
+        
+        conn = self.get_connection()
+        if not conn:
+            return 0
+        
+        cursor = conn.cursor()
+        try:
+            # A name repeated in the file ends up as its last row, as in add_city_rows
+            rows = list({name: (file_hash, name, row_hash) for name, row_hash in zip(names, row_hashes)}.values())
+            execute_values(cursor, '''
+                INSERT INTO upload_fingerprint_rows (file_hash, name, row_hash)
+                VALUES %s
+                ON CONFLICT (file_hash, name) DO UPDATE SET row_hash=EXCLUDED.row_hash
+            ''', rows, page_size=1000)
+            conn.commit()
+            return len(rows)
+        except Exception as e:
+            conn.rollback()
+            print(f"Error saving upload rows: {e}")
+            return 0
+        finally:
+            cursor.close()
+            conn.close()
+    
+    def save_upload_fingerprint(self, file_hash: str, filename: str, rows: int):
+        """Record a file that was stored completely (every row valid and upserted, see save_upload_rows)"""
+        conn = self.get_connection()
+        if not conn:
+            return
+        
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO upload_fingerprints (file_hash, filename, rows)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (file_hash) DO UPDATE SET
+            filename=EXCLUDED.filename, rows=EXCLUDED.rows, uploaded_at=CURRENT_TIMESTAMP
+        ''', (file_hash, filename, rows))
+        conn.commit()
+        cursor.close()
+        conn.close()
+    
+    def get_latest_analyses(self, city_ids: List[int]) -> Dict[int, Dict]:
+        """Latest analysis for each of the given cities, keyed by city id"""
+        if not city_ids:
+            return {}
+        
+        conn = self.get_connection()
+        if not conn:
+            return {}
+        
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        cursor.execute('''
+            SELECT DISTINCT ON (city_id) * FROM analysis_results
+            WHERE city_id = ANY(%s)
+            ORDER BY city_id, analyzed_at DESC
+        ''', (list(city_ids),))
+        rows = cursor.fetchall()
+        cursor.close()
+        conn.close()
+        return {row['city_id']: analysis_from_row(dict(row)) for row in rows}
+    
+    def get_recommendations_for_cities(self, city_ids: List[int]) -> Dict[int, List[Dict]]:
+        """Recommendations for each of the given cities, keyed by city id"""
+        if not city_ids:
+            return {}
+        
+        conn = self.get_connection()
+        if not conn:
+            return {}
+        
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        cursor.execute('''
+            SELECT * FROM recommendations
+            WHERE city_id = ANY(%s)
+            ORDER BY city_id, impact_score DESC
+        ''', (list(city_ids),))
+        rows = cursor.fetchall()
+        cursor.close()
+        conn.close()
+        
+        result = {city_id: [] for city_id in city_ids}
+        for row in rows:
+            result.setdefault(row['city_id'], []).append(dict(row))
+        return result
@@ -0,0 +1,136 @@
+import json
+import os
+import numpy as np
+
+class FlatForest:
+    """A trained tree ensemble flattened into contiguous NumPy arrays.
+
+    All trees share one node table (feature, threshold, left, right, value);
+    roots holds each tree's first node. Leaves point back at themselves with
+    an infinite threshold, so a batch is scored by stepping every (row, tree)
+    cursor one level at a time for max_depth steps, with no per-node Python
+    and no leaf checks.
+    """
+
+    ARRAYS = ('feature', 'threshold', 'left', 'right', 'value', 'roots')
+
+    def __init__(self, feature, threshold, left, right, value, roots, max_depth: int, info=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        # Free-form provenance saved with the arrays (e.g. the artifact's saved_at)
+        self.info = dict(info or {})
+
+    @classmethod
+    def from_sklearn(cls, forest) -> 'FlatForest':
+        """Flatten a fitted single-output RandomForestRegressor / ExtraTreesRegressor"""
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            n = tree.node_count
+            nodes = np.arange(n, dtype=np.int32) + offset
+            is_leaf = tree.children_left == -1
+
+            features.append(np.where(is_leaf, 0, tree.feature).astype(np.int32))
+            thresholds.append(np.where(is_leaf, np.inf, tree.threshold).astype(np.float64))
+            lefts.append(np.where(is_leaf, nodes, tree.children_left + offset).astype(np.int32))
+            rights.append(np.where(is_leaf, nodes, tree.children_right + offset).astype(np.int32))
+            values.append(tree.value[:, 0, 0].astype(np.float64))
+            roots.append(offset)
+
+            max_depth = max(max_depth, tree.max_depth)
+            offset += n
+
+        return cls(
+            np.concatenate(features), np.concatenate(thresholds),
+            np.concatenate(lefts), np.concatenate(rights),
+            np.concatenate(values), np.asarray(roots, dtype=np.int32), max_depth
+        )
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    def _descend(self, X: np.ndarray):
+        """Step one cursor per (row, tree) down a level at a time.
+
+        Yields (cursor, node, next_node) for the cursors still on internal
+        nodes, where cursor = row * n_trees + tree. Cursors that reach a leaf
+        drop out of the active set.
+        """
+        # sklearn evaluates splits on float32 inputs; match it exactly
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n_rows, n_features = X.shape
+        X_flat = X.ravel()
+        internal = self.left != np.arange(len(self.left), dtype=np.int32)
+
+        cursor = np.arange(n_rows * self.n_trees, dtype=np.int64)
+        node = np.tile(np.asarray(self.roots, dtype=np.int32), n_rows)
+        row_base = (cursor // self.n_trees) * n_features
+        while len(cursor):
+            x = X_flat.take(row_base + self.feature.take(node))
+            next_node = np.where(x <= self.threshold.take(node), self.left.take(node), self.right.take(node))
+            yield cursor, node, next_node
+            keep = internal.take(next_node)
+            cursor, node, row_base = cursor[keep], next_node[keep], row_base[keep]
+
+    def leaves(self, X: np.ndarray) -> np.ndarray:
+        """Leaf node index reached in every tree, shape (n_rows, n_trees)"""
+        leaves = np.tile(np.asarray(self.roots, dtype=np.int32), len(X))
+        for cursor, _, next_node in self._descend(X):
+            leaves[cursor] = next_node
+        return leaves.reshape(len(X), self.n_trees)
+
+    def contributions(self, X: np.ndarray):
+        """Tree-path decomposition of the prediction.
+
+        Every split moves the prediction from the parent's value to the
+        child's; the change is credited to the split feature. Returns
+        (bias, contributions) with bias the forest's mean root value and
+        contributions of shape (n_rows, n_features), so that
+        bias + contributions.sum(axis=1) equals predict(X) up to rounding.
+        """
+        n_rows, n_features = np.shape(X)
+        totals = np.zeros(n_rows * n_features, dtype=np.float64)
+        for cursor, node, next_node in self._descend(X):
+            slot = (cursor // self.n_trees) * n_features + self.feature.take(node)
+            totals += np.bincount(slot, weights=self.value.take(next_node) - self.value.take(node),
+                                  minlength=len(totals))
+        bias = float(np.mean(self.value.take(self.roots)))
+        return bias, totals.reshape(n_rows, n_features) / self.n_trees
+
+    def predict(self, X: np.ndarray, chunk_size: int = 4096) -> np.ndarray:
+        X = np.asarray(X)
+        out = np.empty(len(X), dtype=np.float64)
+        for start in range(0, len(X), chunk_size):
+            leaf_values = self.value[self.leaves(X[start:start + chunk_size])]
+            # Accumulate tree by tree, in sklearn's order, so sums round identically
+            total = np.zeros(len(leaf_values), dtype=np.float64)
+            for t in range(self.n_trees):
+                total += leaf_values[:, t]
+            out[start:start + chunk_size] = total / self.n_trees
+        return out
+
+    def save(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        for name in self.ARRAYS:
+            np.save(os.path.join(directory, f'{name}.npy'), getattr(self, name))
+        with open(os.path.join(directory, 'forest.json'), 'w') as f:
+            json.dump({'max_depth': self.max_depth, 'n_trees': self.n_trees,
+                       'n_nodes': int(len(self.feature)), 'info': self.info}, f)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> 'FlatForest':
+        """Load saved arrays; with mmap every worker shares the same page-cache pages"""
+        mode = 'r' if mmap else None
+        arrays = {name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mode)
+                  for name in cls.ARRAYS}
+        with open(os.path.join(directory, 'forest.json')) as f:
+            info = json.load(f)
+        return cls(max_depth=info['max_depth'], info=info.get('info'), **arrays)
@@ -0,0 +1,168 @@
+import json
+import os
+import select
+import socket
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+CHANNEL = 'ecoplan_invalidation'
+
+# Event names published on the bus
+CITY_CHANGED = 'city_changed'
+DATA_CLEARED = 'data_cleared'
+MODEL_PROMOTED = 'model_promoted'
+
+# Postgres rejects NOTIFY payloads of 8000 bytes or more
+MAX_PAYLOAD_BYTES = 7500
+
+class LocalBackend:
+    """In-process stand-in for LISTEN/NOTIFY.
+
+    Every bus attached to the same LocalBackend receives every message, so
+    several buses sharing one backend behave like several gunicorn workers
+    sharing one Postgres channel.
+    """
+
+    def __init__(self):
+        self._listeners: List[Callable[[str], None]] = []
+        self._lock = threading.Lock()
+
+    def publish(self, message: str, cursor=None):
+        with self._lock:
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener(message)
+
+    def listen(self, callback: Callable[[str], None], stop_event: threading.Event):
+        with self._lock:
+            self._listeners.append(callback)
+        stop_event.wait()
+        with self._lock:
+            self._listeners.remove(callback)
+
+class PostgresBackend:
+    """LISTEN/NOTIFY on a dedicated connection"""
+
+    def __init__(self, connect: Callable, channel: str = CHANNEL, poll_interval: float = 1.0):
+        self.connect = connect
+        self.channel = channel
+        self.poll_interval = poll_interval
+
+    def publish(self, message: str, cursor=None):
+        # On the caller's cursor the NOTIFY is delivered only if that transaction commits
+        if cursor is not None:
+            cursor.execute('SELECT pg_notify(%s, %s)', (self.channel, message))
+            return
+
+        conn = self.connect()
+        if not conn:
+            return
+        try:
+            conn.autocommit = True
+            cur = conn.cursor()
+            cur.execute('SELECT pg_notify(%s, %s)', (self.channel, message))
+            cur.close()
+        finally:
+            conn.close()
+
+    def listen(self, callback: Callable[[str], None], stop_event: threading.Event):
+        backoff = 1.0
+        while not stop_event.is_set():
+            conn = self.connect()
+            if not conn:
+                stop_event.wait(backoff)
+                backoff = min(backoff * 2, 60.0)
+                continue
+
+            backoff = 1.0
+            try:
+                conn.autocommit = True
+                cur = conn.cursor()
+                cur.execute(f'LISTEN {self.channel}')
+                while not stop_event.is_set():
+                    if select.select([conn], [], [], self.poll_interval) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        callback(conn.notifies.pop(0).payload)
+            except Exception as e:
+                print(f"Invalidation listener error: {e}")
+                stop_event.wait(backoff)
+            finally:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+
+class InvalidationBus:
+    """Fan-out of cache invalidation events across worker processes.
+
+    Handlers are registered per event name ('*' receives everything) and run
+    on the listener thread, so they must be quick and thread-safe.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend if backend is not None else LocalBackend()
+        self.origin = f"{socket.gethostname()}:{os.getpid()}:{id(self)}"
+        self._handlers: Dict[str, List] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def subscribe(self, event: str, handler: Callable[[Dict], None], include_own: bool = True):
+        """Call handler(payload) for each event; include_own=False skips our own publishes"""
+        self._handlers.setdefault(event, []).append((handler, include_own))
+
+    def publish(self, event: str, cursor=None, **payload):
+        payload['event'] = event
+        payload['origin'] = self.origin
+        payload['ts'] = time.time()
+        message = json.dumps(payload, default=str)
+        if len(message.encode('utf-8')) > MAX_PAYLOAD_BYTES:
+            # Too many names to list: tell listeners to drop everything instead
+            payload.pop('names', None)
+            payload['all'] = True
+            message = json.dumps(payload, default=str)
+        try:
+            self.backend.publish(message, cursor=cursor)
+        except Exception as e:
+            print(f"Invalidation publish error: {e}")
+
+    def dispatch(self, message: str):
+        try:
+            payload = json.loads(message)
+        except ValueError:
+            return
+
+        own = payload.get('origin') == self.origin
+        handlers = self._handlers.get(payload.get('event'), []) + self._handlers.get('*', [])
+        for handler, include_own in handlers:
+            if own and not include_own:
+                continue
+            try:
+                handler(payload)
+            except Exception as e:
+                print(f"Invalidation handler error for {payload.get('event')}: {e}")
+
+    def start(self):
+        """Start the listener thread (one per worker process)"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self.backend.listen, args=(self.dispatch, self._stop),
+            name='invalidation-listener', daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+def create_bus(connect: Callable) -> InvalidationBus:
+    """Bus for the configured backend: INVALIDATION_BACKEND=local|postgres (default postgres)"""
+    if os.getenv('INVALIDATION_BACKEND', 'postgres').lower() == 'local':
+        return InvalidationBus(LocalBackend())
+    return InvalidationBus(PostgresBackend(connect))
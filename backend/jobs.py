@@ -0,0 +1,276 @@
+import fcntl
+import importlib
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+JOBS_DIR = os.getenv('JOBS_DIR', 'data/jobs')
+# Put on the child's PYTHONPATH so job modules import wherever the server was started
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Job states
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+FINISHED = (SUCCEEDED, FAILED)
+
+class JobStore:
+    """Job records as one JSON file each, readable from every worker process.
+
+    A job started in one gunicorn worker can be polled through any other,
+    so status lives on disk rather than in process memory. Writes replace
+    the file atomically under a store-wide lock.
+    """
+
+    def __init__(self, root: str = JOBS_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.root, f'{job_id}.json')
+
+    def _write(self, job: Dict):
+        tmp_path = f"{self._path(job['id'])}.tmp{os.getpid()}"
+        with open(tmp_path, 'w') as f:
+            json.dump(job, f, default=str)
+        os.replace(tmp_path, self._path(job['id']))
+
+    def create(self, kind: str, **fields) -> Dict:
+        now = time.time()
+        job = {
+            'id': uuid.uuid4().hex,
+            'kind': kind,
+            'status': QUEUED,
+            'progress': 0.0,
+            'message': '',
+            'created_at': now,
+            'updated_at': now,
+            'result': None,
+            'error': None,
+            **fields
+        }
+        self._write(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        try:
+            with open(self._path(job_id)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def update(self, job_id: str, expect: Optional[Dict] = None, **fields) -> Optional[Dict]:
+        """Merge fields into the job record; returns the new record.
+        
+        With expect, the update only happens if the record still has those
+        values (compare-and-set, e.g. to claim a job), otherwise None.
+        """
+        with open(os.path.join(self.root, '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            job = self.get(job_id)
+            if job is None:
+                return None
+            if expect and any(job.get(key) != value for key, value in expect.items()):
+                return None
+            job.update(fields, updated_at=time.time())
+            self._write(job)
+            return job
+
+    def list(self, kind: Optional[str] = None, limit: Optional[int] = 20) -> List[Dict]:
+        """Most recent jobs first (limit=None for all)"""
+        jobs = []
+        for name in os.listdir(self.root):
+            if name.endswith('.json'):
+                job = self.get(name[:-5])
+                if job and (kind is None or job['kind'] == kind):
+                    jobs.append(job)
+        jobs.sort(key=lambda job: job['created_at'], reverse=True)
+        return jobs[:limit]
+
+def _report(store: JobStore, job_id: str) -> Callable:
+    """report(progress, message, **fields) for one job, as passed to job functions"""
+    def report(progress: float, message: str = '', **fields):
+        store.update(job_id, progress=round(min(max(progress, 0.0), 1.0), 4), message=message, **fields)
+    return report
+
+class JobRunner:
+    """Runs jobs on background threads and records their progress in a JobStore.
+
+    The job function is called as fn(report, **params), where
+    report(progress, message, **fields) records a 0..1 progress fraction
+    (and any extra fields); its return value becomes the job's result.
+    """
+
+    def __init__(self, store: JobStore, max_workers: int = 1):
+        self.store = store
+        self.worker = f"{socket.gethostname()}:{os.getpid()}"
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+
+    def submit(self, kind: str, fn: Callable, **params) -> Dict:
+        job = self.store.create(kind, params=params, worker=self.worker)
+        self._executor.submit(self._run, job['id'], fn, params)
+        return job
+
+    def _run(self, job_id: str, fn: Callable, params: Dict):
+        report = _report(self.store, job_id)
+        self.store.update(job_id, status=RUNNING, started_at=time.time())
+        try:
+            result = fn(report, **params)
+            self.store.update(job_id, status=SUCCEEDED, progress=1.0, result=result, finished_at=time.time())
+        except Exception as e:
+            print(f"Job {job_id} failed: {e}")
+            self.store.update(job_id, status=FAILED, error=str(e),
+                              traceback=traceback.format_exc(), finished_at=time.time())
+
+def _entry_point(fn: Callable) -> str:
+    """'module:function' for a module-level function, so a fresh interpreter can import it"""
+    if fn.__module__ in (None, '__main__') or '<' in fn.__qualname__:
+        raise ValueError(f"Job function {fn!r} must be a module-level function of an importable module")
+    return f"{fn.__module__}:{fn.__qualname__}"
+
+def run_job(store_root: str, job_id: str):
+    """Run one job in this process: the body of a ProcessJobRunner child.
+    
+    The child is a fresh interpreter (python -m backend.jobs), so the job
+    function imports and builds its own database and HTTP clients instead
+    of inheriting the parent's sockets and locks.
+    """
+    store = JobStore(store_root)
+    job = store.get(job_id)
+    if job is None:
+        return
+    store.update(job_id, status=RUNNING, started_at=job.get('started_at') or time.time())
+    try:
+        module_name, function_name = job['entry'].split(':')
+        fn = getattr(importlib.import_module(module_name), function_name)
+        result = fn(_report(store, job_id), job.get('checkpoint'), **job['params'])
+        store.update(job_id, status=SUCCEEDED, progress=1.0, result=result, finished_at=time.time())
+    except Exception as e:
+        print(f"Job {job_id} failed: {e}")
+        store.update(job_id, status=FAILED, error=str(e),
+                     traceback=traceback.format_exc(), finished_at=time.time())
+
+class ProcessJobRunner:
+    """Runs each job in its own child process and restarts jobs whose process died.
+    
+    The work happens outside the request and outside the gunicorn worker,
+    so neither a request timeout nor a worker restart loses it. Job
+    functions are registered per kind and called as
+    fn(report, checkpoint, **params): report is as for JobRunner, and a
+    checkpoint=dict field passed to it is what the next attempt receives
+    as checkpoint after a crash (None on the first attempt), so the
+    function can continue where it stopped. The child is a new interpreter
+    running run_job, so fn must be a module-level function and params must
+    be JSON. on_finish(job), if given, runs once per finished job in a web
+    process: the one waiting on the child, or, if that process is gone, the
+    next one to call resume(). resume() also restarts unfinished jobs whose
+    process is gone; call it at startup. Liveness is checked by pid, so
+    resumption covers processes on this host.
+    """
+    
+    def __init__(self, store: JobStore, max_attempts: int = 3):
+        self.store = store
+        self.max_attempts = max_attempts
+        self.host = socket.gethostname()
+        self._entries: Dict[str, str] = {}
+        self._on_finish: Dict[str, Callable] = {}
+    
+    def register(self, kind: str, fn: Callable, on_finish: Optional[Callable[[Dict], None]] = None):
+        self._entries[kind] = _entry_point(fn)
+        if on_finish is not None:
+            self._on_finish[kind] = on_finish
+    
+    def submit(self, kind: str, **params) -> Dict:
+        job = self.store.create(kind, params=params, entry=self._entries[kind], host=self.host,
+                                pid=None, attempts=0, checkpoint=None, finish_handled=False)
+        return self._start(job) or job
+    
+    def _alive(self, job: Dict) -> bool:
+        if job.get('host') != self.host:
+            # Another host's processes cannot be checked from here
+            return True
+        if not job.get('pid'):
+            return False
+        try:
+            os.kill(job['pid'], 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+    
+    def _start(self, job: Dict) -> Optional[Dict]:
+        """Claim the job for this process and start its child; None if another process got there first"""
+        if job['attempts'] >= self.max_attempts:
+            failed = self.store.update(job['id'], expect={'pid': job['pid']}, status=FAILED, finished_at=time.time(),
+                                       error=f"Gave up after {job['attempts']} interrupted attempts")
+            if failed:
+                self._finish(failed)
+            return None
+        # Our own pid marks the job as taken until the child's pid replaces it
+        claimed = self.store.update(job['id'], expect={'pid': job['pid'], 'attempts': job['attempts']},
+                                    host=self.host, pid=os.getpid(), attempts=job['attempts'] + 1,
+                                    entry=self._entries[job['kind']])
+        if claimed is None:
+            return None
+        
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [PROJECT_ROOT, env.get('PYTHONPATH')]))
+        process = subprocess.Popen([sys.executable, '-m', 'backend.jobs', os.path.abspath(self.store.root), job['id']],
+                                   env=env)
+        claimed = self.store.update(job['id'], pid=process.pid) or claimed
+        threading.Thread(target=self._reap, args=(job['id'], process), name='job-reaper', daemon=True).start()
+        return claimed
+    
+    def _reap(self, job_id: str, process: subprocess.Popen):
+        """Wait for the child; if it died without finishing the job, start another attempt"""
+        process.wait()
+        job = self.store.get(job_id)
+        if not job or job.get('pid') != process.pid:
+            return
+        if job['status'] not in FINISHED:
+            print(f"Job {job_id} process exited with code {process.returncode}; resuming")
+            self._start(job)
+        else:
+            self._finish(job)
+    
+    def _finish(self, job: Dict):
+        """Run the kind's on_finish for a finished job, unless some process already claimed it"""
+        # Jobs recorded without the flag predate it and count as handled
+        if job['kind'] not in self._on_finish or job.get('finish_handled', True):
+            return
+        claimed = self.store.update(job['id'], expect={'finish_handled': False}, finish_handled=True)
+        if claimed is None:
+            return
+        try:
+            self._on_finish[job['kind']](claimed)
+        except Exception as e:
+            print(f"Job {job['id']} on_finish error: {e}")
+    
+    def resume(self) -> List[str]:
+        """Restart unfinished jobs of the registered kinds whose process is gone; returns their ids.
+        
+        Finished jobs whose on_finish never ran (their web process died
+        first) get it here.
+        """
+        resumed = []
+        for job in self.store.list(limit=None):
+            if job['kind'] not in self._entries:
+                continue
+            if job['status'] in FINISHED:
+                self._finish(job)
+            elif not self._alive(job) and self._start(job):
+                resumed.append(job['id'])
+        return resumed
+
+if __name__ == '__main__':
+    run_job(sys.argv[1], sys.argv[2])
@@ -1,75 +1,506 @@
 import numpy as np
+import pandas as pd
+from collections.abc import Mapping
+from dataclasses import dataclass, field, replace
+from itertools import count
+from typing import Optional
 from sklearn.ensemble import RandomForestRegressor
+from sklearn.base import clone
+from sklearn.inspection import permutation_importance
 from sklearn.preprocessing import StandardScaler
+from backend.models import CityData
+from backend.flat_forest import FlatForest
+from utils.cache import LRUCache
+from datetime import datetime, timezone
+import joblib
+from joblib import Parallel, delayed
+import json
 import pickle
 import os
+import shutil
+import sklearn
+import threading
+import time
+
+MODEL_PATH = 'data/ml_model.joblib'
+# Pre-joblib artifact, still loaded when no joblib artifact exists
+LEGACY_MODEL_PATH = 'data/ml_model.pkl'
+
+# Column order of the model's feature matrix (matches prepare_features)
+FEATURE_COLUMNS = [
+    'population_density', 'green_space_area', 'green_coverage_percentage',
+    'aqi', 'pm25', 'pm10', 'vehicle_count', 'public_transport_usage',
+    'built_up_percentage', 'existing_parks', 'tree_coverage'
+]
+FEATURE_DTYPE = np.float64
+FEATURE_LABELS = ['Population Density', 'Green Space Area', 'Green Coverage %',
+                  'AQI', 'PM2.5', 'PM10', 'Vehicle Count', 'Public Transport %',
+                  'Built-up %', 'Parks', 'Tree Coverage']
+
+# Prediction engine: 'flat' (NumPy arrays, see FlatForest) or 'sklearn'
+ML_ENGINE = os.getenv('ML_ENGINE', 'flat').lower()
+# Above this many rows sklearn's compiled traversal overtakes the NumPy stepping
+FLAT_MAX_ROWS = int(os.getenv('ML_FLAT_MAX_ROWS', '512'))
+# Seconds between checks of the registry's current pointer
+RELOAD_INTERVAL = float(os.getenv('ML_RELOAD_INTERVAL', '5'))
+# Permutation importance: shuffles per feature, and the most rows it is computed on
+PERMUTATION_REPEATS = 5
+PERMUTATION_SAMPLE_ROWS = 5000
+# Rows per parallel task when computing per-city contributions
+CONTRIBUTION_CHUNK_ROWS = 2000
+# Prediction cache entries (0 disables it) and the decimals feature vectors are rounded to for its key
+PREDICTION_CACHE_SIZE = int(os.getenv('ML_PREDICTION_CACHE_SIZE', '65536'))
+PREDICTION_CACHE_DECIMALS = 6
+# Batches larger than this skip the cache: per-row key building and lookups would cost more than the model call
+PREDICTION_CACHE_MAX_ROWS = int(os.getenv('ML_PREDICTION_CACHE_MAX_ROWS', '64'))
+
+def _feature_value(value) -> float:
+    """Scalar coercion matching build_feature_matrix: missing or non-numeric becomes 0"""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return 0.0 if np.isnan(value) else value
+
+def feature_vector(city) -> np.ndarray:
+    """1 x 11 feature matrix for one CityData or dict, without building a DataFrame"""
+    get = city.get if isinstance(city, Mapping) else lambda col: getattr(city, col, None)
+    return np.array([[_feature_value(get(col)) for col in FEATURE_COLUMNS]], dtype=FEATURE_DTYPE)
+
+def build_feature_matrix(data) -> np.ndarray:
+    """Feature matrix (n x 11, FEATURE_DTYPE, FEATURE_COLUMNS order) without per-row Python.
+    
+    Accepts a DataFrame, a mapping of column name -> array (columnar frame or
+    DB result columns), a list of row dicts, or a list of CityData objects.
+    Missing columns and non-numeric values become 0.
+    """
+    if isinstance(data, pd.DataFrame):
+        columns = data
+    elif isinstance(data, Mapping):
+        columns = {col: np.asarray(values) for col, values in data.items()}
+    else:
+        rows = list(data)
+        if rows and isinstance(rows[0], CityData):
+            rows = [city.__dict__ for city in rows]
+        columns = pd.DataFrame.from_records(rows)
+    
+    n = len(columns) if isinstance(columns, pd.DataFrame) else len(next(iter(columns.values()), ()))
+    X = np.zeros((n, len(FEATURE_COLUMNS)), dtype=FEATURE_DTYPE)
+    for j, col in enumerate(FEATURE_COLUMNS):
+        if col in columns:
+            X[:, j] = pd.to_numeric(pd.Series(columns[col]), errors='coerce').to_numpy(dtype=FEATURE_DTYPE, na_value=0)
+    return X
+
+def metadata_path(model_path: str) -> str:
+    return os.path.splitext(model_path)[0] + '.meta.json'
+
+def flat_path(model_path: str) -> str:
+    """Directory holding the flattened forest arrays for an artifact"""
+    return os.path.splitext(model_path)[0] + '_flat'
+
+def explanations_path(model_path: str) -> str:
+    return os.path.splitext(model_path)[0] + '.explain.npz'
+
+def read_metadata(model_path: str = MODEL_PATH):
+    """Artifact metadata from the JSON sidecar, without deserializing the model"""
+    path = metadata_path(model_path)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def _chunk_contributions(flat: FlatForest, X: np.ndarray) -> np.ndarray:
+    return flat.contributions(X)[1]
+
+class ModelExplanations:
+    """Explanations computed once per model version at training time.
+    
+    Holds permutation importances (MAE increase when a feature is shuffled)
+    and, for every training city, the tree-path contribution of each
+    feature to its ML score. Lookups are a hashed name probe.
+    """
+    
+    def __init__(self, names, X, bias: float, contributions, importance_mean, importance_std):
+        self.names = np.asarray(names, dtype=str)
+        self.X = np.asarray(X, dtype=FEATURE_DTYPE)
+        self.bias = float(bias)
+        self.contributions = np.asarray(contributions, dtype=np.float64)
+        self.importance_mean = np.asarray(importance_mean, dtype=np.float64)
+        self.importance_std = np.asarray(importance_std, dtype=np.float64)
+        self._index = pd.Index(self.names)
+    
+    @classmethod
+    def compute(cls, state: 'LoadedModel', X: np.ndarray, y, names, n_jobs: int = -1) -> 'ModelExplanations':
+        """Contributions for every row and permutation importances, both spread over n_jobs cores"""
+        X = np.asarray(X, dtype=FEATURE_DTYPE)
+        y = np.asarray(y, dtype=np.float64)
+        X_scaled = state.scaler.transform(X)
+        
+        chunks = Parallel(n_jobs=n_jobs)(
+            delayed(_chunk_contributions)(state.flat, X_scaled[start:start + CONTRIBUTION_CHUNK_ROWS])
+            for start in range(0, len(X_scaled), CONTRIBUTION_CHUNK_ROWS)
+        )
+        contributions = np.vstack(chunks) if chunks else np.zeros((0, len(FEATURE_COLUMNS)))
+        bias = float(np.mean(state.flat.value.take(state.flat.roots)))
+        
+        sample = np.arange(len(X_scaled))
+        if len(sample) > PERMUTATION_SAMPLE_ROWS:
+            sample = np.sort(np.random.default_rng(42).choice(sample, PERMUTATION_SAMPLE_ROWS, replace=False))
+        permutation = permutation_importance(state.model, X_scaled[sample], y[sample],
+                                             scoring='neg_mean_absolute_error', n_repeats=PERMUTATION_REPEATS,
+                                             random_state=42, n_jobs=n_jobs)
+        return cls(names, X, bias, contributions, permutation.importances_mean, permutation.importances_std)
+    
+    def save(self, path: str):
+        tmp_path = f"{path}.tmp{os.getpid()}.npz"
+        np.savez(tmp_path, names=self.names, X=self.X, bias=self.bias, contributions=self.contributions,
+                 importance_mean=self.importance_mean, importance_std=self.importance_std)
+        os.replace(tmp_path, path)
+    
+    @classmethod
+    def load(cls, path: str) -> 'ModelExplanations':
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data['names'], data['X'], float(data['bias']), data['contributions'],
+                       data['importance_mean'], data['importance_std'])
+    
+    def importances(self):
+        """[(label, mean MAE increase, std)], most important first"""
+        ranked = sorted(zip(FEATURE_LABELS, self.importance_mean, self.importance_std),
+                        key=lambda item: item[1], reverse=True)
+        return [(label, float(mean), float(std)) for label, mean, std in ranked]
+    
+    def lookup(self, name: str, features: np.ndarray):
+        """Cached contributions for a city, or None if unknown or its features changed since training"""
+        pos = self._index.get_indexer([str(name)])[0]
+        if pos < 0 or not np.array_equal(self.X[pos], features):
+            return None
+        return self.contributions[pos]
+
+@dataclass(frozen=True)
+class LoadedModel:
+    """Everything one prediction needs, swapped in as a unit so readers never mix versions"""
+    model: object
+    scaler: object
+    flat: Optional[FlatForest] = None
+    trained: bool = False
+    training_rows: int = 0
+    version: Optional[str] = None
+    explanations: Optional[ModelExplanations] = None
+    # Unique per instance (replace() included); keys prediction cache entries to this exact model
+    generation: int = field(default_factory=count().__next__, init=False, compare=False)
 
 class MLPredictor:
-    def __init__(self):
-        self.model = RandomForestRegressor(n_estimators=100, random_state=42)
-        self.scaler = StandardScaler()
-        self.is_trained = False
+    def __init__(self, model_path: str = MODEL_PATH, registry=None):
+        self.model_path = model_path
+        # With a ModelRegistry the registry's current version is served instead of model_path
+        self.registry = registry
+        # Predictions keyed by (model generation, rounded feature vector); emptied on every model swap
+        self.prediction_cache = LRUCache(maxsize=PREDICTION_CACHE_SIZE) if PREDICTION_CACHE_SIZE > 0 else None
+        self.state = LoadedModel(RandomForestRegressor(n_estimators=100, random_state=42), StandardScaler())
+        # The artifact is loaded on first use, not at import time
+        self._loaded = False
+        self._checked_at = 0.0
+        self._load_lock = threading.Lock()
+    
+    @property
+    def state(self) -> LoadedModel:
+        return self._state
+    
+    @state.setter
+    def state(self, state: LoadedModel):
+        self._state = state
+        if self.prediction_cache is not None:
+            self.prediction_cache.clear()
+    
+    @property
+    def model(self):
+        return self.state.model
+    
+    @property
+    def scaler(self):
+        return self.state.scaler
+    
+    @property
+    def flat(self):
+        return self.state.flat
+    
+    @property
+    def training_rows(self) -> int:
+        return self.state.training_rows
+    
+    @property
+    def version(self) -> Optional[str]:
+        return self.state.version
+    
+    @property
+    def is_trained(self) -> bool:
+        self.ensure_loaded()
+        return self.state.trained
+    
+    def ensure_loaded(self):
+        """Load the artifact on first use; with a registry, pick up a new current version"""
+        if self._loaded and (self.registry is None or time.time() - self._checked_at < RELOAD_INTERVAL):
+            return
+        # Once something is loaded, a concurrent reload never blocks predictions
+        if not self._load_lock.acquire(blocking=not self._loaded):
+            return
+        try:
+            self._refresh_locked()
+        finally:
+            self._load_lock.release()
+    
+    def refresh(self) -> bool:
+        """Reload if the served artifact changed; the old model keeps serving until the swap"""
+        with self._load_lock:
+            return self._refresh_locked()
+    
+    def _refresh_locked(self) -> bool:
+        self._checked_at = time.time()
+        path, version = self._current_artifact()
+        if self._loaded and version is not None and version == self.state.version:
+            return False
+        loaded = self.load_model(path, version)
+        self._loaded = True
+        return loaded
+    
+    def _current_artifact(self):
+        if self.registry is not None:
+            version = self.registry.current()
+            if version:
+                return self.registry.model_path(version), version
+        return self.model_path, None
+    
+    def register(self, metrics=None, promote: bool = True, state: Optional[LoadedModel] = None) -> str:
+        """Save a model (the in-memory one by default) as a new registry version, promoted by default"""
+        current = self.state
+        version = self.registry.register(self, metrics=metrics, promote=promote, state=state or current)
+        if promote:
+            if state is not None:
+                self.state = replace(state, version=version)
+                self._loaded = True
+            elif self.state is current:
+                self.state = replace(current, version=version)
+        return version
+    
+    def metadata(self):
+        if self.registry is not None and self.state.version:
+            return self.registry.metadata(self.state.version)
+        return read_metadata(self.model_path)
         
     def prepare_features(self, city_data):
         """Extract features from city data"""
-        return np.array([[
-            city_data.population_density,
-            city_data.green_space_area,
-            city_data.green_coverage_percentage,
-            city_data.aqi,
-            city_data.pm25,
-            city_data.pm10,
-            city_data.vehicle_count,
-            city_data.public_transport_usage,
-            city_data.built_up_percentage,
-            city_data.existing_parks,
-            city_data.tree_coverage
-        ]])
+        return feature_vector(city_data)
     
     def train(self, cities_data, scores):
         """Train model on existing city data"""
-        X = []
-        for city in cities_data:
-            X.append(self.prepare_features(city)[0])
+        self.train_matrix(build_feature_matrix(cities_data), scores)
+    
+    def fit(self, X: np.ndarray, scores, params=None) -> LoadedModel:
+        """Fit a new model without touching the one being served.
         
-        X = np.array(X)
-        X_scaled = self.scaler.fit_transform(X)
-        self.model.fit(X_scaled, scores)
-        self.is_trained = True
+        params override the current model's hyperparameters.
+        """
+        model = clone(self.state.model).set_params(**(params or {}))
+        scaler = StandardScaler()
+        X_scaled = scaler.fit_transform(np.asarray(X, dtype=FEATURE_DTYPE))
+        model.fit(X_scaled, np.asarray(scores, dtype=np.float64))
+        return LoadedModel(model, scaler, FlatForest.from_sklearn(model), True, len(X_scaled))
+    
+    def train_matrix(self, X: np.ndarray, scores, params=None):
+        """Train on a prebuilt feature matrix (see build_feature_matrix)"""
+        # Fit fresh copies so requests keep using the current model until the swap
+        self.state = self.fit(X, scores, params)
+        # A lazy load must not replace the model just trained before it is registered
+        self._loaded = True
+        self._checked_at = time.time()
         
     def predict_sustainability(self, city_data):
         """Predict sustainability score using ML"""
         if not self.is_trained:
             return None
         
-        X = self.prepare_features(city_data)
-        X_scaled = self.scaler.transform(X)
-        return self.model.predict(X_scaled)[0]
+        return self.predict_matrix(self.prepare_features(city_data))[0]
+    
+    def predict_many(self, cities):
+        """Predict scores for many cities (CityData, dicts or a DataFrame) with one model call"""
+        if not self.is_trained:
+            return None
+        
+        X = build_feature_matrix(cities)
+        if len(X) == 0:
+            return np.empty(0)
+        return self.predict_matrix(X)
+    
+    def predict_matrix(self, X: np.ndarray, state: Optional[LoadedModel] = None) -> np.ndarray:
+        """Predict a prebuilt feature matrix; rows already scored by the served model come from the cache.
+        
+        Only small batches (the per-request path) use the cache, and they are
+        predicted from the rounded features the cache is keyed on, so a key
+        always maps to one answer. Bulk batches and an explicit state (a
+        candidate under evaluation) bypass it.
+        """
+        cache = self.prediction_cache
+        if state is not None or cache is None or len(X) > PREDICTION_CACHE_MAX_ROWS:
+            return self._predict_uncached(X, state or self.state)
+        state = self.state
+        
+        X = np.asarray(X, dtype=FEATURE_DTYPE)
+        # Adding 0.0 folds -0.0 into 0.0 so equal vectors give equal keys
+        quantized = np.round(X, PREDICTION_CACHE_DECIMALS) + 0.0
+        keys = [(state.generation, row.tobytes()) for row in quantized]
+        predictions = np.array([cache.get(key, np.nan) for key in keys], dtype=np.float64)
+        
+        missing = np.flatnonzero(np.isnan(predictions))
+        if len(missing):
+            predictions[missing] = self._predict_uncached(quantized[missing], state)
+            for i in missing:
+                cache.set(keys[i], float(predictions[i]))
+        return predictions
+    
+    def _predict_uncached(self, X: np.ndarray, state: LoadedModel) -> np.ndarray:
+        """Flat forest for small batches, sklearn's compiled traversal for big ones"""
+        X_scaled = state.scaler.transform(X)
+        if ML_ENGINE == 'flat' and state.flat is not None and len(X_scaled) <= FLAT_MAX_ROWS:
+            return state.flat.predict(X_scaled)
+        return state.model.predict(X_scaled)
     
     def get_feature_importance(self):
         """Get which features matter most"""
         if not self.is_trained:
             return None
         
-        features = ['Population Density', 'Green Space Area', 'Green Coverage %', 
-                   'AQI', 'PM2.5', 'PM10', 'Vehicle Count', 'Public Transport %',
-                   'Built-up %', 'Parks', 'Tree Coverage']
-        
-        importance = dict(zip(features, self.model.feature_importances_))
+        importance = dict(zip(FEATURE_LABELS, self.model.feature_importances_))
         return sorted(importance.items(), key=lambda x: x[1], reverse=True)
     
-    def save_model(self, path='data/ml_model.pkl'):
-        """Save trained model"""
-        with open(path, 'wb') as f:
-            pickle.dump({'model': self.model, 'scaler': self.scaler, 'trained': self.is_trained}, f)
+    def get_permutation_importance(self):
+        """Permutation importances stored with the served version, or None"""
+        if not self.is_trained or self.state.explanations is None:
+            return None
+        return self.state.explanations.importances()
+    
+    def with_explanations(self, state: LoadedModel, X: np.ndarray, y, names=None, n_jobs: int = -1) -> LoadedModel:
+        """Attach explanations for the training rows; they are saved with the version"""
+        if names is None:
+            names = [str(i) for i in range(len(X))]
+        return replace(state, explanations=ModelExplanations.compute(state, X, y, names, n_jobs))
     
-    def load_model(self, path='data/ml_model.pkl'):
-        """Load trained model"""
-        if os.path.exists(path):
+    def explain(self, city) -> Optional[dict]:
+        """Per-feature breakdown of a city's ML score (CityData or dict).
+        
+        Cities seen at training time are served from the stored explanations;
+        others are decomposed on the spot over the flattened forest.
+        """
+        if not self.is_trained:
+            return None
+        state = self.state
+        if state.flat is None:
+            return None
+        
+        X = self.prepare_features(city)
+        name = city.get('name') if isinstance(city, Mapping) else getattr(city, 'name', None)
+        contributions = state.explanations.lookup(name, X[0]) if state.explanations is not None else None
+        cached = contributions is not None
+        if cached:
+            bias = state.explanations.bias
+        else:
+            bias, contributions = state.flat.contributions(state.scaler.transform(X))
+            contributions = contributions[0]
+        
+        breakdown = [
+            {'feature': label, 'column': col, 'value': float(value), 'contribution': float(contribution)}
+            for label, col, value, contribution in zip(FEATURE_LABELS, FEATURE_COLUMNS, X[0], contributions)
+        ]
+        breakdown.sort(key=lambda item: abs(item['contribution']), reverse=True)
+        return {
+            'name': name,
+            'prediction': float(bias + np.sum(contributions)),
+            'bias': float(bias),
+            'contributions': breakdown,
+            'version': state.version,
+            'cached': cached
+        }
+    
+    def save_model(self, path=None, extra=None, state: Optional[LoadedModel] = None):
+        """Save trained model (uncompressed joblib, so arrays can be memory-mapped) plus a JSON metadata sidecar"""
+        path = path or self.model_path
+        state = state or self.state
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        joblib.dump({'model': state.model, 'scaler': state.scaler, 'trained': state.trained}, tmp_path)
+        
+        metadata = {
+            'format': 'joblib',
+            'trained': state.trained,
+            'model_type': type(state.model).__name__,
+            'n_estimators': getattr(state.model, 'n_estimators', None),
+            'feature_columns': FEATURE_COLUMNS,
+            'feature_dtype': np.dtype(FEATURE_DTYPE).name,
+            'training_rows': state.training_rows,
+            'sklearn_version': sklearn.__version__,
+            'saved_at': datetime.now(timezone.utc).isoformat(),
+            **(extra or {})
+        }
+        meta_tmp = f"{metadata_path(path)}.tmp{os.getpid()}"
+        with open(meta_tmp, 'w') as f:
+            json.dump(metadata, f, indent=2)
+        
+        # Flattened arrays are stamped with saved_at so a stale directory is never paired with a newer model
+        flat_tmp = f"{flat_path(path)}.tmp{os.getpid()}"
+        if state.flat is not None:
+            state.flat.info['saved_at'] = metadata['saved_at']
+            state.flat.save(flat_tmp)
+        
+        if state.explanations is not None:
+            state.explanations.save(explanations_path(path))
+        
+        # Readers never see a half-written artifact
+        os.replace(tmp_path, path)
+        os.replace(meta_tmp, metadata_path(path))
+        if state.flat is not None:
+            old = f"{flat_path(path)}.old{os.getpid()}"
+            if os.path.isdir(flat_path(path)):
+                os.replace(flat_path(path), old)
+            os.replace(flat_tmp, flat_path(path))
+            shutil.rmtree(old, ignore_errors=True)
+    
+    def load_model(self, path=None, version=None):
+        """Load a trained model and swap it in as one unit"""
+        path = path or self.model_path
+        if version is None and not os.path.exists(path) and os.path.exists(LEGACY_MODEL_PATH):
+            path = LEGACY_MODEL_PATH
+        if not os.path.exists(path):
+            return False
+        
+        if path.endswith('.pkl'):
             with open(path, 'rb') as f:
                 data = pickle.load(f)
-                self.model = data['model']
-                self.scaler = data['scaler']
-                self.is_trained = data['trained']
-            return True
-        return False
+        else:
+            # numpy payloads are mapped read-only from the page cache instead of copied
+            data = joblib.load(path, mmap_mode='r')
+        metadata = read_metadata(path) or {}
+        flat = self._load_flat(path, metadata, data['model']) if data['trained'] else None
+        self.state = LoadedModel(data['model'], data['scaler'], flat, data['trained'],
+                                 metadata.get('training_rows', 0), version, self._load_explanations(path))
+        self._loaded = True
+        return True
+    
+    def _load_explanations(self, path):
+        if not os.path.exists(explanations_path(path)):
+            return None
+        try:
+            return ModelExplanations.load(explanations_path(path))
+        except Exception as e:
+            print(f"Could not load model explanations: {e}")
+            return None
+    
+    def _load_flat(self, path, metadata, model):
+        """Memory-map the saved flat arrays, or flatten the loaded model when they are missing or stale"""
+        directory = flat_path(path)
+        try:
+            if os.path.isdir(directory):
+                flat = FlatForest.load(directory)
+                if flat.info.get('saved_at') == metadata.get('saved_at'):
+                    return flat
+            return FlatForest.from_sklearn(model)
+        except Exception as e:
+            print(f"Could not load flattened model: {e}")
+            return None
@@ -0,0 +1,145 @@
+import fcntl
+import json
+import os
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+REGISTRY_DIR = os.getenv('MODEL_REGISTRY_DIR', 'data/models')
+ARTIFACT_NAME = 'model.joblib'
+
+class ModelRegistry:
+    """Immutable, versioned model artifacts with an atomically swapped "current" pointer.
+
+    Layout under root:
+        versions/<version>/model.joblib, model.meta.json, model_flat/
+        CURRENT        id of the version workers should serve
+        history.jsonl  one line per promotion or rollback
+
+    A version directory is written in staging/ and renamed into versions/
+    in one step, and CURRENT is replaced with os.replace, so a reader sees
+    either the old model or the new one, never a partial write.
+    """
+
+    def __init__(self, root: str = REGISTRY_DIR):
+        self.root = root
+        self.versions_dir = os.path.join(root, 'versions')
+        self.pointer_path = os.path.join(root, 'CURRENT')
+        self.history_path = os.path.join(root, 'history.jsonl')
+
+    @contextmanager
+    def _locked(self):
+        """Serialize writers (promotions, rollbacks) across processes"""
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def version_dir(self, version: str) -> str:
+        return os.path.join(self.versions_dir, version)
+
+    def model_path(self, version: str) -> str:
+        return os.path.join(self.version_dir(version), ARTIFACT_NAME)
+
+    def exists(self, version: str) -> bool:
+        return bool(version) and os.path.exists(self.model_path(version))
+
+    def current(self) -> Optional[str]:
+        """Version currently promoted, or None for an empty registry"""
+        try:
+            with open(self.pointer_path) as f:
+                version = f.read().strip()
+        except FileNotFoundError:
+            return None
+        return version if self.exists(version) else None
+
+    def metadata(self, version: str) -> Optional[Dict]:
+        path = os.path.join(self.version_dir(version), 'model.meta.json')
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def versions(self) -> List[Dict]:
+        """Metadata of every registered version, oldest first"""
+        if not os.path.isdir(self.versions_dir):
+            return []
+        current = self.current()
+        result = []
+        for version in sorted(os.listdir(self.versions_dir)):
+            metadata = self.metadata(version)
+            if metadata is not None:
+                result.append(dict(metadata, version=version, current=version == current))
+        return result
+
+    def register(self, predictor, metrics: Optional[Dict] = None, promote: bool = False, state=None) -> str:
+        """Write the predictor's model (or the given LoadedModel) as a new immutable version and return its id"""
+        version = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:6]}"
+        staging = os.path.join(self.root, 'staging', version)
+        os.makedirs(staging)
+        predictor.save_model(os.path.join(staging, ARTIFACT_NAME),
+                             extra={'version': version, 'metrics': metrics or {}}, state=state)
+
+        for dirpath, _, filenames in os.walk(staging):
+            for name in filenames:
+                os.chmod(os.path.join(dirpath, name), 0o444)
+        os.makedirs(self.versions_dir, exist_ok=True)
+        os.replace(staging, self.version_dir(version))
+
+        if promote:
+            self.promote(version)
+        return version
+
+    def _history(self) -> List[Dict]:
+        if not os.path.exists(self.history_path):
+            return []
+        with open(self.history_path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def _promotion_stack(self) -> List[str]:
+        """Versions in promotion order, with rolled-back ones popped off"""
+        stack = []
+        for entry in self._history():
+            if entry.get('action') == 'rollback':
+                if stack:
+                    stack.pop()
+            else:
+                stack.append(entry['version'])
+        return stack
+
+    def _set_current(self, version: str, action: str) -> Optional[str]:
+        previous = self.current()
+        tmp_path = f"{self.pointer_path}.tmp{os.getpid()}"
+        with open(tmp_path, 'w') as f:
+            f.write(version)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.pointer_path)
+        with open(self.history_path, 'a') as f:
+            f.write(json.dumps({
+                'action': action,
+                'version': version,
+                'previous': previous,
+                'at': datetime.now(timezone.utc).isoformat()
+            }) + '\n')
+        return previous
+
+    def promote(self, version: str) -> Optional[str]:
+        """Make version current; returns the version it replaced"""
+        if not self.exists(version):
+            raise ValueError(f"Unknown model version: {version}")
+        with self._locked():
+            return self._set_current(version, 'promote')
+
+    def rollback(self) -> Optional[str]:
+        """Return to the version promoted before the current one; returns it, or None if there is none"""
+        with self._locked():
+            stack = self._promotion_stack()
+            if len(stack) < 2 or not self.exists(stack[-2]):
+                return None
+            self._set_current(stack[-2], 'rollback')
+            return stack[-2]
@@ -1,6 +1,6 @@
 import pandas as pd
 import numpy as np
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
 from typing import Dict, List, Tuple, Optional
 
 @dataclass
@@ -25,6 +25,39 @@ class CityData:
     latitude: Optional[float] = None
     longitude: Optional[float] = None
 
+# Python's round() is correctly rounded; np.round is not, and the two disagree in
+# the last digit often enough to matter when batch scores must equal analyze_city
+_py_round = np.frompyfunc(round, 2, 1)
+
+def _round(values: np.ndarray, digits: int) -> np.ndarray:
+    return _py_round(values, digits).astype(float)
+
+# Defaults used when a batch record omits a CityData field
+CITY_FIELD_DEFAULTS = {
+    f.name: (None if f.name in ('latitude', 'longitude')
+             else 'Medium' if f.name == 'traffic_density'
+             else '' if f.name == 'name' else 0)
+    for f in fields(CityData)
+}
+
+def city_fields(row: Dict) -> Dict:
+    """Only the CityData fields of a stored city row (drops id, timestamps, row_hash and any later columns)"""
+    return {key: value for key, value in row.items() if key in CITY_FIELD_DEFAULTS}
+
+def cities_to_frame(cities) -> pd.DataFrame:
+    """Columnar view of CityData objects, dicts or a DataFrame, with every CityData field present"""
+    if isinstance(cities, pd.DataFrame):
+        df = cities.copy()
+    else:
+        df = pd.DataFrame([c.__dict__ if isinstance(c, CityData) else dict(c) for c in cities])
+    for col, default in CITY_FIELD_DEFAULTS.items():
+        if col not in df.columns:
+            df[col] = default
+    numeric = [col for col, default in CITY_FIELD_DEFAULTS.items() if isinstance(default, int)]
+    df[numeric] = df[numeric].apply(pd.to_numeric, errors='coerce').fillna(0)
+    df['traffic_density'] = df['traffic_density'].fillna('Medium').astype(str)
+    return df
+
 @dataclass
 class SustainabilityMetrics:
     green_space_per_capita: float
@@ -170,6 +203,54 @@ class CityAnalyzer:
         
         return round(total_score, 2), components
     
+    def score_frame(self, cities) -> np.ndarray:
+        """Vectorized calculate_sustainability_score totals for many cities at once"""
+        df = cities_to_frame(cities)
+        population = df['population'].to_numpy(dtype=float)
+        aqi = df['aqi'].to_numpy(dtype=float)
+        built_up = df['built_up_percentage'].to_numpy(dtype=float)
+        transport = df['public_transport_usage'].to_numpy(dtype=float)
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            green_per_capita = df['green_space_area'].to_numpy(dtype=float) * 1000000 / population
+        green_ratio = green_per_capita / self.WHO_GREEN_STANDARD
+        green_score = np.select(
+            [green_ratio >= 1.5, green_ratio >= 1.0, green_ratio >= 0.5],
+            [100, 80 + (green_ratio - 1.0) * 40, 40 + (green_ratio - 0.5) * 80],
+            green_ratio * 80
+        )
+        
+        aqi_score = np.select(
+            [aqi <= 50, aqi <= 100, aqi <= 150, aqi <= 200],
+            [100, 80 - ((aqi - 50) * 0.6), 50 - ((aqi - 100) * 0.4), 30 - ((aqi - 150) * 0.3)],
+            np.maximum(0, 15 - ((aqi - 200) * 0.1))
+        )
+        
+        traffic_multiplier = df['traffic_density'].map(self.traffic_multipliers).fillna(1.5).to_numpy(dtype=float)
+        density_factor = np.minimum(2.0, df['population_density'].to_numpy(dtype=float) / self.MAX_ACCEPTABLE_DENSITY)
+        traffic_score = np.maximum(0, 100 - (traffic_multiplier * 25) - (density_factor * 15))
+        
+        land_score = np.select(
+            [built_up <= 60, built_up <= 80],
+            [100 - (built_up * 0.5), 70 - ((built_up - 60) * 1.5)],
+            np.maximum(0, 40 - ((built_up - 80) * 2))
+        )
+        
+        transport_score = np.select(
+            [transport >= 50, transport >= 30, transport >= 15],
+            [100, 80 + ((transport - 30) * 1.0), 50 + ((transport - 15) * 2.0)],
+            transport * 3.33
+        )
+        
+        total = (
+            _round(green_score, 1) * 0.30 +
+            _round(aqi_score, 1) * 0.25 +
+            _round(traffic_score, 1) * 0.20 +
+            _round(land_score, 1) * 0.15 +
+            _round(transport_score, 1) * 0.10
+        )
+        return _round(total, 2)
+    
     def categorize_sustainability(self, score: float) -> Tuple[str, str]:
         """Enhanced categorization with badge system"""
         if score >= self.sustainability_thresholds['excellent']:
@@ -0,0 +1,300 @@
+import copy
+import json
+import math
+import os
+import zlib
+import numpy as np
+import pandas as pd
+from dataclasses import replace
+from typing import Callable, Dict, List, Optional
+from joblib import Parallel, delayed
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+from sklearn.model_selection import KFold, ParameterSampler, train_test_split
+from backend.flat_forest import FlatForest
+
+# Cores used by the search and final fits (-1 = all)
+TRAIN_N_JOBS = int(os.getenv('TRAIN_N_JOBS', '-1'))
+# Hyperparameter candidates sampled from SEARCH_SPACE per training run
+SEARCH_ITERATIONS = int(os.getenv('TRAIN_SEARCH_ITERATIONS', '12'))
+CV_FOLDS = 5
+HOLDOUT_FRACTION = 0.2
+MIN_TRAINING_ROWS = 5
+
+# Arrays of the last training run, used by incremental updates
+TRAINING_CACHE_PATH = os.getenv('TRAINING_CACHE_PATH', 'data/training_cache.npz')
+# Drift policy: an incremental update turns into a full refit when, since the
+# last full fit, more than this fraction of rows was added/changed/removed ...
+DRIFT_MAX_CHURN = float(os.getenv('TRAIN_DRIFT_MAX_CHURN', '0.3'))
+# ... or any feature mean moved by more than this many baseline standard deviations
+DRIFT_MAX_SHIFT = float(os.getenv('TRAIN_DRIFT_MAX_SHIFT', '0.5'))
+# Fewest trees replaced by an incremental update
+WARM_START_MIN_TREES = 10
+
+SEARCH_SPACE = {
+    'n_estimators': [50, 100, 200],
+    'max_depth': [None, 8, 12, 20],
+    'min_samples_leaf': [1, 2, 4],
+    'max_features': [1.0, 0.6, 'sqrt']
+}
+
+def regression_metrics(y_true, y_pred) -> Dict:
+    y_true = np.asarray(y_true, dtype=np.float64)
+    y_pred = np.asarray(y_pred, dtype=np.float64)
+    return {
+        'mae': float(mean_absolute_error(y_true, y_pred)),
+        'rmse': float(np.sqrt(mean_squared_error(y_true, y_pred))),
+        # R^2 is undefined for a single holdout row
+        'r2': float(r2_score(y_true, y_pred)) if len(y_true) > 1 else None,
+        'rows': int(len(y_true))
+    }
+
+def _fold_mae(candidate: int, params: Dict, X, y, train, test):
+    model = RandomForestRegressor(random_state=42, n_jobs=1, **params)
+    model.fit(X[train], y[train])
+    return candidate, mean_absolute_error(y[test], model.predict(X[test]))
+
+def search_hyperparameters(X, y, space: Dict = SEARCH_SPACE, n_iter: int = SEARCH_ITERATIONS,
+                           cv: int = CV_FOLDS, n_jobs: int = TRAIN_N_JOBS,
+                           progress: Optional[Callable[[float], None]] = None):
+    """Cross-validated random search; every (candidate, fold) fit runs in parallel.
+
+    Returns (best_params, best_cv_mae, per-candidate results).
+    """
+    candidates: List[Dict] = list(ParameterSampler(space, n_iter=n_iter, random_state=42))
+    folds = list(KFold(n_splits=min(cv, len(X)), shuffle=True, random_state=42).split(X))
+    total = len(candidates) * len(folds)
+
+    scores = [[] for _ in candidates]
+    tasks = (delayed(_fold_mae)(i, params, X, y, train, test)
+             for i, params in enumerate(candidates) for train, test in folds)
+    for done, (i, mae) in enumerate(Parallel(n_jobs=n_jobs, return_as='generator')(tasks), 1):
+        scores[i].append(mae)
+        if progress:
+            progress(done / total)
+
+    results = [{'params': params, 'cv_mae': float(np.mean(s))} for params, s in zip(candidates, scores)]
+    best = min(results, key=lambda r: r['cv_mae'])
+    return best['params'], best['cv_mae'], results
+
+def train_and_register(predictor, X: np.ndarray, y: np.ndarray,
+                       report: Optional[Callable[[float, str], None]] = None, names=None) -> Dict:
+    """Search, evaluate on a holdout split, and register the winner only if it beats the current model.
+
+    The served model was fit on rows that may now be in the holdout, so its
+    configuration is refit on the candidate's training rows and both are
+    scored on the same unseen holdout; a tie goes to the candidate, which
+    has seen the newer data. A winner is refit on all rows before it is
+    registered and promoted; the recorded metrics are those of the holdout
+    evaluation.
+    """
+    report = report or (lambda progress, message='': None)
+    X = np.asarray(X, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if len(X) < MIN_TRAINING_ROWS:
+        raise ValueError(f"Need at least {MIN_TRAINING_ROWS} cities to train")
+
+    rows = np.arange(len(X))
+    train, holdout = train_test_split(rows, test_size=HOLDOUT_FRACTION, random_state=42)
+
+    report(0.02, 'Searching hyperparameters')
+    params, cv_mae, results = search_hyperparameters(
+        X[train], y[train], progress=lambda done: report(0.02 + 0.78 * done, 'Searching hyperparameters')
+    )
+    params = dict(params, n_jobs=TRAIN_N_JOBS)
+
+    report(0.82, 'Evaluating on holdout')
+    candidate = predictor.fit(X[train], y[train], params)
+    metrics = regression_metrics(y[holdout], predictor.predict_matrix(X[holdout], state=candidate))
+    metrics['cv_mae'] = cv_mae
+
+    current_metrics = None
+    if predictor.is_trained and hasattr(predictor.model, 'get_params'):
+        report(0.85, 'Evaluating current model configuration on holdout')
+        # fit clones the served model, so this is the same configuration on the candidate's rows
+        baseline = predictor.fit(X[train], y[train], {'n_jobs': TRAIN_N_JOBS})
+        current_params = {k: v for k, v in predictor.model.get_params().items() if k in SEARCH_SPACE}
+        current_metrics = regression_metrics(y[holdout], predictor.predict_matrix(X[holdout], state=baseline))
+        current_metrics['params'] = current_params
+    beats_current = current_metrics is None or metrics['mae'] <= current_metrics['mae']
+
+    result = {
+        'rows': int(len(X)),
+        'best_params': {k: v for k, v in params.items() if k != 'n_jobs'},
+        'metrics': metrics,
+        'current_version': predictor.version,
+        'current_metrics': current_metrics,
+        'candidates': results,
+        'registered': False,
+        'version': None
+    }
+    if not beats_current:
+        report(1.0, 'Current model is better; nothing registered')
+        return result
+
+    report(0.88, 'Refitting on all rows')
+    final = predictor.fit(X, y, params)
+    report(0.94, 'Computing explanations')
+    final = predictor.with_explanations(final, X, y, names, n_jobs=TRAIN_N_JOBS)
+    result['version'] = predictor.register(
+        metrics=dict(metrics, best_params=result['best_params']), promote=True, state=final
+    )
+    result['registered'] = True
+    report(1.0, f"Registered {result['version']}")
+    return result
+
+class TrainingSetCache:
+    """Feature matrix, targets and city names of the model being served, in one .npz file.
+
+    Also carries the drift baseline (feature means/stds at the last full
+    fit), churn accumulated since then, the model version the arrays belong
+    to, and the newest updated_at already folded in.
+    """
+
+    def __init__(self, path: str = TRAINING_CACHE_PATH):
+        self.path = path
+
+    def load(self) -> Optional[Dict]:
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                cached = {key: data[key] for key in ('names', 'X', 'y', 'baseline_mean', 'baseline_std')}
+                cached.update(json.loads(str(data['meta'])))
+            return cached
+        except Exception as e:
+            print(f"Could not read training cache: {e}")
+            return None
+
+    def save(self, names, X, y, baseline_mean, baseline_std, **meta):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self.path}.tmp{os.getpid()}.npz"
+        np.savez(tmp_path, names=np.asarray(names, dtype=str), X=np.asarray(X, dtype=np.float64),
+                 y=np.asarray(y, dtype=np.float64), baseline_mean=baseline_mean,
+                 baseline_std=baseline_std, meta=np.asarray(json.dumps(meta, default=str)))
+        os.replace(tmp_path, self.path)
+
+    def save_full(self, names, X, y, version: Optional[str], synced_at=None):
+        """Snapshot after a full fit: resets the drift baseline and churn"""
+        X = np.asarray(X, dtype=np.float64)
+        self.save(names, X, y, X.mean(axis=0), X.std(axis=0), version=version, churn=0.0,
+                  baseline_rows=int(len(X)), synced_at=synced_at)
+
+def merge_rows(cached: Dict, names, X, y, live_names=None):
+    """Fold changed rows into the cached arrays by city name.
+
+    Rows whose features and target are unchanged are not counted; names
+    missing from live_names (when given) are dropped. Returns
+    (names, X, y, added, changed, removed).
+    """
+    names = np.asarray(names, dtype=str)
+    X = np.asarray(X, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    cached_names, cached_X, cached_y = cached['names'], cached['X'].copy(), cached['y'].copy()
+
+    pos = pd.Index(cached_names).get_indexer(names)
+    known = pos >= 0
+    differs = np.zeros(len(names), dtype=bool)
+    differs[known] = ((cached_X[pos[known]] != X[known]).any(axis=1) | (cached_y[pos[known]] != y[known]))
+    cached_X[pos[known & differs]] = X[known & differs]
+    cached_y[pos[known & differs]] = y[known & differs]
+
+    merged_names = np.concatenate([cached_names, names[~known]])
+    merged_X = np.vstack([cached_X, X[~known]])
+    merged_y = np.concatenate([cached_y, y[~known]])
+
+    removed = 0
+    if live_names is not None:
+        keep = pd.Index(np.asarray(live_names, dtype=str)).get_indexer(merged_names) >= 0
+        removed = int((~keep).sum())
+        merged_names, merged_X, merged_y = merged_names[keep], merged_X[keep], merged_y[keep]
+    return merged_names, merged_X, merged_y, int((~known).sum()), int(differs.sum()), removed
+
+def incremental_update(predictor, cache: TrainingSetCache, names, X, y, live_names=None,
+                       synced_at=None, report: Optional[Callable[[float, str], None]] = None) -> Dict:
+    """Refresh the served forest with new/changed rows instead of retraining it.
+
+    Replaces the oldest trees with warm-started trees fit on the merged
+    arrays. As in train_and_register, the update is first fit without a
+    holdout taken from the added/changed rows and must score at least as
+    well as the served model on it; only then is it refit on all rows, registered and promoted
+    (registered says which). Returns a result with mode 'full_required'
+    (and a reason) when there is no usable cache or the drift policy asks
+    for a full refit.
+    """
+    report = report or (lambda progress, message='': None)
+    cached = cache.load()
+    model = predictor.model if predictor.is_trained else None
+    if cached is None or not hasattr(model, 'estimators_'):
+        return {'mode': 'full_required', 'reason': 'no cached training set or trained forest'}
+    if cached.get('version') != predictor.version:
+        return {'mode': 'full_required', 'reason': 'cached training set belongs to another model version'}
+
+    report(0.1, 'Merging changed rows')
+    merged_names, merged_X, merged_y, added, changed, removed = merge_rows(cached, names, X, y, live_names)
+    touched = added + changed + removed
+    if touched == 0:
+        return {'mode': 'up_to_date', 'version': predictor.version, 'rows': int(len(merged_X))}
+
+    churn = cached.get('churn', 0.0) + touched / max(cached.get('baseline_rows', 1), 1)
+    std = np.where(cached['baseline_std'] > 0, cached['baseline_std'], 1.0)
+    shift = float(np.max(np.abs(merged_X.mean(axis=0) - cached['baseline_mean']) / std))
+    drift = {'churn': round(churn, 4), 'mean_shift': round(shift, 4)}
+    if churn > DRIFT_MAX_CHURN or shift > DRIFT_MAX_SHIFT:
+        return {'mode': 'full_required', 'reason': 'drift threshold exceeded', 'drift': drift}
+
+    n_trees = len(model.estimators_)
+    n_new = min(n_trees, max(WARM_START_MIN_TREES, math.ceil(n_trees * touched / len(merged_X))))
+    # A fresh seed per update: with a fixed random_state every update would grow the same trees
+    seed = zlib.crc32(str(predictor.version).encode())
+    X_scaled = predictor.scaler.transform(merged_X)
+    # Holdout from the added/changed rows only: the served model has seen every other row as it is now
+    pos = pd.Index(cached['names']).get_indexer(merged_names)
+    fresh = pos < 0
+    fresh[~fresh] = ((cached['X'][pos[~fresh]] != merged_X[~fresh]).any(axis=1)
+                     | (cached['y'][pos[~fresh]] != merged_y[~fresh]))
+    fresh_rows = np.flatnonzero(fresh)
+    if len(fresh_rows) == 0:
+        return {'mode': 'full_required', 'reason': 'only removals; no new rows to evaluate an update on'}
+    holdout = np.random.default_rng(seed).choice(
+        fresh_rows, max(1, math.ceil(len(fresh_rows) * HOLDOUT_FRACTION)), replace=False)
+    train = np.setdiff1d(np.arange(len(merged_X)), holdout)
+
+    report(0.3, 'Evaluating refreshed trees on holdout')
+    candidate = _replace_oldest_trees(model, X_scaled[train], merged_y[train], n_new, seed)
+    metrics = regression_metrics(merged_y[holdout], candidate.predict(X_scaled[holdout]))
+    current_metrics = regression_metrics(merged_y[holdout], model.predict(X_scaled[holdout]))
+    result = {'mode': 'incremental', 'version': predictor.version, 'rows': int(len(merged_X)), 'added': added,
+              'changed': changed, 'removed': removed, 'trees_replaced': n_new, 'drift': drift,
+              'metrics': metrics, 'current_metrics': current_metrics, 'registered': False}
+    if metrics['mae'] > current_metrics['mae']:
+        report(1.0, 'Current model is better; nothing registered')
+        return result
+
+    report(0.45, 'Refitting trees on all rows')
+    updated = _replace_oldest_trees(model, X_scaled, merged_y, n_new, seed)
+
+    report(0.6, 'Computing explanations')
+    state = replace(predictor.state, model=updated, flat=FlatForest.from_sklearn(updated),
+                    training_rows=int(len(merged_X)), version=None)
+    state = predictor.with_explanations(state, merged_X, merged_y, merged_names, n_jobs=TRAIN_N_JOBS)
+    
+    report(0.8, 'Registering model')
+    version = predictor.register(metrics={**metrics, 'mode': 'incremental', 'added': added, 'changed': changed,
+                                          'removed': removed, 'trees_replaced': n_new, **drift},
+                                 promote=True, state=state)
+    cache.save(merged_names, merged_X, merged_y, cached['baseline_mean'], cached['baseline_std'],
+               version=version, churn=churn, baseline_rows=cached.get('baseline_rows', len(merged_X)),
+               synced_at=synced_at or cached.get('synced_at'))
+    report(1.0, f"Registered {version}")
+    return dict(result, version=version, registered=True)
+
+def _replace_oldest_trees(model, X_scaled: np.ndarray, y: np.ndarray, n_new: int, seed: int):
+    """Copy of the forest with its n_new oldest trees swapped for warm-started ones fit on these rows"""
+    n_trees = len(model.estimators_)
+    updated = copy.deepcopy(model)
+    updated.set_params(warm_start=True, n_estimators=n_trees + n_new, random_state=seed)
+    updated.fit(X_scaled, y)
+    updated.estimators_ = updated.estimators_[n_new:]
+    updated.set_params(warm_start=False, n_estimators=n_trees)
+    return updated
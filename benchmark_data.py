@@ -0,0 +1,76 @@
+"""
+Upload conversion benchmark for EcoPlan
+Compares the old per-row iterrows conversion with the column-wise paths in DataProcessor
+Usage: python benchmark_data.py [rows]
+"""
+
+import sys
+import time
+import numpy as np
+import pandas as pd
+from backend.models import CityAnalyzer, CityData
+from benchmark_ml import synthetic_cities
+from utils.data_processor import DataProcessor
+
+def iterrows_city_data(df):
+    """The conversion DataProcessor.df_to_city_data used before, kept for comparison"""
+    cities = []
+    for _, row in df.iterrows():
+        cities.append(CityData(
+            name=str(row.get('name', '')),
+            area=float(row.get('area', 0)),
+            population=int(row.get('population', 0)),
+            population_density=float(row.get('population_density', 0)),
+            built_up_percentage=float(row.get('built_up_percentage', 0)),
+            green_space_area=float(row.get('green_space_area', 0)),
+            open_land_area=float(row.get('open_land_area', 0)),
+            green_coverage_percentage=float(row.get('green_coverage_percentage', 0)),
+            existing_parks=int(row.get('existing_parks', 0)),
+            tree_coverage=float(row.get('tree_coverage', 0)),
+            aqi=float(row.get('aqi', 0)),
+            pm25=float(row.get('pm25', 0)),
+            pm10=float(row.get('pm10', 0)),
+            co2_estimation=float(row.get('co2_estimation', 0)),
+            traffic_density=str(row.get('traffic_density', 'Medium')),
+            vehicle_count=int(row.get('vehicle_count', 0)),
+            public_transport_usage=float(row.get('public_transport_usage', 0)),
+            latitude=row.get('latitude') if pd.notna(row.get('latitude')) else None,
+            longitude=row.get('longitude') if pd.notna(row.get('longitude')) else None
+        ))
+    return cities
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+def main(rows=100_000):
+    processor = DataProcessor()
+    rng = np.random.default_rng(2)
+    df = synthetic_cities(rows)
+    df['open_land_area'] = df['area'] * rng.uniform(0, 0.2, rows)
+    df['co2_estimation'] = rng.uniform(1, 50, rows)
+    df['traffic_density'] = rng.choice(['Low', 'Medium', 'High'], rows)
+    df['latitude'] = np.where(rng.random(rows) < 0.5, rng.uniform(8, 30, rows), np.nan)
+    df['longitude'] = np.where(rng.random(rows) < 0.5, rng.uniform(70, 90, rows), np.nan)
+    df = processor.clean_data(df)
+
+    old_time, old = timed(lambda: iterrows_city_data(df))
+    new_time, new = timed(lambda: processor.df_to_city_data(df))
+    print(f"Converted {rows:,} rows; objects identical: {old == new}\n")
+
+    analyzer = CityAnalyzer()
+    print(f"{'path':<44} | {'seconds':>8} | {'speedup':>8}")
+    print('-' * 66)
+    for label, seconds in [
+        ('iterrows -> CityData (before)', old_time),
+        ('df_to_city_data -> CityData', new_time),
+        ('df_to_city_records -> dicts', timed(lambda: processor.df_to_city_records(df))[0]),
+        ('df_to_city_rows -> insert tuples', timed(lambda: processor.df_to_city_rows(df))[0]),
+        ('city_frame + score_frame (batch analysis)',
+         timed(lambda: analyzer.score_frame(processor.city_frame(df)))[0]),
+    ]:
+        print(f"{label:<44} | {seconds:>8.3f} | {old_time / seconds:>7.1f}x")
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
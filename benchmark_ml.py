@@ -0,0 +1,63 @@
+"""
+ML prediction benchmark for EcoPlan
+Compares the flattened NumPy forest with sklearn: per-call latency and batch throughput
+Usage: python benchmark_ml.py [training_rows]
+"""
+
+import sys
+import time
+import numpy as np
+import pandas as pd
+from backend.models import CityAnalyzer
+from backend.ml_predictor import MLPredictor, build_feature_matrix
+
+def synthetic_cities(n, seed=0):
+    rng = np.random.default_rng(seed)
+    area = rng.uniform(20, 800, n)
+    population = rng.integers(50_000, 5_000_000, n)
+    green = area * rng.uniform(0.02, 0.4, n)
+    return pd.DataFrame({
+        'name': [f'City {i}' for i in range(n)],
+        'population': population,
+        'area': area,
+        'green_space_area': green,
+        'aqi': rng.uniform(30, 300, n),
+        'pm25': rng.uniform(5, 150, n),
+        'pm10': rng.uniform(10, 250, n),
+        'vehicle_count': rng.integers(10_000, 3_000_000, n),
+        'public_transport_usage': rng.uniform(5, 70, n),
+        'built_up_percentage': rng.uniform(20, 90, n),
+        'existing_parks': rng.integers(0, 200, n),
+        'tree_coverage': rng.uniform(2, 40, n),
+        'population_density': population / area,
+        'green_coverage_percentage': green / area * 100
+    })
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+def main(training_rows=2000):
+    train = synthetic_cities(training_rows)
+    predictor = MLPredictor(model_path='/dev/null')
+    predictor.train_matrix(build_feature_matrix(train), CityAnalyzer().score_frame(train))
+    flat, model = predictor.flat, predictor.model
+    print(f"Trained on {training_rows} rows: {flat.n_trees} trees, {len(flat.feature):,} nodes, depth {flat.max_depth}")
+
+    X = predictor.scaler.transform(build_feature_matrix(synthetic_cities(20_000, seed=1)))
+    same = np.array_equal(flat.predict(X), model.predict(X))
+    print(f"Flat forest matches sklearn exactly on {len(X):,} rows: {same}\n")
+
+    print(f"{'rows':>8} | {'sklearn ms':>11} | {'flat ms':>9} | {'sklearn rows/s':>15} | {'flat rows/s':>12}")
+    print('-' * 68)
+    for n in (1, 10, 100, 512, 2_000, 20_000):
+        repeat = max(3, 2_000 // n)
+        batch = X[:n]
+        sk = timed(lambda: model.predict(batch), repeat)
+        fl = timed(lambda: flat.predict(batch), repeat)
+        print(f"{n:>8,} | {sk * 1e3:>11.3f} | {fl * 1e3:>9.3f} | {n / sk:>15,.0f} | {n / fl:>12,.0f}")
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
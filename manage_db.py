@@ -4,8 +4,15 @@ Run this script to view, backup, or manage the database
 """
 
 from backend.database import Database
+from backend.invalidation import create_bus
 import json
 
+def get_db():
+    """Database that notifies running app workers about the changes made here"""
+    db = Database()
+    db.bus = create_bus(db.get_connection)
+    return db
+
 def view_all_cities():
     db = Database()
     cities = db.get_all_cities()
@@ -57,7 +64,7 @@ def view_city_details(city_name):
             print(f"- [{rec['priority']}] {rec['title']}")
 
 def delete_city(city_name):
-    db = Database()
+    db = get_db()
     confirm = input(f"Are you sure you want to delete '{city_name}'? (yes/no): ")
     if confirm.lower() == 'yes':
         db.delete_city(city_name)
@@ -66,12 +73,10 @@ def delete_city(city_name):
         print("Deletion cancelled.")
 
 def clear_all_data():
-    db = Database()
+    db = get_db()
     confirm = input("Are you sure you want to clear ALL data? (yes/no): ")
     if confirm.lower() == 'yes':
-        cities = db.get_all_cities()
-        for city in cities:
-            db.delete_city(city['name'])
+        db.clear_all_cities()
         print("All data cleared successfully!")
     else:
         print("Operation cancelled.")
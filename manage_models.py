@@ -0,0 +1,64 @@
+"""
+ML Model Registry Utility for EcoPlan
+Usage:
+    python manage_models.py list
+    python manage_models.py promote <version>
+    python manage_models.py rollback
+Running app workers pick up the change without a restart.
+"""
+
+import sys
+from backend.model_registry import ModelRegistry
+from backend.invalidation import MODEL_PROMOTED
+from manage_db import get_db
+
+def notify_workers(version):
+    """Tell running workers to reload now instead of at their next pointer check"""
+    try:
+        get_db().publish(MODEL_PROMOTED, version=version)
+    except Exception as e:
+        print(f"Could not notify workers ({e}); they will reload on their next check")
+
+def list_versions(registry):
+    versions = registry.versions()
+    if not versions:
+        print("No registered model versions")
+        return
+
+    print(f"\n{'='*70}")
+    for meta in versions:
+        marker = '*' if meta['current'] else ' '
+        metrics = ', '.join(f"{k}={v:.4f}" for k, v in (meta.get('metrics') or {}).items()
+                            if isinstance(v, (int, float)))
+        print(f"{marker} {meta['version']} | rows: {meta.get('training_rows', 0):,} | "
+              f"saved: {meta.get('saved_at', '')[:19]} | {metrics}")
+    print(f"{'='*70}")
+
+def main(args):
+    registry = ModelRegistry()
+    command = args[0] if args else 'list'
+
+    if command == 'list':
+        list_versions(registry)
+    elif command == 'promote' and len(args) == 2:
+        try:
+            previous = registry.promote(args[1])
+        except ValueError as e:
+            print(e)
+            return 1
+        print(f"Promoted {args[1]} (was {previous})")
+        notify_workers(args[1])
+    elif command == 'rollback':
+        version = registry.rollback()
+        if not version:
+            print("No earlier version to roll back to")
+            return 1
+        print(f"Rolled back to {version}")
+        notify_workers(version)
+    else:
+        print(__doc__)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
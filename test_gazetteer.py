@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Offline geocoding against the local gazetteer
+Run with: python -m pytest test_gazetteer.py (no database, network or data files needed)
+"""
+
+import numpy as np
+import pandas as pd
+from utils.gazetteer import OfflineGeocoder
+
+GAZETTEER = pd.DataFrame({
+    'name': ['Coimbatore', 'Tiruchirappalli'], 'state': ['Tamil Nadu', 'Tamil Nadu'],
+    'lat': [11.0168, 10.7905], 'lon': [76.9558, 78.7047], 'alt_names': ['Kovai', 'Trichy']
+})
+
+def test_geocode_by_name_alias_and_state():
+    geocoder = OfflineGeocoder(GAZETTEER)
+    assert geocoder.geocode('Coimbatore') == (11.0168, 76.9558)
+    assert geocoder.geocode('trichy', state='Tamil Nadu') == (10.7905, 78.7047)
+    assert geocoder.geocode('Atlantis') is None
+
+def test_missing_data_file_gives_an_empty_gazetteer():
+    geocoder = OfflineGeocoder.load_default(gazetteer_path='/nonexistent.csv', csv_path='/nonexistent.csv')
+    assert len(geocoder) == 0
+    assert geocoder.geocode('Chennai') is None
+    assert geocoder.geocode('Chennai', state='Tamil Nadu') is None
+
+def test_resolve_frame_with_empty_gazetteer_leaves_rows_alone():
+    geocoder = OfflineGeocoder(GAZETTEER.iloc[0:0])
+    df = pd.DataFrame({'name': ['Chennai', 'Madurai'], 'state': ['Tamil Nadu', ''],
+                       'latitude': [np.nan, 9.9252], 'longitude': [np.nan, 78.1198]})
+    assert geocoder.resolve_frame(df, state_col='state') == 0
+    assert df['latitude'].isna().iloc[0] and df['latitude'].iloc[1] == 9.9252
+
+def test_resolve_frame_fills_only_missing_coordinates():
+    geocoder = OfflineGeocoder(GAZETTEER)
+    df = pd.DataFrame({'name': ['Kovai', 'Tiruchirappalli', 'Atlantis'],
+                       'latitude': [np.nan, 1.0, np.nan], 'longitude': [np.nan, 2.0, np.nan]})
+    assert geocoder.resolve_frame(df) == 1
+    assert df['latitude'].tolist()[:2] == [11.0168, 1.0] and np.isnan(df['latitude'].iloc[2])
+
+if __name__ == '__main__':
+    for test in (test_geocode_by_name_alias_and_state, test_missing_data_file_gives_an_empty_gazetteer,
+                 test_resolve_frame_with_empty_gazetteer_leaves_rows_alone,
+                 test_resolve_frame_fills_only_missing_coordinates):
+        test()
+        print(f"{test.__name__}: ok")
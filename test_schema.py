@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Upload validation: per-field and cross-field rules, and how ingest_file applies them
+Row numbers are spreadsheet rows (header is row 1, so the first city is row 2).
+Run with: python -m pytest test_schema.py (no database or server needed)
+"""
+
+import os
+import tempfile
+import pandas as pd
+from utils.data_processor import DataProcessor
+from utils.schema import validate_frame
+
+VALID_CITY = {
+    'name': 'Coimbatore', 'area': 100.0, 'population': 500000, 'population_density': 5000.0,
+    'built_up_percentage': 60.0, 'green_space_area': 10.0, 'open_land_area': 12.0,
+    'green_coverage_percentage': 10.0, 'existing_parks': 40, 'tree_coverage': 11.0, 'aqi': 78.0,
+    'pm25': 31.0, 'pm10': 58.0, 'co2_estimation': 6.2, 'traffic_density': 'Medium',
+    'vehicle_count': 450000, 'public_transport_usage': 28.0, 'latitude': 11.0, 'longitude': 76.9
+}
+
+# (field the error is reported under, changes that break only that rule)
+BROKEN_ROWS = [
+    ('name', {'name': ''}),
+    ('name', {'name': 'x' * 256}),
+    ('area', {'area': 0.0, 'population_density': 0.0, 'green_space_area': 0.0, 'open_land_area': 0.0}),
+    ('population', {'population': 'many'}),
+    ('population', {'population': 1000.5, 'population_density': 0.0}),
+    ('built_up_percentage', {'built_up_percentage': 101.0}),
+    ('existing_parks', {'existing_parks': -1}),
+    ('aqi', {'aqi': 501.0}),
+    ('traffic_density', {'traffic_density': 'Gridlock'}),
+    ('latitude', {'latitude': 91.0}),
+    ('longitude', {'longitude': -181.0}),
+    ('density', {'population_density': 9000.0}),
+    ('green_space_area', {'green_space_area': 150.0}),
+    ('open_land_area', {'open_land_area': 150.0}),
+    ('pm25', {'pm25': 70.0}),
+]
+
+def cities(n, broken=None):
+    """n valid cities with unique names; broken maps a 0-based position to changes for that row"""
+    rows = [dict(VALID_CITY, name=f'City {i}') for i in range(n)]
+    for pos, changes in (broken or {}).items():
+        rows[pos].update(changes)
+    return pd.DataFrame(rows)
+
+def test_valid_rows_pass():
+    report = validate_frame(cities(3))
+    assert report.ok and report.invalid.sum() == 0
+
+def test_each_rule_flags_only_its_row():
+    for field, changes in BROKEN_ROWS:
+        report = validate_frame(cities(4, {2: changes}))
+        row_errors = report.row_errors()
+        assert [entry['row'] for entry in row_errors] == [4], (field, row_errors)
+        assert list(row_errors[0]['errors']) == [field], (field, row_errors)
+
+def test_optional_columns_may_be_absent():
+    report = validate_frame(cities(2).drop(columns=['latitude', 'longitude']))
+    assert report.ok
+
+def test_missing_required_column_invalidates_every_row():
+    report = validate_frame(cities(3).drop(columns=['aqi']))
+    assert report.missing_columns == ['aqi']
+    assert report.invalid.all()
+    assert report.messages()[0] == 'Missing columns: aqi'
+
+def ingest(df, valid_only=False, chunk_rows=5):
+    """Run ingest_file over df saved as CSV; returns (report, names passed to save_chunk)"""
+    saved = []
+
+    def save_chunk(chunk):
+        saved.extend(chunk['name'])
+        return chunk['name'].tolist()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'cities.csv')
+        df.to_csv(path, index=False)
+        report = DataProcessor().ingest_file(path, save_chunk, chunk_rows=chunk_rows, valid_only=valid_only)
+    return report, saved
+
+def test_invalid_row_rejects_its_chunk():
+    report, saved = ingest(cities(10, {7: {'aqi': 900.0}}))
+    assert saved == [f'City {i}' for i in range(5)]
+    assert report['loaded'] == 5 and report['invalid_rows'] == 1 and report['error_chunks'] == 1
+    # Second chunk holds file rows 7-11; position 7 is row 9
+    assert report['errors'][0]['rows'] == '7-11'
+    assert [entry['row'] for entry in report['errors'][0]['row_errors']] == [9]
+
+def test_valid_only_loads_the_rest_of_the_chunk():
+    report, saved = ingest(cities(10, {7: {'aqi': 900.0}}), valid_only=True)
+    assert 'City 7' not in saved and len(saved) == 9
+    assert report['loaded'] == 9 and report['invalid_rows'] == 1
+    assert report['errors'][0]['row_errors'][0]['errors'] == {'aqi': ['must be <= 500']}
+
+def test_missing_column_stops_the_file():
+    report, saved = ingest(cities(10).drop(columns=['pm10']), valid_only=True)
+    assert saved == [] and report['fatal']
+    assert report['chunks'] == 1 and report['loaded'] == 0
+    assert report['errors'][0]['errors'] == ['Missing columns: pm10']
+
+if __name__ == '__main__':
+    for test in (test_valid_rows_pass, test_each_rule_flags_only_its_row, test_optional_columns_may_be_absent,
+                 test_missing_required_column_invalidates_every_row, test_invalid_row_rejects_its_chunk,
+                 test_valid_only_loads_the_rest_of_the_chunk, test_missing_column_stops_the_file):
+        test()
+        print(f"{test.__name__}: ok")
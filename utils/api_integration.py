@@ -1,21 +1,478 @@
 import requests
 import os
-from typing import Dict, Optional, Tuple
+import pandas as pd
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from typing import Dict, List, Optional, Tuple
 from dotenv import load_dotenv
+from utils.cache import LRUCache
+from utils.gazetteer import OfflineGeocoder
 
 load_dotenv()
 
-class GeoapifyAPI:
+class DeadlineExceeded(requests.exceptions.Timeout):
+    """The overall time budget for a request ran out"""
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """The provider's circuit breaker is open; the call was not attempted"""
+
+class Deadline:
+    """Overall time budget shared by every HTTP call made for one request"""
+    
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds
+    
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+    
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+class CircuitBreaker:
+    """Fail fast on a provider after repeated failures or slow calls.
+    
+    closed: calls flow; failure_threshold consecutive bad calls (errors, or
+    calls slower than slow_call_seconds) open the circuit.
+    open: calls are rejected until reset_timeout has passed.
+    half_open: one probe call is let through; success closes, failure reopens.
+    """
+    
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+    
+    def __init__(self, name: str, failure_threshold: int = 5, slow_call_seconds: float = 3.0,
+                 reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self.times_opened = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+    
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+    
+    def record(self, healthy: bool, elapsed: float):
+        with self._lock:
+            if healthy and elapsed < self.slow_call_seconds:
+                self.state = self.CLOSED
+                self.failures = 0
+                return
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.times_opened += 1
+                    print(f"Circuit opened for {self.name}")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+    
+    def stats(self) -> Dict:
+        return {
+            'state': self.state,
+            'consecutive_failures': self.failures,
+            'rejected': self.rejected,
+            'times_opened': self.times_opened
+        }
+
+class HTTPClient:
+    """Pooled keep-alive HTTP client with bounded jittered retries and per-endpoint metrics"""
+    
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+    
+    def __init__(self, pool_size: int = 20, max_retries: int = 2, backoff: float = 0.2,
+                 max_backoff: float = 2.0, timeout: float = 5.0, budget: float = 10.0):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.budget = budget
+        
+        self.session = requests.Session()
+        # Retries are handled here so they can respect the deadline
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        
+        self._metrics: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+    
+    def get(self, url: str, params: Optional[Dict] = None, endpoint: Optional[str] = None,
+            timeout: Optional[float] = None, deadline: Optional[Deadline] = None,
+            breaker: Optional[CircuitBreaker] = None) -> requests.Response:
+        """GET with retries; raises the last error once retries or the deadline run out"""
+        endpoint = endpoint or url
+        deadline = deadline or Deadline(self.budget)
+        timeout = timeout or self.timeout
+        started = time.monotonic()
+        retries = 0
+        
+        if breaker is not None and not breaker.allow():
+            raise CircuitOpenError(f"Circuit open for {breaker.name}")
+        
+        while True:
+            remaining = deadline.remaining()
+            if remaining <= 0:
+                self._record(endpoint, started, retries, ok=False, breaker=breaker)
+                raise DeadlineExceeded(f"Deadline exceeded for {endpoint}")
+            
+            error = None
+            try:
+                response = self.session.get(url, params=params, timeout=min(timeout, remaining))
+                if response.status_code not in self.RETRY_STATUSES or retries >= self.max_retries:
+                    self._record(endpoint, started, retries, ok=response.ok, breaker=breaker,
+                                 healthy=response.status_code not in self.RETRY_STATUSES)
+                    return response
+                error = requests.exceptions.HTTPError(f"{response.status_code} from {endpoint}", response=response)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                error = e
+            except BaseException:
+                # Any other failure must still settle the call, or a half-open breaker keeps its probe forever
+                self._record(endpoint, started, retries, ok=False, breaker=breaker)
+                raise
+            
+            # Full jitter keeps concurrent retries from synchronising
+            delay = random.uniform(0, min(self.max_backoff, self.backoff * (2 ** retries)))
+            if retries >= self.max_retries or delay >= deadline.remaining():
+                self._record(endpoint, started, retries, ok=False, breaker=breaker)
+                raise error
+            time.sleep(delay)
+            retries += 1
+    
+    def _record(self, endpoint: str, started: float, retries: int, ok: bool,
+                breaker: Optional[CircuitBreaker] = None, healthy: Optional[bool] = None):
+        elapsed = time.monotonic() - started
+        if breaker is not None:
+            # 4xx answers are the caller's problem, not a sign the provider is down
+            breaker.record(ok if healthy is None else healthy, elapsed)
+        elapsed_ms = elapsed * 1000
+        with self._lock:
+            m = self._metrics.setdefault(endpoint, {
+                'calls': 0, 'errors': 0, 'retries': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                'recent_ms': deque(maxlen=512)
+            })
+            m['calls'] += 1
+            m['errors'] += 0 if ok else 1
+            m['retries'] += retries
+            m['total_ms'] += elapsed_ms
+            m['max_ms'] = max(m['max_ms'], elapsed_ms)
+            m['recent_ms'].append(elapsed_ms)
+    
+    def metrics(self) -> Dict[str, Dict]:
+        """Per-endpoint call counts and latency percentiles (recent window)"""
+        result = {}
+        with self._lock:
+            for endpoint, m in self._metrics.items():
+                recent = sorted(m['recent_ms'])
+                result[endpoint] = {
+                    'calls': m['calls'],
+                    'errors': m['errors'],
+                    'retries': m['retries'],
+                    'avg_ms': round(m['total_ms'] / m['calls'], 2) if m['calls'] else 0.0,
+                    'p50_ms': round(recent[len(recent) // 2], 2) if recent else 0.0,
+                    'p95_ms': round(recent[min(len(recent) - 1, int(len(recent) * 0.95))], 2) if recent else 0.0,
+                    'max_ms': round(m['max_ms'], 2)
+                }
+        return result
+
+# One pool per process, shared by every provider
+http_client = HTTPClient()
+
+class SingleFlight:
+    """Collapse concurrent calls for the same key into one execution"""
+    
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+    
     def __init__(self):
+        self._calls: Dict = {}
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.coalesced = 0
+    
+    def do(self, key, fn, timeout: Optional[float] = None):
+        """Run fn() once per key at a time; followers wait up to timeout for the leader's result"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+                self.executed += 1
+            else:
+                self.coalesced += 1
+        
+        if not leader:
+            if not call.done.wait(timeout):
+                raise DeadlineExceeded(f"Timed out waiting for in-flight lookup of {key}")
+            if call.error is not None:
+                raise call.error
+            return call.result
+        
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+class TokenBucket:
+    """Token-bucket rate limiter: `rate` tokens per second, up to `burst` banked"""
+    
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def _take(self) -> float:
+        """Take a token if available; otherwise return seconds until one is"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+    
+    def acquire(self, wait: float = 0.0) -> bool:
+        """Take a token, waiting at most `wait` seconds for one"""
+        give_up_at = time.monotonic() + wait
+        while True:
+            delay = self._take()
+            if delay == 0.0:
+                return True
+            if time.monotonic() + delay > give_up_at:
+                return False
+            time.sleep(delay)
+
+class ProviderGuard:
+    """Per-provider single-flight coalescing and rate limiting, with counters"""
+    
+    def __init__(self, name: str, rate: float, burst: int, breaker: Optional[CircuitBreaker] = None):
+        self.name = name
+        self.flight = SingleFlight()
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = breaker or CircuitBreaker(name)
+        # Counters are bumped from request and backfill threads alike
+        self._lock = threading.Lock()
+        self.throttled = 0
+        self.stale_served = 0
+    
+    def run(self, key, fn, deadline: Optional[Deadline] = None):
+        return self.flight.do((self.name, key), fn, timeout=deadline.remaining() if deadline else None)
+    
+    def acquire(self, wait: float = 0.0, deadline: Optional[Deadline] = None) -> bool:
+        if deadline is not None:
+            wait = min(wait, deadline.remaining())
+        if self.bucket.acquire(wait):
+            return True
+        with self._lock:
+            self.throttled += 1
+        return False
+    
+    def record_stale(self):
+        """Count a stale cached answer served in place of a live call"""
+        with self._lock:
+            self.stale_served += 1
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            throttled, stale_served = self.throttled, self.stale_served
+        return {
+            'executed': self.flight.executed,
+            'coalesced': self.flight.coalesced,
+            'throttled': throttled,
+            'stale_served': stale_served,
+            'rate_per_sec': self.bucket.rate,
+            'burst': self.bucket.burst,
+            'circuit': self.breaker.stats()
+        }
+
+# Shared by every client in the process so limits hold per worker, not per object
+geoapify_guard = ProviderGuard('geoapify', rate=float(os.getenv('GEOAPIFY_RATE', '5')),
+                               burst=int(os.getenv('GEOAPIFY_BURST', '10')))
+openweather_guard = ProviderGuard('openweather', rate=float(os.getenv('OPENWEATHER_RATE', '1')),
+                                  burst=int(os.getenv('OPENWEATHER_BURST', '10')))
+
+class GeocodeCache:
+    """Two-level geocode cache: in-process LRU in front of the geocode_cache table.
+
+    Negative results (the provider found nothing) are cached with a shorter
+    TTL so typos are not re-queried on every request.
+    """
+    
+    def __init__(self, db=None, maxsize: int = 4096, ttl: float = 30 * 86400,
+                 negative_ttl: float = 86400):
+        self.db = db
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.memory = LRUCache(maxsize=maxsize)
+    
+    @staticmethod
+    def normalize(city_name: str) -> str:
+        return ' '.join(str(city_name).lower().split())
+    
+    def get(self, city_name: str) -> Tuple[bool, Optional[Tuple[float, float]]]:
+        """Return (hit, coords); coords is None on a negative hit"""
+        key = self.normalize(city_name)
+        entry = self.memory.get(key)
+        if entry is not None:
+            return True, entry[0]
+        
+        if self.db is None:
+            return False, None
+        
+        row = self.db.get_geocode(key)
+        if not row:
+            return False, None
+        
+        ttl = self.ttl if row['found'] else self.negative_ttl
+        remaining = ttl - float(row['age'] or 0)
+        if remaining <= 0:
+            return False, None
+        
+        coords = (row['latitude'], row['longitude']) if row['found'] else None
+        self.memory.set(key, (coords,), ttl=remaining)
+        return True, coords
+    
+    def get_stale(self, city_name: str) -> Optional[Tuple[float, float]]:
+        """Coordinates from an expired in-memory entry, if any"""
+        entry = self.memory.get_stale(self.normalize(city_name))
+        return entry[0] if entry is not None else None
+    
+    def put(self, city_name: str, coords: Optional[Tuple[float, float]]):
+        key = self.normalize(city_name)
+        # Wrapped in a tuple so a cached negative result is distinguishable from a miss
+        self.memory.set(key, (coords,), ttl=self.ttl if coords else self.negative_ttl)
+        if self.db is not None:
+            self.db.save_geocode(key, coords)
+
+class PollutionCache:
+    """Air pollution readings keyed by grid cell and hour bucket.
+
+    OpenWeather data changes hourly and is spatially coarse, so every lookup
+    within the same cell (cell_size degrees, ~5 km by default) during the
+    same hour shares one reading. The optional db tier shares readings
+    across workers and restarts.
+    """
+    
+    def __init__(self, db=None, cell_size: float = 0.05, window: int = 3600, maxsize: int = 4096):
+        self.db = db
+        self.cell_size = cell_size
+        self.window = window
+        self.memory = LRUCache(maxsize=maxsize)
+    
+    def key(self, lat: float, lon: float, now: Optional[float] = None) -> Tuple[int, int, int]:
+        now = time.time() if now is None else now
+        return (int(round(float(lat) / self.cell_size)), int(round(float(lon) / self.cell_size)),
+                int(now // self.window))
+    
+    def get(self, lat: float, lon: float) -> Optional[Dict]:
+        key = self.key(lat, lon)
+        data = self.memory.get(key)
+        if data is not None or self.db is None:
+            return data
+        
+        data = self.db.get_pollution(*key)
+        if data is not None:
+            self.memory.set(key, data, ttl=self._remaining(key))
+        return data
+    
+    def get_stale(self, lat: float, lon: float) -> Optional[Dict]:
+        """Reading from this cell's current or previous hour, if still in memory"""
+        cell_lat, cell_lon, bucket = self.key(lat, lon)
+        for key in ((cell_lat, cell_lon, bucket), (cell_lat, cell_lon, bucket - 1)):
+            data = self.memory.get_stale(key)
+            if data is not None:
+                return data
+        return None
+    
+    def put(self, lat: float, lon: float, data: Dict):
+        key = self.key(lat, lon)
+        self.memory.set(key, data, ttl=self._remaining(key))
+        if self.db is not None:
+            self.db.save_pollution(*key, data)
+    
+    def _remaining(self, key: Tuple[int, int, int]) -> float:
+        return max(1.0, (key[2] + 1) * self.window - time.time())
+
+class GeoapifyAPI:
+    def __init__(self, cache: Optional[GeocodeCache] = None, http: Optional[HTTPClient] = None,
+                 guard: Optional[ProviderGuard] = None):
         self.api_key = os.getenv('GEOAPIFY_API_KEY')
         self.base_url = "https://api.geoapify.com/v1"
+        self.cache = cache
+        self.http = http or http_client
+        self.guard = guard or geoapify_guard
+    
+    def has_valid_key(self) -> bool:
+        return bool(self.api_key) and self.api_key != 'your_geoapify_api_key_here'
     
-    def geocode_city(self, city_name: str) -> Optional[Tuple[float, float]]:
-        """Get latitude and longitude for a city"""
-        if not self.api_key or self.api_key == 'your_geoapify_api_key_here':
+    def geocode_city(self, city_name: str, deadline: Optional[Deadline] = None,
+                     throttle_wait: float = 0.0) -> Optional[Tuple[float, float]]:
+        """Get latitude and longitude for a city.
+        
+        When the rate limit is exhausted this waits up to throttle_wait seconds
+        for quota, then falls back to stale cached coordinates or None.
+        """
+        if self.cache is not None:
+            hit, coords = self.cache.get(city_name)
+            if hit:
+                return coords
+        
+        if not self.has_valid_key():
             print("No valid Geoapify API key found")
             return None
-            
+        
+        def lookup():
+            if not self.guard.acquire(throttle_wait, deadline):
+                return self._stale_coordinates(city_name)
+            coords, definitive = self._fetch_coordinates(city_name, deadline)
+            # Transport errors are not cached; "no such place" is
+            if definitive and self.cache is not None:
+                self.cache.put(city_name, coords)
+            return coords
+        
+        try:
+            return self.guard.run(GeocodeCache.normalize(city_name), lookup, deadline)
+        except DeadlineExceeded:
+            return self._stale_coordinates(city_name)
+    
+    def _stale_coordinates(self, city_name: str) -> Optional[Tuple[float, float]]:
+        coords = self.cache.get_stale(city_name) if self.cache is not None else None
+        if coords is not None:
+            self.guard.record_stale()
+        return coords
+    
+    def _fetch_coordinates(self, city_name: str, deadline: Optional[Deadline] = None) -> Tuple[Optional[Tuple[float, float]], bool]:
+        """Query Geoapify; returns (coords, definitive)"""
         url = f"{self.base_url}/geocode/search"
         params = {
             'text': city_name,
@@ -26,7 +483,8 @@ class GeoapifyAPI:
         
         try:
             print(f"Geocoding request for: {city_name}")
-            response = requests.get(url, params=params, timeout=10)
+            response = self.http.get(url, params=params, endpoint='geoapify.geocode',
+                                     timeout=10, deadline=deadline, breaker=self.guard.breaker)
             response.raise_for_status()
             
             # Handle response encoding properly
@@ -43,32 +501,113 @@ class GeoapifyAPI:
                 
                 if lat is not None and lon is not None:
                     print(f"Found coordinates for {city_name}: {lat}, {lon}")
-                    return float(lat), float(lon)
+                    return (float(lat), float(lon)), True
                 else:
                     print(f"Coordinates missing in result for {city_name}")
-                    return None
+                    return None, True
             else:
                 print(f"No results found for {city_name}")
-                return None
+                return None, True
                 
         except requests.exceptions.RequestException as e:
             print(f"Request error for {city_name}: {str(e)}")
-            return None
+            return None, False
         except Exception as e:
             print(f"Geocoding error for {city_name}: {str(e)}")
-            return None
+            return None, False
+    
+    def autocomplete(self, query: str, limit: int = 5, deadline: Optional[Deadline] = None) -> List[Dict]:
+        """City suggestions in India for a partial name"""
+        if not self.has_valid_key() or not self.guard.acquire(deadline=deadline):
+            return []
+        
+        url = f"{self.base_url}/geocode/autocomplete"
+        params = {
+            'text': query,
+            'apiKey': self.api_key,
+            'limit': limit,
+            'type': 'city',
+            'filter': 'countrycode:in',
+            'format': 'json'
+        }
+        
+        try:
+            response = self.http.get(url, params=params, endpoint='geoapify.autocomplete',
+                                     timeout=5, deadline=deadline, breaker=self.guard.breaker)
+            if response.status_code != 200:
+                return []
+            data = response.json()
+        except Exception as e:
+            print(f"City suggestions error: {e}")
+            return []
+        
+        suggestions = []
+        for result in data.get('results') or []:
+            city_name = result.get('city') or result.get('name', '')
+            state = result.get('state', '')
+            country = result.get('country', '')
+            
+            # Only show India cities
+            if city_name and country == 'India':
+                display_name = city_name
+                if state:
+                    display_name += f", {state}"
+                suggestions.append({
+                    'city': city_name,
+                    'state': state,
+                    'display': display_name,
+                    'lat': result.get('lat'),
+                    'lon': result.get('lon')
+                })
+        return suggestions
 
 class OpenWeatherAPI:
-    def __init__(self):
+    def __init__(self, cache: Optional[PollutionCache] = None, http: Optional[HTTPClient] = None,
+                 guard: Optional[ProviderGuard] = None):
         self.api_key = os.getenv('OPENWEATHER_API_KEY')
         self.base_url = "http://api.openweathermap.org/data/2.5"
+        self.cache = cache
+        self.http = http or http_client
+        self.guard = guard or openweather_guard
+    
+    def has_valid_key(self) -> bool:
+        return bool(self.api_key) and self.api_key != 'your_openweather_api_key_here'
     
-    def get_air_pollution(self, lat: float, lon: float) -> Optional[Dict]:
-        """Get current air pollution data"""
-        if not self.api_key or self.api_key == 'your_openweather_api_key_here':
+    def get_air_pollution(self, lat: float, lon: float, deadline: Optional[Deadline] = None,
+                          throttle_wait: float = 0.0) -> Optional[Dict]:
+        """Get current air pollution data (stale reading or None when rate limited)"""
+        if self.cache is not None:
+            cached = self.cache.get(lat, lon)
+            if cached is not None:
+                return dict(cached)
+        
+        if not self.has_valid_key():
             print("No valid OpenWeather API key found")
             return None
-            
+        
+        def lookup():
+            if not self.guard.acquire(throttle_wait, deadline):
+                return self._stale_reading(lat, lon)
+            result = self._fetch_air_pollution(lat, lon, deadline)
+            if result is not None and self.cache is not None:
+                self.cache.put(lat, lon, result)
+            return result
+        
+        # Nearby lookups share a cache cell, so they can share the in-flight call too
+        key = self.cache.key(lat, lon) if self.cache is not None else (round(lat, 4), round(lon, 4))
+        try:
+            result = self.guard.run(key, lookup, deadline)
+        except DeadlineExceeded:
+            result = self._stale_reading(lat, lon)
+        return dict(result) if result is not None else None
+    
+    def _stale_reading(self, lat: float, lon: float) -> Optional[Dict]:
+        data = self.cache.get_stale(lat, lon) if self.cache is not None else None
+        if data is not None:
+            self.guard.record_stale()
+        return data
+    
+    def _fetch_air_pollution(self, lat: float, lon: float, deadline: Optional[Deadline] = None) -> Optional[Dict]:
         url = f"{self.base_url}/air_pollution"
         params = {
             'lat': lat,
@@ -78,7 +617,8 @@ class OpenWeatherAPI:
         
         try:
             print(f"Fetching air pollution for coordinates: {lat}, {lon}")
-            response = requests.get(url, params=params, timeout=10)
+            response = self.http.get(url, params=params, endpoint='openweather.air_pollution',
+                                     timeout=10, deadline=deadline, breaker=self.guard.breaker)
             response.raise_for_status()
             data = response.json()
             
@@ -102,24 +642,40 @@ class OpenWeatherAPI:
             return None
 
 class DataEnricher:
-    def __init__(self):
-        self.geo_api = GeoapifyAPI()
-        self.weather_api = OpenWeatherAPI()
+    # Total time one city's enrichment may spend on the network
+    ENRICH_BUDGET = 8.0
     
-    def enrich_city_data(self, city_data: Dict) -> Dict:
+    def __init__(self, db=None, max_workers: Optional[int] = None,
+                 offline_geocoder: Optional[OfflineGeocoder] = None):
+        self.max_workers = max_workers or int(os.getenv('ENRICH_CONCURRENCY', '8'))
+        # Local gazetteer is always tried before any network geocoding
+        self.offline_geocoder = offline_geocoder or OfflineGeocoder.load_default()
+        self.geocode_cache = GeocodeCache(db)
+        self.pollution_cache = PollutionCache(db)
+        self.geo_api = GeoapifyAPI(cache=self.geocode_cache)
+        self.weather_api = OpenWeatherAPI(cache=self.pollution_cache)
+    
+    def enrich_city_data(self, city_data: Dict, deadline: Optional[Deadline] = None,
+                         throttle_wait: float = 0.0) -> Dict:
         """Enrich city data with external API data"""
         city_name = city_data.get('name', '')
         print(f"Enriching data for: {city_name}")
+        deadline = deadline or Deadline(self.ENRICH_BUDGET)
         
-        # Get coordinates first
-        coords = self.geo_api.geocode_city(city_name)
+        # Get coordinates first (keep ones we already have, then gazetteer, then Geoapify)
+        if city_data.get('latitude') and city_data.get('longitude'):
+            coords = (city_data['latitude'], city_data['longitude'])
+        else:
+            coords = (self.offline_geocoder.geocode(city_name, city_data.get('state'))
+                      or self.geo_api.geocode_city(city_name, deadline=deadline, throttle_wait=throttle_wait))
         if coords:
             city_data['latitude'] = coords[0]
             city_data['longitude'] = coords[1]
             print(f"Coordinates found: {coords[0]}, {coords[1]}")
             
             # Get air pollution data using coordinates
-            pollution_data = self.weather_api.get_air_pollution(coords[0], coords[1])
+            pollution_data = self.weather_api.get_air_pollution(coords[0], coords[1], deadline=deadline,
+                                                                throttle_wait=throttle_wait)
             if pollution_data:
                 print(f"Pollution data fetched: AQI={pollution_data['aqi']}")
                 # Update with real data if not provided or if provided data is 0
@@ -134,4 +690,112 @@ class DataEnricher:
         else:
             print(f"No coordinates found for {city_name}")
         
-        return city_data
\ No newline at end of file
+        return city_data
+    
+    @staticmethod
+    def needs_enrichment(city_data: Dict) -> bool:
+        return (not city_data.get('latitude') or not city_data.get('longitude')
+                or not city_data.get('aqi'))
+    
+    def resolve_coordinates(self, df: pd.DataFrame) -> int:
+        """Fill missing coordinates in a whole frame from the gazetteer (no network)"""
+        return self.offline_geocoder.resolve_frame(df, state_col='state' if 'state' in df.columns else None)
+    
+    def enrich_many(self, cities: List[Dict], max_workers: Optional[int] = None) -> List[Dict]:
+        """Enrich cities concurrently; returns the dicts that needed enrichment (updated in place)"""
+        pending = [city for city in cities if self.needs_enrichment(city)]
+        if not pending:
+            return []
+        
+        def enrich(city_data):
+            try:
+                # Bulk work queues for quota instead of falling back, within its own budget
+                return self.enrich_city_data(city_data, throttle_wait=self.ENRICH_BUDGET)
+            except Exception as e:
+                print(f"Enrichment failed for {city_data.get('name')}: {e}")
+                return city_data
+        
+        workers = min(max_workers or self.max_workers, len(pending))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='enrich') as pool:
+            return list(pool.map(enrich, pending))
+
+class EnrichmentBackfill:
+    """Background worker that enriches saved cities off the request path.
+    
+    Cities are queued with submit(); the worker drains the queue in batches,
+    enriches them with enrich_many and writes the results back with one bulk
+    UPDATE. A periodic sweep re-queues any city still missing coordinates or
+    AQI, which also recovers work lost to a restart.
+    """
+    
+    def __init__(self, enricher: DataEnricher, db, batch_size: int = 50,
+                 sweep_interval: float = 600.0):
+        self.enricher = enricher
+        self.db = db
+        self.batch_size = batch_size
+        self.sweep_interval = sweep_interval
+        self._queue: "deque[Dict]" = deque()
+        self._queued_names = set()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.processed = 0
+    
+    def submit(self, city_data: Dict):
+        name = city_data.get('name')
+        if not name or not self.enricher.needs_enrichment(city_data) or name in self._queued_names:
+            return
+        self._queued_names.add(name)
+        self._queue.append(dict(city_data))
+        self._wakeup.set()
+    
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='enrichment-backfill', daemon=True)
+        self._thread.start()
+    
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+    
+    def sweep(self):
+        """Queue every city that is still missing enrichment"""
+        for city in self.db.get_cities_missing_enrichment():
+            self.submit(city)
+    
+    def _run(self):
+        # Stagger the first sweep so workers booting together do not all sweep at once
+        next_sweep = time.monotonic() + random.uniform(5, 30)
+        while not self._stop.is_set():
+            if time.monotonic() >= next_sweep:
+                try:
+                    self.sweep()
+                except Exception as e:
+                    print(f"Backfill sweep error: {e}")
+                next_sweep = time.monotonic() + self.sweep_interval
+            
+            if not self._queue:
+                self._wakeup.wait(max(0.0, next_sweep - time.monotonic()))
+                self._wakeup.clear()
+                continue
+            
+            batch = []
+            while self._queue and len(batch) < self.batch_size:
+                city = self._queue.popleft()
+                self._queued_names.discard(city.get('name'))
+                batch.append(city)
+            try:
+                enriched = self.enricher.enrich_many(batch)
+                if enriched:
+                    self.db.update_city_enrichment_bulk(enriched)
+                self.processed += len(batch)
+            except Exception as e:
+                print(f"Backfill error: {e}")
+    
+    def stats(self) -> Dict:
+        return {'queued': len(self._queue), 'processed': self.processed}
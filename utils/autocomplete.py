@@ -0,0 +1,137 @@
+import threading
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Optional
+import pandas as pd
+from utils.gazetteer import normalize_name, phonetic_key, read_gazetteer
+
+class CityIndex:
+    """In-memory city autocomplete over sorted key arrays.
+
+    Lookups try, in order: a prefix of the normalized name, a prefix of the
+    phonetic key (romanisation variants), and only when both come up empty,
+    names within a small edit distance of the phonetic query.
+    """
+
+    # Prefix matches examined per tier before ranking
+    SCAN_LIMIT = 200
+
+    def __init__(self):
+        self.entries: List[Dict] = []
+        self._by_name: Dict[str, int] = {}
+        self._exact: List[tuple] = []
+        self._phonetic: List[tuple] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def contains(self, name: str) -> bool:
+        key = normalize_name(name)
+        pos = bisect_left(self._exact, (key,))
+        return pos < len(self._exact) and self._exact[pos][0] == key
+
+    def add(self, city: str, state: str = '', lat=None, lon=None, aliases: Iterable[str] = ()):
+        """Add a place (no-op for a name/state already present, except filling in coordinates)"""
+        city = str(city).strip()
+        if not city:
+            return
+        state = '' if state is None or pd.isna(state) else str(state).strip()
+        ident = f"{normalize_name(city)}|{normalize_name(state)}"
+        lat = None if lat is None or pd.isna(lat) else float(lat)
+        lon = None if lon is None or pd.isna(lon) else float(lon)
+
+        with self._lock:
+            idx = self._by_name.get(ident)
+            if idx is not None:
+                entry = self.entries[idx]
+                if entry['lat'] is None and lat is not None:
+                    entry['lat'], entry['lon'] = lat, lon
+                return
+
+            idx = len(self.entries)
+            self._by_name[ident] = idx
+            self.entries.append({
+                'city': city,
+                'display': f"{city}, {state}" if state else city,
+                'lat': lat,
+                'lon': lon
+            })
+            for name in [city, *aliases]:
+                if not name:
+                    continue
+                insort(self._exact, (normalize_name(name), idx))
+                insort(self._phonetic, (phonetic_key(name), idx))
+
+    def add_frame(self, df: pd.DataFrame, state: str = ''):
+        """Add rows from a frame with name and lat/lon (or latitude/longitude) columns"""
+        lat_col = 'lat' if 'lat' in df.columns else 'latitude'
+        lon_col = 'lon' if 'lon' in df.columns else 'longitude'
+        for row in df.to_dict('records'):
+            aliases = str(row.get('alt_names') or '').split('|') if row.get('alt_names') else ()
+            self.add(row['name'], row.get('state') or state, row.get(lat_col), row.get(lon_col), aliases)
+
+    @staticmethod
+    def _prefix_range(keys: List[tuple], prefix: str) -> range:
+        lo = bisect_left(keys, (prefix,))
+        hi = bisect_left(keys, (prefix + '\uffff',))
+        return range(lo, hi)
+
+    @staticmethod
+    def _within_distance(query: str, key: str, limit: int) -> bool:
+        """Edit distance between query and the same-length prefix of key is <= limit"""
+        best = None
+        for candidate in {key[:len(query) - 1], key[:len(query)], key[:len(query) + 1]}:
+            prev = list(range(len(candidate) + 1))
+            for i, qc in enumerate(query, 1):
+                cur = [i] + [0] * len(candidate)
+                for j, kc in enumerate(candidate, 1):
+                    cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (qc != kc))
+                prev = cur
+            best = prev[-1] if best is None else min(best, prev[-1])
+        return best <= limit
+
+    def search(self, query: str, limit: int = 5) -> List[Dict]:
+        exact_q = normalize_name(query)
+        phonetic_q = phonetic_key(query)
+        if not exact_q:
+            return []
+
+        found: Dict[int, tuple] = {}
+        with self._lock:
+            for tier, keys, q in ((0, self._exact, exact_q), (1, self._phonetic, phonetic_q)):
+                for pos in self._prefix_range(keys, q)[:self.SCAN_LIMIT]:
+                    key, idx = keys[pos]
+                    if idx not in found:
+                        found[idx] = (tier, len(key), key)
+                if len(found) >= limit:
+                    break
+
+            if not found and len(phonetic_q) >= 3:
+                # Typo fallback, limited to keys sharing the first letter
+                max_edits = 1 if len(phonetic_q) <= 5 else 2
+                for pos in self._prefix_range(self._phonetic, phonetic_q[0]):
+                    key, idx = self._phonetic[pos]
+                    if idx not in found and self._within_distance(phonetic_q, key, max_edits):
+                        found[idx] = (2, len(key), key)
+
+            ranked = sorted(found.items(), key=lambda item: item[1])[:limit]
+            return [dict(self.entries[idx]) for idx, _ in ranked]
+
+def build_city_index(db=None, csv_path: str = 'data/tamilnadu_cities.csv',
+                     gazetteer_path: Optional[str] = None) -> CityIndex:
+    """Index the cities table, the bundled Tamil Nadu CSV and the optional gazetteer"""
+    index = CityIndex()
+
+    try:
+        index.add_frame(pd.read_csv(csv_path, usecols=['name', 'latitude', 'longitude']), state='Tamil Nadu')
+    except Exception as e:
+        print(f"Could not index {csv_path}: {e}")
+
+    index.add_frame(read_gazetteer(gazetteer_path))
+
+    # User-added cities have no state; skip the ones a file already covers
+    if db is not None:
+        for city in db.get_all_cities():
+            if not index.contains(city['name']):
+                index.add(city['name'], '', city.get('latitude'), city.get('longitude'))
+    return index
@@ -1,7 +1,29 @@
+import hashlib
+import os
+from dataclasses import fields
 import pandas as pd
 import numpy as np
-from typing import Dict, List, Optional
+from typing import Callable, Dict, Iterator, List, Optional
 from backend.models import CityData
+from utils.schema import CITY_SCHEMA, ValidationReport, validate_frame
+
+# Rows per chunk when streaming an upload through validate -> clean -> save
+CHUNK_ROWS = int(os.getenv('UPLOAD_CHUNK_ROWS', '10000'))
+CITY_FIELDS = [f.name for f in fields(CityData)]
+INT_FIELDS = {'population', 'existing_parks', 'vehicle_count'}
+
+# Columnar formats, read batch by batch through pyarrow
+PARQUET_EXTENSIONS = ('.parquet', '.pq')
+ARROW_EXTENSIONS = ('.arrow', '.feather', '.ipc')
+UPLOAD_EXTENSIONS = ('.csv', '.xlsx', '.xls') + PARQUET_EXTENSIONS + ARROW_EXTENSIONS
+
+# Block size for copying and hashing an upload stream
+HASH_BLOCK_BYTES = 1 << 20
+
+# City names kept in an ingest report (the count covers all of them)
+REPORT_NAMES_LIMIT = 1000
+# Failed chunks described in an ingest report (error_chunks counts all of them)
+REPORT_ERRORS_LIMIT = 50
 
 class DataProcessor:
     def __init__(self):
@@ -15,32 +37,22 @@ class DataProcessor:
     
     def validate_data(self, df: pd.DataFrame) -> List[str]:
         """Validate uploaded data and return list of errors"""
-        errors = []
-        
-        # Check required columns
-        missing_cols = [col for col in self.required_columns if col not in df.columns]
-        if missing_cols:
-            errors.append(f"Missing columns: {', '.join(missing_cols)}")
-        
-        # Check data types and ranges
-        if 'population' in df.columns:
-            if df['population'].dtype not in ['int64', 'float64'] or (df['population'] < 0).any():
-                errors.append("Population must be positive numbers")
-        
-        if 'area' in df.columns:
-            if df['area'].dtype not in ['int64', 'float64'] or (df['area'] <= 0).any():
-                errors.append("Area must be positive numbers")
-        
-        if 'green_coverage_percentage' in df.columns:
-            if (df['green_coverage_percentage'] < 0).any() or (df['green_coverage_percentage'] > 100).any():
-                errors.append("Green coverage percentage must be between 0-100")
-        
-        return errors
+        return validate_frame(df).messages()
+    
+    def validate_rows(self, df: pd.DataFrame, first_row: int = 2) -> ValidationReport:
+        """Per-row, per-field validation against CITY_SCHEMA (see utils.schema)"""
+        return validate_frame(df, first_row=first_row)
     
     def clean_data(self, df: pd.DataFrame) -> pd.DataFrame:
         """Clean and preprocess the data"""
         df_clean = df.copy()
         
+        # Columns the schema types as numbers, even if a bad cell left them as text
+        for rule in CITY_SCHEMA:
+            if (rule.kind in ('int', 'float') and rule.name in df_clean.columns
+                    and not pd.api.types.is_numeric_dtype(df_clean[rule.name])):
+                df_clean[rule.name] = pd.to_numeric(df_clean[rule.name], errors='coerce')
+        
         # Handle missing values
         numeric_columns = df_clean.select_dtypes(include=[np.number]).columns
         df_clean[numeric_columns] = df_clean[numeric_columns].fillna(0)
@@ -57,49 +69,323 @@ class DataProcessor:
         
         return df_clean
     
-    def load_from_file(self, file_path: str) -> pd.DataFrame:
-        """Load data from CSV or Excel file"""
+    def load_from_file(self, file_path: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """Load data from a CSV, Excel, Parquet or Arrow IPC file.
+        
+        columns projects the read onto those columns (ones the file lacks are
+        ignored); Parquet and Arrow skip the other columns entirely.
+        """
         try:
+            if file_path.endswith(PARQUET_EXTENSIONS + ARROW_EXTENSIONS):
+                return self._read_columnar(file_path, columns).to_pandas()
             if file_path.endswith('.csv'):
-                df = pd.read_csv(file_path)
+                df = pd.read_csv(file_path, usecols=self._usecols(columns))
             elif file_path.endswith(('.xlsx', '.xls')):
-                df = pd.read_excel(file_path)
+                df = pd.read_excel(file_path, usecols=self._usecols(columns))
             else:
-                raise ValueError("Unsupported file format. Use CSV or Excel files.")
+                raise ValueError("Unsupported file format. Use CSV, Excel, Parquet or Arrow files.")
             
             return df
         except Exception as e:
             raise Exception(f"Error loading file: {str(e)}")
     
+    def iter_file_chunks(self, file_path: str, chunk_rows: int = CHUNK_ROWS,
+                         columns: Optional[List[str]] = None) -> Iterator[pd.DataFrame]:
+        """Yield the file as DataFrames of at most chunk_rows rows, without loading it whole.
+        
+        Each chunk's attrs['progress'] is the fraction of the file consumed so
+        far (bytes read for CSV, rows for the other formats), or None when the
+        total is unknown.
+        """
+        if file_path.endswith(PARQUET_EXTENSIONS + ARROW_EXTENSIONS):
+            total, done = self.count_rows(file_path), 0
+            for batch in self.iter_record_batches(file_path, chunk_rows, columns):
+                done += batch.num_rows
+                yield self._with_progress(batch.to_pandas(), done / total if total else None)
+        elif file_path.endswith('.csv'):
+            size = os.path.getsize(file_path)
+            with open(file_path, 'rb') as f:
+                with pd.read_csv(f, chunksize=chunk_rows, usecols=self._usecols(columns)) as reader:
+                    for chunk in reader:
+                        # The parser reads ahead in blocks, so this is an estimate
+                        yield self._with_progress(chunk, min(f.tell() / size, 1.0) if size else None)
+        elif file_path.endswith('.xlsx'):
+            for chunk in self._iter_xlsx_chunks(file_path, chunk_rows):
+                yield self._with_progress(chunk[[col for col in chunk.columns if col in columns]] if columns else chunk,
+                                          chunk.attrs.get('progress'))
+        elif file_path.endswith('.xls'):
+            # Legacy .xls has no streaming reader; it is read whole and sliced
+            df = pd.read_excel(file_path, usecols=self._usecols(columns))
+            for start in range(0, len(df), chunk_rows):
+                yield self._with_progress(df.iloc[start:start + chunk_rows], min(start + chunk_rows, len(df)) / len(df))
+        else:
+            raise ValueError("Unsupported file format. Use CSV, Excel, Parquet or Arrow files.")
+    
+    @staticmethod
+    def _with_progress(chunk: pd.DataFrame, progress: Optional[float]) -> pd.DataFrame:
+        chunk.attrs['progress'] = progress
+        return chunk
+    
+    @staticmethod
+    def _usecols(columns: Optional[List[str]]):
+        return (lambda col: col in columns) if columns else None
+    
+    @staticmethod
+    def _projection(schema, columns: Optional[List[str]]) -> Optional[List[str]]:
+        return [col for col in schema.names if col in columns] if columns else None
+    
+    def _read_columnar(self, file_path: str, columns: Optional[List[str]] = None):
+        """Whole Parquet / Arrow IPC file as a pyarrow Table"""
+        import pyarrow.parquet as pq
+        
+        if file_path.endswith(PARQUET_EXTENSIONS):
+            return pq.read_table(file_path, columns=self._projection(pq.read_schema(file_path), columns))
+        table = self._open_ipc(file_path).read_all()
+        projection = self._projection(table.schema, columns)
+        return table.select(projection) if projection is not None else table
+    
+    def _open_ipc(self, file_path: str):
+        """Reader for an Arrow IPC file (also Feather v2), memory-mapped; falls back to the stream format"""
+        import pyarrow as pa
+        
+        source = pa.memory_map(file_path)
+        try:
+            return pa.ipc.open_file(source)
+        except pa.ArrowInvalid:
+            source.seek(0)
+            return pa.ipc.open_stream(source)
+    
+    def iter_record_batches(self, file_path: str, chunk_rows: int = CHUNK_ROWS,
+                            columns: Optional[List[str]] = None) -> Iterator:
+        """Stream a Parquet or Arrow IPC file as pyarrow RecordBatches of at most chunk_rows rows.
+        
+        Parquet is read row group by row group and only the projected column
+        chunks are decoded; IPC batches are memory-mapped and sliced, so
+        neither loads the whole file.
+        """
+        import pyarrow.parquet as pq
+        
+        if file_path.endswith(PARQUET_EXTENSIONS):
+            parquet = pq.ParquetFile(file_path)
+            yield from parquet.iter_batches(batch_size=chunk_rows,
+                                            columns=self._projection(parquet.schema_arrow, columns))
+            return
+        
+        reader = self._open_ipc(file_path)
+        projection = self._projection(reader.schema, columns)
+        batches = (map(reader.get_batch, range(reader.num_record_batches))
+                   if hasattr(reader, 'get_batch') else reader)
+        for batch in batches:
+            if projection is not None:
+                batch = batch.select(projection)
+            for start in range(0, batch.num_rows, chunk_rows):
+                yield batch.slice(start, chunk_rows)
+    
+    def to_columnar(self, df: pd.DataFrame, format: str, row_group_rows: int = CHUNK_ROWS) -> bytes:
+        """Serialize a frame as Parquet ('parquet') or Arrow IPC file ('arrow') bytes, dtypes preserved.
+        
+        Rows are written in groups/batches of row_group_rows so readers can
+        stream the result back with iter_record_batches.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        sink = pa.BufferOutputStream()
+        if format == 'parquet':
+            pq.write_table(table, sink, row_group_size=row_group_rows, compression='zstd')
+        elif format == 'arrow':
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table, max_chunksize=row_group_rows)
+        else:
+            raise ValueError(f"Unsupported columnar format: {format}")
+        return sink.getvalue().to_pybytes()
+    
+    def _iter_xlsx_chunks(self, file_path: str, chunk_rows: int) -> Iterator[pd.DataFrame]:
+        """First worksheet through openpyxl's read-only mode, which parses rows lazily"""
+        from openpyxl import load_workbook
+        
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            rows = workbook.worksheets[0].iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
+            columns = [str(col).strip() if col is not None else f'Unnamed: {i}' for i, col in enumerate(header)]
+            # From the sheet's stored dimensions; absent in some generated files
+            total = (workbook.worksheets[0].max_row or 0) - 1
+            
+            buffer, done = [], 0
+            for row in rows:
+                done += 1
+                # Read-only sheets often report trailing blank rows
+                if all(value is None for value in row):
+                    continue
+                buffer.append(row)
+                if len(buffer) >= chunk_rows:
+                    yield self._with_progress(pd.DataFrame.from_records(buffer, columns=columns),
+                                              min(done / total, 1.0) if total > 0 else None)
+                    buffer = []
+            if buffer:
+                yield self._with_progress(pd.DataFrame.from_records(buffer, columns=columns), 1.0)
+        finally:
+            workbook.close()
+    
+    def ingest_file(self, file_path: str, save_chunk: Callable[[pd.DataFrame], List[str]],
+                    chunk_rows: int = CHUNK_ROWS, valid_only: bool = False,
+                    columns: Optional[List[str]] = None, resume: Optional[Dict] = None,
+                    progress: Optional[Callable[[Dict], None]] = None) -> Dict:
+        """Stream a file through validate -> clean -> save_chunk one chunk at a time.
+        
+        save_chunk receives a cleaned chunk and returns the names it stored.
+        A chunk with invalid rows is reported and skipped, or with valid_only
+        its valid rows are still saved. Missing columns stop the whole file,
+        since every chunk would fail the same way. columns projects the read
+        as in iter_file_chunks.
+        
+        progress(report) is called after every chunk; report['progress'] is
+        the fraction of the file consumed (None if unknown). resume is such a
+        report, or just its counters, from an interrupted run with the same
+        chunk_rows: its chunks are skipped and counting continues from it.
+        """
+        report = {'chunks': 0, 'rows': 0, 'loaded': 0, 'invalid_rows': 0, 'error_chunks': 0,
+                  'names': [], 'errors': []}
+        if resume:
+            report.update(resume, names=list(resume.get('names', [])), errors=list(resume.get('errors', [])))
+        done = report['chunks']
+        for index, chunk in enumerate(self.iter_file_chunks(file_path, chunk_rows, columns)):
+            report['progress'] = chunk.attrs.get('progress')
+            if index < done:
+                continue
+            fatal = not self._ingest_chunk(index, chunk, report, save_chunk, valid_only)
+            if progress:
+                progress(report)
+            if fatal:
+                break
+        return report
+    
+    def _ingest_chunk(self, index: int, chunk: pd.DataFrame, report: Dict,
+                      save_chunk: Callable[[pd.DataFrame], List[str]], valid_only: bool) -> bool:
+        """One ingest_file step, recorded in report; False when the file cannot be loaded at all"""
+        # Spreadsheet row numbers: header is row 1
+        first_row = report['rows'] + 2
+        report['chunks'] += 1
+        report['rows'] += len(chunk)
+        row_range = f"{first_row}-{first_row + len(chunk) - 1}"
+        
+        validation = self.validate_rows(chunk, first_row)
+        if validation.missing_columns:
+            self._add_error(report, {'chunk': index, 'rows': row_range, 'errors': validation.messages()})
+            report['fatal'] = True
+            return False
+        
+        if not validation.ok:
+            invalid = validation.invalid
+            report['invalid_rows'] += int(invalid.sum())
+            self._add_error(report, {'chunk': index, 'rows': row_range, 'errors': validation.messages(),
+                                     'row_errors': validation.row_errors(limit=20)})
+            if not valid_only:
+                return True
+            chunk = chunk[~invalid]
+            if chunk.empty:
+                return True
+        
+        try:
+            names = save_chunk(self.clean_data(chunk))
+        except Exception as e:
+            self._add_error(report, {'chunk': index, 'rows': row_range, 'errors': [str(e)]})
+            return True
+        report['loaded'] += len(names)
+        report['names'].extend(names[:max(REPORT_NAMES_LIMIT - len(report['names']), 0)])
+        return True
+    
+    @staticmethod
+    def _add_error(report: Dict, error: Dict):
+        report['error_chunks'] += 1
+        if len(report['errors']) < REPORT_ERRORS_LIMIT:
+            report['errors'].append(error)
+    
+    def count_rows(self, file_path: str) -> Optional[int]:
+        """Row count from Parquet / Arrow IPC file metadata, without reading data; None otherwise"""
+        if file_path.endswith(PARQUET_EXTENSIONS):
+            import pyarrow.parquet as pq
+            return pq.ParquetFile(file_path).metadata.num_rows
+        if file_path.endswith(ARROW_EXTENSIONS):
+            reader = self._open_ipc(file_path)
+            if hasattr(reader, 'get_batch'):
+                return sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+        return None
+    
+    def save_upload(self, stream, file_path: str) -> str:
+        """Copy an upload stream to file_path block by block; returns the content's SHA-256 hex digest"""
+        digest = hashlib.sha256()
+        with open(file_path, 'wb') as f:
+            for block in iter(lambda: stream.read(HASH_BLOCK_BYTES), b''):
+                digest.update(block)
+                f.write(block)
+        return digest.hexdigest()
+    
+    def row_hashes(self, df: pd.DataFrame) -> List[str]:
+        """Fingerprint of each cleaned row's CityData values (plus state), vectorized.
+        
+        Hashing the typed frame means formatting differences in the source
+        file (3.50 vs 3.5, column order, extra columns) do not count as changes.
+        """
+        typed = self.city_frame(df)
+        if 'state' in df.columns:
+            typed['state'] = df['state'].fillna('').astype(str).to_numpy(dtype=object)
+        hashes = pd.util.hash_pandas_object(typed, index=False).to_numpy()
+        return [f'{value:016x}' for value in hashes.tolist()]
+    
+    def city_frame(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Typed copy with exactly the CityData columns, cast once per column.
+        
+        Numbers are coerced (bad or missing values become 0, ints truncate),
+        traffic_density defaults to 'Medium', and latitude/longitude stay NaN
+        when unknown. The result feeds CityAnalyzer.score_frame directly.
+        """
+        n = len(df)
+        typed = {}
+        for col in CITY_FIELDS:
+            values = df[col] if col in df.columns else None
+            if col == 'name':
+                typed[col] = values.astype(str).to_numpy(dtype=object) if values is not None else np.full(n, '', dtype=object)
+            elif col == 'traffic_density':
+                typed[col] = (values.fillna('Medium').astype(str).to_numpy(dtype=object) if values is not None
+                              else np.full(n, 'Medium', dtype=object))
+            elif col in ('latitude', 'longitude'):
+                typed[col] = (pd.to_numeric(values, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+                              if values is not None else np.full(n, np.nan))
+            else:
+                numbers = (pd.to_numeric(values, errors='coerce').to_numpy(dtype=np.float64, na_value=0.0)
+                           if values is not None else np.zeros(n))
+                numbers = np.nan_to_num(numbers, nan=0.0, posinf=0.0, neginf=0.0)
+                typed[col] = numbers.astype(np.int64) if col in INT_FIELDS else numbers
+        return pd.DataFrame(typed, index=df.index)
+    
+    def _column_lists(self, df: pd.DataFrame) -> List[list]:
+        """CityData columns as Python lists, unknown coordinates as None"""
+        typed = self.city_frame(df)
+        columns = []
+        for col in CITY_FIELDS:
+            if col in ('latitude', 'longitude'):
+                values = typed[col].to_numpy()
+                columns.append(np.where(np.isnan(values), None, values.astype(object)).tolist())
+            else:
+                columns.append(typed[col].tolist())
+        return columns
+    
+    def df_to_city_rows(self, df: pd.DataFrame) -> List[tuple]:
+        """Insert tuples in CityData field order (== CITY_COLUMNS), with no per-city objects"""
+        return list(zip(*self._column_lists(df)))
+    
+    def df_to_city_records(self, df: pd.DataFrame) -> List[Dict]:
+        """City dicts keyed by CityData field, built from column arrays"""
+        return [dict(zip(CITY_FIELDS, values)) for values in zip(*self._column_lists(df))]
+    
     def df_to_city_data(self, df: pd.DataFrame) -> List[CityData]:
         """Convert DataFrame to list of CityData objects"""
-        cities = []
-        
-        for _, row in df.iterrows():
-            city = CityData(
-                name=str(row.get('name', '')),
-                area=float(row.get('area', 0)),
-                population=int(row.get('population', 0)),
-                population_density=float(row.get('population_density', 0)),
-                built_up_percentage=float(row.get('built_up_percentage', 0)),
-                green_space_area=float(row.get('green_space_area', 0)),
-                open_land_area=float(row.get('open_land_area', 0)),
-                green_coverage_percentage=float(row.get('green_coverage_percentage', 0)),
-                existing_parks=int(row.get('existing_parks', 0)),
-                tree_coverage=float(row.get('tree_coverage', 0)),
-                aqi=float(row.get('aqi', 0)),
-                pm25=float(row.get('pm25', 0)),
-                pm10=float(row.get('pm10', 0)),
-                co2_estimation=float(row.get('co2_estimation', 0)),
-                traffic_density=str(row.get('traffic_density', 'Medium')),
-                vehicle_count=int(row.get('vehicle_count', 0)),
-                public_transport_usage=float(row.get('public_transport_usage', 0)),
-                latitude=row.get('latitude'),
-                longitude=row.get('longitude')
-            )
-            cities.append(city)
-        
-        return cities
+        return [CityData(*values) for values in zip(*self._column_lists(df))]
     
     def create_sample_data(self) -> pd.DataFrame:
         """Create sample data for demonstration"""
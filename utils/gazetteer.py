@@ -0,0 +1,162 @@
+import os
+import re
+import unicodedata
+import numpy as np
+import pandas as pd
+from typing import List, Optional, Tuple
+
+# Optional bundled gazetteer: name,state,lat,lon[,alt_names] (alt_names separated by '|')
+DEFAULT_GAZETTEER_PATH = os.getenv('GAZETTEER_PATH', 'data/gazetteer.csv')
+
+# Romanisation variants common in Indian place names, applied in order
+_PHONETIC_RULES = [
+    ('zh', 'l'), ('th', 't'), ('dh', 'd'), ('bh', 'b'), ('kh', 'k'), ('gh', 'g'),
+    ('ph', 'p'), ('ch', 'c'), ('sh', 's'), ('w', 'v'), ('ee', 'i'), ('oo', 'u'),
+    ('y', 'i'), ('k', 'c')
+]
+_NON_ALNUM = re.compile(r'[^a-z0-9 ]+')
+_REPEATS = re.compile(r'(.)\1+')
+
+def normalize_name(name) -> str:
+    """Lowercase, strip accents and punctuation, collapse whitespace"""
+    text = unicodedata.normalize('NFKD', str(name))
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    return ' '.join(_NON_ALNUM.sub(' ', text).split())
+
+def phonetic_key(name) -> str:
+    """Spelling-insensitive key: 'Thiruchirapalli' and 'Tiruchirappalli' map together"""
+    key = normalize_name(name).replace(' ', '')
+    for src, dst in _PHONETIC_RULES:
+        key = key.replace(src, dst)
+    return _REPEATS.sub(r'\1', key)
+
+def read_gazetteer(path: Optional[str] = None) -> pd.DataFrame:
+    """Load a gazetteer file; returns an empty frame when it does not exist"""
+    path = path or DEFAULT_GAZETTEER_PATH
+    columns = ['name', 'state', 'lat', 'lon', 'alt_names']
+    if not path or not os.path.exists(path):
+        return pd.DataFrame(columns=columns)
+
+    df = pd.read_csv(path, dtype={'name': str, 'state': str, 'alt_names': str})
+    df = df.rename(columns={'latitude': 'lat', 'longitude': 'lon'})
+    for col in columns:
+        if col not in df.columns:
+            df[col] = None
+    return df[columns].dropna(subset=['name'])
+
+class OfflineGeocoder:
+    """Network-free geocoder over a gazetteer.
+
+    Names (and alternate names) are normalized once into a hashed pd.Index
+    with parallel float32 coordinate arrays, so single lookups are a dict
+    probe and whole frames resolve with one get_indexer call.
+    """
+
+    def __init__(self, gazetteer: pd.DataFrame):
+        rows = gazetteer.dropna(subset=['lat', 'lon'])
+        names = rows['name'].astype(str).tolist()
+        states = rows['state'].fillna('').astype(str).tolist()
+        alt_names = rows['alt_names'].fillna('').astype(str).tolist() if 'alt_names' in rows else [''] * len(rows)
+        lats = rows['lat'].astype('float32').to_numpy()
+        lons = rows['lon'].astype('float32').to_numpy()
+
+        keys, phonetic, positions = [], [], []
+        for pos, (name, state, alts) in enumerate(zip(names, states, alt_names)):
+            for variant in [name, *[a for a in alts.split('|') if a]]:
+                key = normalize_name(variant)
+                keys.append(key)
+                phonetic.append(phonetic_key(variant))
+                positions.append(pos)
+                if state:
+                    keys.append(f"{key}|{normalize_name(state)}")
+                    phonetic.append(f"{phonetic_key(variant)}|{normalize_name(state)}")
+                    positions.append(pos)
+
+        positions = np.asarray(positions, dtype=np.int32)
+        # First occurrence wins for names shared by several places
+        self._index, self._positions = self._unique(keys, positions)
+        self._phonetic_index, self._phonetic_positions = self._unique(phonetic, positions)
+        self._lat = lats
+        self._lon = lons
+
+    @staticmethod
+    def _unique(keys: List[str], positions: np.ndarray):
+        index = pd.Index(keys)
+        keep = ~index.duplicated(keep='first')
+        return index[keep], positions[keep]
+
+    @classmethod
+    def load_default(cls, gazetteer_path: Optional[str] = None,
+                     csv_path: str = 'data/tamilnadu_cities.csv') -> 'OfflineGeocoder':
+        """Gazetteer file plus the bundled Tamil Nadu city list"""
+        frames = [read_gazetteer(gazetteer_path)]
+        try:
+            bundled = pd.read_csv(csv_path, usecols=['name', 'latitude', 'longitude'])
+            frames.append(bundled.rename(columns={'latitude': 'lat', 'longitude': 'lon'}).assign(state='Tamil Nadu'))
+        except Exception as e:
+            print(f"Could not load {csv_path}: {e}")
+        return cls(pd.concat(frames, ignore_index=True))
+
+    def __len__(self) -> int:
+        return len(self._lat)
+
+    def _lookup(self, keys: pd.Index, index: pd.Index, positions: np.ndarray) -> np.ndarray:
+        hit = index.get_indexer(keys)
+        # Indexing only the hits keeps an empty gazetteer (no positions at all) from raising
+        found = np.full(len(hit), -1, dtype=np.int64)
+        found[hit >= 0] = positions[hit[hit >= 0]]
+        return found
+
+    def geocode(self, city_name: str, state: Optional[str] = None) -> Optional[Tuple[float, float]]:
+        key, pkey = normalize_name(city_name), phonetic_key(city_name)
+        candidates = [(key, self._index, self._positions), (pkey, self._phonetic_index, self._phonetic_positions)]
+        if state:
+            suffix = f"|{normalize_name(state)}"
+            candidates = [(key + suffix, self._index, self._positions),
+                          (pkey + suffix, self._phonetic_index, self._phonetic_positions)] + candidates
+        for k, index, positions in candidates:
+            pos = self._lookup(pd.Index([k]), index, positions)[0]
+            if pos >= 0:
+                # float32 storage; 5 decimals (~1 m) is all it carries
+                return round(float(self._lat[pos]), 5), round(float(self._lon[pos]), 5)
+        return None
+
+    def resolve_frame(self, df: pd.DataFrame, name_col: str = 'name', state_col: Optional[str] = None) -> int:
+        """Fill missing latitude/longitude in place; returns the number of rows resolved"""
+        if df.empty or name_col not in df.columns:
+            return 0
+        for col in ('latitude', 'longitude'):
+            if col not in df.columns:
+                df[col] = np.nan
+
+        lat = pd.to_numeric(df['latitude'], errors='coerce')
+        lon = pd.to_numeric(df['longitude'], errors='coerce')
+        # clean_data fills numeric gaps with 0, so 0 counts as missing too
+        missing = (lat.isna() | lon.isna() | ((lat == 0) & (lon == 0))).to_numpy()
+        if not missing.any():
+            return 0
+
+        # Normalize each distinct name once, then join on the hashed index
+        names = df[name_col].astype(str)
+        uniq = names.unique()
+        norm = names.map(dict(zip(uniq, map(normalize_name, uniq))))
+        phon = names.map(dict(zip(uniq, map(phonetic_key, uniq))))
+
+        pos = np.full(len(df), -1, dtype=np.int64)
+        if state_col and state_col in df.columns:
+            states = df[state_col].fillna('').astype(str).map(normalize_name)
+            pos = self._lookup(pd.Index(norm + '|' + states), self._index, self._positions)
+            pos = np.where(pos >= 0, pos,
+                           self._lookup(pd.Index(phon + '|' + states), self._phonetic_index, self._phonetic_positions))
+        pos = np.where(pos >= 0, pos, self._lookup(pd.Index(norm), self._index, self._positions))
+        pos = np.where(pos >= 0, pos, self._lookup(pd.Index(phon), self._phonetic_index, self._phonetic_positions))
+
+        fill = missing & (pos >= 0)
+        if fill.any():
+            lat = lat.to_numpy(dtype='float64', copy=True)
+            lon = lon.to_numpy(dtype='float64', copy=True)
+            lat[fill] = np.round(self._lat[pos[fill]].astype('float64'), 5)
+            lon[fill] = np.round(self._lon[pos[fill]].astype('float64'), 5)
+            df['latitude'] = lat
+            df['longitude'] = lon
+        return int(fill.sum())
@@ -0,0 +1,198 @@
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+@dataclass(frozen=True)
+class FieldRule:
+    """Constraints on one CityData column.
+
+    kind is 'text', 'int', 'float' or 'category'. required columns must be
+    present in the file; nullable=False rejects empty cells (nullable cells
+    are later filled with defaults by clean_data).
+    """
+    name: str
+    kind: str = 'float'
+    required: bool = True
+    nullable: bool = True
+    min: Optional[float] = None
+    max: Optional[float] = None
+    min_exclusive: bool = False
+    categories: Tuple[str, ...] = ()
+    max_length: Optional[int] = None
+
+@dataclass(frozen=True)
+class CrossFieldRule:
+    """A rule over several columns; check(frame) returns a boolean Series of violating rows"""
+    name: str
+    fields: Tuple[str, ...]
+    message: str
+    check: Callable[[pd.DataFrame], pd.Series]
+
+def _density_mismatch(df: pd.DataFrame) -> pd.Series:
+    expected = df['population'] / df['area']
+    known = (df['area'] > 0) & (df['population'] > 0) & (df['population_density'] > 0)
+    return known & ((df['population_density'] - expected).abs() > 0.05 * expected)
+
+CITY_SCHEMA: List[FieldRule] = [
+    FieldRule('name', 'text', nullable=False, max_length=255),
+    FieldRule('area', min=0, min_exclusive=True, nullable=False),
+    FieldRule('population', 'int', min=0, nullable=False),
+    FieldRule('population_density', min=0),
+    FieldRule('built_up_percentage', min=0, max=100),
+    FieldRule('green_space_area', min=0),
+    FieldRule('open_land_area', min=0),
+    FieldRule('green_coverage_percentage', min=0, max=100),
+    FieldRule('existing_parks', 'int', min=0),
+    FieldRule('tree_coverage', min=0, max=100),
+    FieldRule('aqi', min=0, max=500),
+    FieldRule('pm25', min=0, max=1000),
+    FieldRule('pm10', min=0, max=2000),
+    FieldRule('co2_estimation', min=0),
+    FieldRule('traffic_density', 'category', categories=('Low', 'Medium', 'High')),
+    FieldRule('vehicle_count', 'int', min=0),
+    FieldRule('public_transport_usage', min=0, max=100),
+    FieldRule('latitude', required=False, min=-90, max=90),
+    FieldRule('longitude', required=False, min=-180, max=180),
+]
+
+CROSS_FIELD_RULES: List[CrossFieldRule] = [
+    CrossFieldRule('density', ('population_density', 'population', 'area'),
+                   'population_density differs from population / area by more than 5%', _density_mismatch),
+    CrossFieldRule('green_space_area', ('green_space_area', 'area'),
+                   'green_space_area exceeds area', lambda df: df['green_space_area'] > df['area']),
+    CrossFieldRule('open_land_area', ('open_land_area', 'area'),
+                   'open_land_area exceeds area', lambda df: df['open_land_area'] > df['area']),
+    CrossFieldRule('pm25', ('pm25', 'pm10'),
+                   'pm25 exceeds pm10 (PM2.5 is part of PM10)', lambda df: df['pm25'] > df['pm10']),
+]
+
+class ValidationReport:
+    """Outcome of validating a frame: one boolean column per failed check.
+
+    Row numbers are spreadsheet rows (first_row is the first data row).
+    """
+
+    # Example row numbers listed per failed check
+    SAMPLE_ROWS = 10
+
+    def __init__(self, n_rows: int, first_row: int = 2):
+        self.n_rows = n_rows
+        self.first_row = first_row
+        self.missing_columns: List[str] = []
+        self.checks: List[Tuple[str, str, np.ndarray]] = []
+
+    def add(self, field: str, message: str, failed):
+        failed = np.asarray(failed, dtype=bool)
+        if failed.any():
+            self.checks.append((field, message, failed))
+
+    @property
+    def invalid(self) -> np.ndarray:
+        """Rows failing at least one check"""
+        if self.missing_columns:
+            return np.ones(self.n_rows, dtype=bool)
+        mask = np.zeros(self.n_rows, dtype=bool)
+        for _, _, failed in self.checks:
+            mask |= failed
+        return mask
+
+    @property
+    def valid(self) -> np.ndarray:
+        return ~self.invalid
+
+    @property
+    def ok(self) -> bool:
+        return not self.missing_columns and not self.checks
+
+    def field_errors(self) -> List[Dict]:
+        """One entry per failed check: field, message, row count and example rows"""
+        return [{
+            'field': field,
+            'error': message,
+            'count': int(failed.sum()),
+            'rows': (np.flatnonzero(failed)[:self.SAMPLE_ROWS] + self.first_row).tolist()
+        } for field, message, failed in self.checks]
+
+    def row_errors(self, limit: int = 50) -> List[Dict]:
+        """First invalid rows with every field error on each"""
+        rows = np.flatnonzero(self.invalid)[:limit]
+        report = []
+        for pos in rows:
+            errors = {}
+            for field, message, failed in self.checks:
+                if failed[pos]:
+                    errors.setdefault(field, []).append(message)
+            report.append({'row': int(pos + self.first_row), 'errors': errors})
+        return report
+
+    def messages(self) -> List[str]:
+        """Human-readable summary, one line per failed check"""
+        lines = []
+        if self.missing_columns:
+            lines.append(f"Missing columns: {', '.join(self.missing_columns)}")
+        for entry in self.field_errors():
+            rows = ', '.join(map(str, entry['rows']))
+            more = ', ...' if entry['count'] > len(entry['rows']) else ''
+            lines.append(f"{entry['field']}: {entry['error']} ({entry['count']} rows: {rows}{more})")
+        return lines
+
+    def to_dict(self, row_limit: int = 50) -> Dict:
+        invalid = self.invalid
+        return {
+            'rows': self.n_rows,
+            'valid_rows': int(self.n_rows - invalid.sum()),
+            'invalid_rows': int(invalid.sum()),
+            'missing_columns': self.missing_columns,
+            'field_errors': self.field_errors(),
+            'row_errors': self.row_errors(row_limit)
+        }
+
+def _field_checks(rule: FieldRule, column: pd.Series, report: ValidationReport) -> Optional[pd.Series]:
+    """Add the checks for one column; returns it coerced to numbers (None for text)"""
+    present = column.notna()
+    if rule.kind == 'text' or rule.kind == 'category':
+        text = column.astype('string').str.strip()
+        present &= text.ne('').fillna(False)
+        if not rule.nullable:
+            report.add(rule.name, 'is required', ~present)
+        if rule.max_length:
+            report.add(rule.name, f'is longer than {rule.max_length} characters',
+                       present & (text.str.len() > rule.max_length).fillna(False))
+        if rule.categories:
+            allowed = pd.Index([c.lower() for c in rule.categories])
+            report.add(rule.name, f"must be one of {', '.join(rule.categories)}",
+                       present & ~text.str.lower().isin(allowed).fillna(False))
+        return None
+
+    values = pd.to_numeric(column, errors='coerce')
+    if not rule.nullable:
+        report.add(rule.name, 'is required', ~present)
+    report.add(rule.name, 'is not a number', present & values.isna())
+    if rule.kind == 'int':
+        report.add(rule.name, 'must be a whole number', values.notna() & (values % 1 != 0))
+    if rule.min is not None:
+        too_low = values <= rule.min if rule.min_exclusive else values < rule.min
+        report.add(rule.name, f"must be {'>' if rule.min_exclusive else '>='} {rule.min:g}", too_low)
+    if rule.max is not None:
+        report.add(rule.name, f'must be <= {rule.max:g}', values > rule.max)
+    return values
+
+def validate_frame(df: pd.DataFrame, schema: List[FieldRule] = CITY_SCHEMA,
+                   cross_rules: List[CrossFieldRule] = CROSS_FIELD_RULES, first_row: int = 2) -> ValidationReport:
+    """Evaluate every rule as a boolean mask over the whole frame"""
+    report = ValidationReport(len(df), first_row)
+    report.missing_columns = [rule.name for rule in schema if rule.required and rule.name not in df.columns]
+
+    numeric = {}
+    for rule in schema:
+        if rule.name in df.columns:
+            values = _field_checks(rule, df[rule.name], report)
+            if values is not None:
+                numeric[rule.name] = values
+
+    numbers = pd.DataFrame(numeric, index=df.index)
+    for rule in cross_rules:
+        if all(field in numbers.columns for field in rule.fields):
+            report.add(rule.name, rule.message, rule.check(numbers).fillna(False))
+    return report
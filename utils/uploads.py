@@ -0,0 +1,127 @@
+import os
+from typing import Callable, Dict, Optional, Tuple
+from backend.database import Database
+from backend.invalidation import create_bus
+from utils.api_integration import DataEnricher
+from utils.data_processor import CITY_FIELDS, DataProcessor
+
+# Only the CityData columns (plus state, for the gazetteer) are read from an uploaded file
+UPLOAD_COLUMNS = CITY_FIELDS + ['state']
+
+# Ingest report fields a background upload resumes from; the job record is
+# rewritten after every chunk, so names and error details stay out of it
+CHECKPOINT_FIELDS = ('chunks', 'rows', 'loaded', 'invalid_rows', 'error_chunks', 'unchanged_rows')
+
+def ingest_upload(db, processor: DataProcessor, enricher, filepath: str, filename: str, file_hash: str,
+                  enrich: bool = True, valid_only: bool = False, resume: Optional[Dict] = None,
+                  progress: Optional[Callable[[Dict], None]] = None,
+                  enqueue: Optional[Callable[[Dict], None]] = None) -> Tuple[Dict, int]:
+    """Validate, clean and upsert a saved upload chunk by chunk; returns (response body, status code).
+
+    resume and progress are as for DataProcessor.ingest_file; the reports
+    they carry also count unchanged_rows. enqueue(city), if given, is
+    called for every stored city that is to be enriched afterwards.
+    """
+    unchanged = {'rows': (resume or {}).get('unchanged_rows', 0)}
+
+    def save_chunk(df_clean):
+        # Only rows whose fingerprint differs from the stored one are upserted
+        hashes = processor.row_hashes(df_clean)
+        names = df_clean['name'].astype(str).tolist()
+        stored = db.get_row_hashes(names)
+        changed = [stored.get(name) != row_hash for name, row_hash in zip(names, hashes)]
+        unchanged['rows'] += changed.count(False)
+        stored_names = (store_rows(df_clean[changed].copy(), [h for h, keep in zip(hashes, changed) if keep])
+                        if any(changed) else [])
+        # The file's fingerprint holds while every one of its rows keeps this hash
+        recorded = db.save_upload_rows(file_hash, names, hashes)
+        if recorded < len(set(names)):
+            raise RuntimeError(f"Database recorded {recorded} of {len(set(names))} upload rows")
+        return stored_names
+
+    def store_rows(df_changed, hashes):
+        # Coordinates from the local gazetteer for the whole chunk in one join
+        enricher.resolve_coordinates(df_changed)
+        # Straight from typed columns to insert tuples, no per-city objects
+        rows = processor.df_to_city_rows(df_changed)
+        # add_city_rows reports a failed write as 0 rows; raising makes it this chunk's error
+        expected = len({row[0] for row in rows})
+        stored_rows = db.add_city_rows(rows, hashes)
+        if stored_rows < expected:
+            raise RuntimeError(f"Database stored {stored_rows} of {expected} cities")
+        if enrich and enqueue is not None:
+            # Missing coordinates/AQI are fetched after the insert, off the upload path (enrich=0 skips)
+            for row in rows:
+                enqueue(dict(zip(CITY_FIELDS, row)))
+        return [row[0] for row in rows]
+
+    try:
+        # Validate, clean and save chunk by chunk; memory stays bounded by the chunk size
+        report = processor.ingest_file(
+            filepath, save_chunk, valid_only=valid_only, columns=UPLOAD_COLUMNS, resume=resume,
+            progress=progress and (lambda state: progress(dict(state, unchanged_rows=unchanged['rows']))))
+    except Exception as e:
+        return {'error': str(e)}, 500
+
+    if report['rows'] and not report['error_chunks']:
+        # Every chunk was stored in full; the same bytes again can skip parsing entirely
+        db.save_upload_fingerprint(file_hash, filename, report['rows'])
+
+    chunk_errors = [f"Rows {err['rows']}: {'; '.join(err['errors'])}" for err in report['errors']]
+    row_errors = [row for err in report['errors'] for row in err.get('row_errors', [])][:50]
+    if report['loaded'] == 0 and report['error_chunks']:
+        return {'error': 'Data validation failed', 'details': chunk_errors, 'row_errors': row_errors}, 400
+
+    return {
+        'message': (f"File uploaded successfully. Added {report['loaded']} cities"
+                    + (f", skipped {unchanged['rows']} unchanged rows." if unchanged['rows'] else ".")),
+        'file_hash': file_hash,
+        'cities_count': report['loaded'],
+        'unchanged_rows': unchanged['rows'],
+        'rows': report['rows'],
+        'chunks': report['chunks'],
+        'chunk_errors': chunk_errors,
+        'error_chunks': report['error_chunks'],
+        'invalid_rows': report['invalid_rows'],
+        'row_errors': row_errors,
+        'total_cities': len(db.get_cities_frame(columns=['id'])),
+        'cities': report['names']
+    }, 200
+
+def run_upload_job(report, checkpoint, filepath, filename, file_hash, enrich, valid_only):
+    """Background ingestion in the job's own process, checkpointed after each chunk.
+
+    Runs in a fresh interpreter (see ProcessJobRunner), so it opens its own
+    database and enricher. Enrichment of the stored cities is left to the
+    web process, which sweeps for them when the job finishes. The saved
+    upload is deleted once the job ends; after a crash it stays for the
+    next attempt. Names and error details from chunks before a resume are
+    not repeated in the result, only counted.
+    """
+    db = Database()
+    # Publish-only: other workers' listeners pick up this job's changes
+    db.bus = create_bus(db.get_connection)
+
+    def progress(state):
+        report(state.get('progress') or 0.0,
+               f"{state['rows']:,} rows parsed, {state['loaded']:,} cities upserted",
+               rows_parsed=state['rows'], rows_upserted=state['loaded'],
+               unchanged_rows=state['unchanged_rows'], invalid_rows=state['invalid_rows'],
+               errors=state['error_chunks'], checkpoint={key: state[key] for key in CHECKPOINT_FIELDS})
+
+    try:
+        body, status = ingest_upload(db, DataProcessor(), DataEnricher(db=db), filepath, filename, file_hash,
+                                     enrich, valid_only, resume=checkpoint, progress=progress)
+    finally:
+        remove_upload(filepath)
+    if status != 200:
+        report(1.0, body['error'], details=body.get('details', []), row_errors=body.get('row_errors', []))
+        raise ValueError(body['error'])
+    return body
+
+def remove_upload(filepath: str):
+    """Delete a saved upload once it has been ingested (or abandoned)"""
+    try:
+        os.remove(filepath)
+    except FileNotFoundError:
+        pass